@@ -1,25 +1,125 @@
-"""Async SQLAlchemy engine and session factory."""
+"""Async SQLAlchemy engines and session factories.
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+``engine`` / ``async_session`` talk to the primary. ``read_session`` (and
+the ``get_read_db`` dependency) go to ``database_read_url`` when a read
+replica is configured and fall back to the primary otherwise; use them
+only for reads that tolerate replication lag.
+
+The schema is managed by Alembic (``alembic upgrade head`` from backend/,
+run once per deploy before the app starts). SQLite dev databases, or any
+database with ``db_create_all`` set, get ``create_all`` at startup instead.
+"""
+
+import logging
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 
 from app.config import settings
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+
+
+def _engine_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        return {}
+    options = {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    if "+asyncpg" in url:
+        options["connect_args"] = {
+            # asyncpg's own LRU of server-side prepared statements...
+            "statement_cache_size": settings.db_statement_cache_size,
+            # ...and SQLAlchemy's cache of prepared statement handles on top of it
+            "prepared_statement_cache_size": settings.db_statement_cache_size,
+        }
+    return options
+
+
+def _create_engine(url: str) -> AsyncEngine:
+    created = create_async_engine(url, echo=False, **_engine_options(url))
+
+    # The start time lives on the statement's execution context, so a failed statement leaves nothing behind
+    @event.listens_for(created.sync_engine, "before_cursor_execute")
+    def _query_started(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.query_started = time.perf_counter()
+
+    @event.listens_for(created.sync_engine, "after_cursor_execute")
+    def _query_finished(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "query_started", None)
+        if started is not None:
+            metrics.db_query_duration.observe(time.perf_counter() - started)
 
-engine = create_async_engine(settings.database_url, echo=False)
+    return created
+
+
+engine = _create_engine(settings.database_url)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+if settings.database_read_url:
+    read_engine = _create_engine(settings.database_read_url)
+    read_session = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+else:
+    read_engine, read_session = engine, async_session
+
 
 class Base(DeclarativeBase):
     pass
 
 
+def _schema_revisions(sync_conn) -> tuple[str | None, str | None]:
+    """(revision the database is at, latest migration revision)."""
+    from alembic.config import Config
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    head = ScriptDirectory.from_config(Config(str(ALEMBIC_INI))).get_current_head()
+    return MigrationContext.configure(sync_conn).get_current_revision(), head
+
+
 async def init_db():
-    """Create all tables on startup."""
+    """Create tables for SQLite / ``db_create_all``; otherwise check migrations have been run."""
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        if conn.dialect.name == "sqlite" or settings.db_create_all:
+            await conn.run_sync(Base.metadata.create_all)
+            return
+        current, head = await conn.run_sync(_schema_revisions)
+    if current != head:
+        logger.warning(
+            "Database schema is at revision %s, the code expects %s; run `alembic upgrade head`",
+            current, head,
+        )
+
+
+@asynccontextmanager
+async def _timed_session(factory: async_sessionmaker):
+    started = time.perf_counter()
+    try:
+        async with factory() as session:
+            yield session
+    finally:
+        metrics.db_session_duration.observe(time.perf_counter() - started)
 
 
 async def get_db():
-    """FastAPI dependency that yields an async DB session."""
-    async with async_session() as session:
+    """FastAPI dependency that yields an async DB session on the primary."""
+    async with _timed_session(async_session) as session:
+        yield session
+
+
+async def get_read_db():
+    """FastAPI dependency that yields a read-only session (replica if configured)."""
+    async with _timed_session(read_session) as session:
         yield session
@@ -1,26 +1,71 @@
 """FastAPI application entry point."""
 
 import asyncio
+import json
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
-from app.database import init_db
+from app.config import settings
+from app.database import engine, init_db
 from app.routers import music, lyrics, history
-from app.services import acestep_client, ollama_client
+from app.services import (
+    acestep_nodes, ollama_client, ollama_nodes, audio_analysis, audio_ingest, audio_store, audio_transcode,
+    coordination, health, history_search, http_pool, lyrics_cache, metrics, resilience, retention, scheduler,
+    status_poller, status_writer,
+)
+
+# Seconds between SSE keep-alive comments on the readiness stream
+HEALTH_SSE_KEEPALIVE = 15.0
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Startup: create DB tables. Pull Ollama model in background (non-blocking)."""
+    """Startup: create DB tables, index the local audio store, open upstream
+    connection pools, start the status write-behind buffer, health probes,
+    audio analysis, transcoding and ingestion, the task status poller, the
+    generation queue dispatcher, lyrics cache prefetching and garbage
+    collection. The probes pull and warm the lyrics model on Ollama replicas
+    in the background (non-blocking). The poller, dispatcher, backfills,
+    prefetching, garbage collection and model pulls run on the leader worker
+    only; ``coordination.start`` elects it.
+    Shutdown: step down as leader, stop garbage collection, prefetching, the
+    dispatcher, poller, ingestion, analysis and transcoding, flush buffered
+    status writes, stop probes and model pulls, close the pools.
+    """
     await init_db()
-
-    # Pull the lyrics model in the background — don't block startup
-    asyncio.create_task(ollama_client.ensure_model_pulled())
+    async with engine.begin() as conn:
+        await history_search.setup(conn)
+    await audio_store.init()
+    http_pool.startup()
+    status_writer.start()
+    health.start()
+    await audio_analysis.start()
+    await audio_transcode.start()
+    await audio_ingest.start()
+    await status_poller.start()
+    await scheduler.start()
+    await lyrics_cache.start()
+    await retention.start()
+    await coordination.start()
 
     yield
 
+    await coordination.stop()
+    await retention.stop()
+    await lyrics_cache.stop()
+    await scheduler.stop()
+    await status_poller.stop()
+    await audio_ingest.stop()
+    await audio_analysis.stop()
+    await audio_transcode.stop()
+    await status_writer.stop()
+    await health.stop()
+    await ollama_client.stop()
+    await http_pool.shutdown()
+
 
 app = FastAPI(
     title="ACE-Step Music Generator",
@@ -37,6 +82,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Register route groups
 app.include_router(music.router)
 app.include_router(lyrics.router)
@@ -44,12 +91,137 @@ app.include_router(history.router)
 
 
 @app.get("/api/health")
-async def health():
-    """Overall health check — pings both downstream services."""
-    ace_ok = await acestep_client.health_check()
-    ollama_ok = await ollama_client.health_check()
+async def health_check():
+    """Overall health from the background probes, with per-upstream latency
+    history and the circuit breaker state of every upstream endpoint."""
+    upstreams = await health.snapshot()
+    ready = health.readiness()
+    return {
+        "status": "ok" if (ready["acestep"] and ready["ollama"]) else "degraded",
+        **ready,
+        "upstreams": upstreams,
+        "acestep_nodes": acestep_nodes.snapshot(),
+        "ollama_replicas": ollama_nodes.snapshot(),
+        "breakers": resilience.breakers_snapshot(),
+        "resilience": resilience.stats,
+    }
+
+
+@app.get("/api/health/events")
+async def health_events(request: Request):
+    """Server-Sent Events stream of readiness flags: current state first, then every change."""
+    queue = health.subscribe()
+
+    async def stream():
+        try:
+            yield f"event: readiness\ndata: {json.dumps(health.readiness())}\n\n"
+            while True:
+                try:
+                    ready = await asyncio.wait_for(queue.get(), timeout=HEALTH_SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: readiness\ndata: {json.dumps(ready)}\n\n"
+        finally:
+            health.unsubscribe(queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/health/pools")
+async def pool_stats():
+    """Upstream connection pool occupancy and wait times, for pool sizing."""
+    return http_pool.stats()
+
+
+@app.get("/api/health/ingest")
+async def ingest_stats():
+    """Audio ingestion throughput/latency, analysis and transcoding progress, local store occupancy."""
     return {
-        "status": "ok" if (ace_ok and ollama_ok) else "degraded",
-        "acestep": ace_ok,
-        "ollama": ollama_ok,
+        "ingest": audio_ingest.stats.snapshot(),
+        "analysis": audio_analysis.stats.snapshot(),
+        "transcode": audio_transcode.stats.snapshot(),
+        "store": audio_store.stats(),
     }
+
+
+@app.get("/api/health/queue")
+async def queue_stats():
+    """Backend generation queue depth, in-flight work and learned throughput."""
+    return scheduler.stats()
+
+
+@app.get("/api/health/cluster")
+async def cluster_stats():
+    """This worker's node id, whether it is the leader, and event traffic."""
+    return coordination.stats.snapshot()
+
+
+@app.get("/api/health/retention")
+async def retention_stats():
+    """Garbage collection runs, reaped tasks, deleted generations and reclaimed space."""
+    return retention.stats.snapshot()
+
+
+@app.get("/api/health/lyrics-cache")
+async def lyrics_cache_stats():
+    """Lyrics cache size, hit ratio, evictions and idle-time prefetches."""
+    return lyrics_cache.stats.snapshot()
+
+
+# Gauges over state the services already keep, read at scrape time
+metrics.Gauge(
+    "generation_tasks", "Generation tasks not yet finished, by status", ("status",),
+    lambda: {(status,): n for status, n in status_poller.status_counts().items()},
+)
+metrics.Gauge(
+    "scheduler_cost_units", "Backend queue work in cost units", ("state",),
+    lambda: {("pending",): scheduler.stats()["pending_cost"], ("inflight",): scheduler.stats()["inflight_cost"]},
+)
+metrics.Gauge(
+    "acestep_node_load", "Estimated tasks on each ACE-Step node", ("node",),
+    lambda: {(name,): n["load"] for name, n in acestep_nodes.snapshot().items()},
+)
+metrics.Gauge(
+    "ollama_replica_outstanding", "Lyrics requests in progress on each Ollama replica", ("replica",),
+    lambda: {(name,): r["outstanding"] for name, r in ollama_nodes.snapshot().items()},
+)
+metrics.Gauge(
+    "upstream_circuit_open", "1 while an upstream endpoint's circuit breaker is not closed", ("breaker",),
+    lambda: {(name,): int(b["state"] != "closed") for name, b in resilience.breakers_snapshot().items()},
+)
+metrics.Gauge(
+    "http_pool_connections", "Upstream requests holding (active) or waiting for (queued) a pooled connection",
+    ("pool", "state"),
+    lambda: {
+        (name, state): pool[state]
+        for name, pool in http_pool.stats().items()
+        for state in ("active", "queued")
+    },
+)
+metrics.Gauge(
+    "status_write_buffer_rows", "Generations with status changes not yet written to the table", (),
+    lambda: {(): status_writer.stats()["buffered"]},
+)
+metrics.Gauge(
+    "audio_store_bytes", "Bytes in the evictable local audio cache", (),
+    lambda: {(): audio_store.stats()["bytes"]},
+)
+metrics.Gauge(
+    "coordination_leader", "1 on the worker running the singleton background jobs", (),
+    lambda: {(): int(coordination.is_leader())},
+)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint."""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
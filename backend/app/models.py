@@ -2,7 +2,7 @@
 
 from datetime import datetime, timezone
 
-from sqlalchemy import String, Float, Integer, DateTime, JSON, Text
+from sqlalchemy import String, Float, Integer, DateTime, JSON, Text, Index, func, literal_column, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.database import Base
@@ -12,13 +12,33 @@ class Generation(Base):
     """Stores each music generation request and its result."""
 
     __tablename__ = "generations"
+    __table_args__ = (
+        # Supports keyset pagination of history, newest first
+        Index("ix_generations_created_at_id", "created_at", "id"),
+        # Full-text search over prompt + lyrics (Postgres only; SQLite uses FTS5,
+        # see services/history_search). 'simple' config because lyrics are
+        # multilingual (en/ru/by/...).
+        Index(
+            "ix_generations_search",
+            text("to_tsvector('simple'::regconfig, coalesce(prompt, '') || ' ' || coalesce(lyrics, ''))"),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
 
-    # ACE-Step task id (UUID string)
+    # Public task id (UUID string). For rows created before the backend queue
+    # this is also ACE-Step's task id.
     task_id: Mapped[str] = mapped_column(String(64), unique=True, index=True)
 
-    # Status: queued, running, succeeded, failed
+    # ACE-Step's task id, set once the backend queue dispatches the job
+    upstream_task_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+
+    # ACE-Step node ("host:port") that owns the task; "" = the first configured node
+    node: Mapped[str] = mapped_column(String(255), default="")
+
+    # Status: pending (backend queue), dispatching (being handed to ACE-Step), queued, running,
+    # succeeded, failed
     status: Mapped[str] = mapped_column(String(20), default="queued")
 
     # Generation inputs
@@ -30,9 +50,25 @@ class Generation(Base):
     vocal_language: Mapped[str] = mapped_column(String(10), default="en")
     batch_size: Mapped[int] = mapped_column(Integer, default=2)
 
+    # Canonical hash of the ACE-Step payload, for deduplicating identical requests
+    params_hash: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
+
+    # Backend job queue: exact ACE-Step payload, who asked, and estimated GPU cost
+    request_params: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    client_id: Mapped[str] = mapped_column(String(64), default="")
+    cost: Mapped[float | None] = mapped_column(Float, nullable=True)
+    dispatched_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    # Batch API: generations submitted together share a batch id
+    batch_id: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
+
     # Results — list of audio file paths (JSON array)
     audio_paths: Mapped[dict | None] = mapped_column(JSON, nullable=True)
 
+    # Per output: exact duration, loudness and peaks URL (services/audio_analysis);
+    # null until analyzed
+    audio_analysis: Mapped[list | None] = mapped_column(JSON, nullable=True)
+
     # Metadata returned by ACE-Step
     generation_meta: Mapped[dict | None] = mapped_column(JSON, nullable=True)
 
@@ -42,3 +78,34 @@ class Generation(Base):
     completed_at: Mapped[datetime | None] = mapped_column(
         DateTime(timezone=True), nullable=True
     )
+
+
+class LyricsCacheEntry(Base):
+    """One cached lyrics variant (services/lyrics_cache, when persistence is on)."""
+
+    __tablename__ = "lyrics_cache"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    # Normalized request key, see lyrics_cache.cache_key
+    key: Mapped[str] = mapped_column(String(64), index=True)
+    theme: Mapped[str] = mapped_column(Text, default="")
+    language: Mapped[str] = mapped_column(String(10), default="en")
+    genre: Mapped[str] = mapped_column(Text, default="")
+    mood: Mapped[str] = mapped_column(Text, default="")
+    model: Mapped[str] = mapped_column(String(128), default="")
+    lyrics: Mapped[str] = mapped_column(Text, default="")
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), index=True
+    )
+
+
+# Query-side twin of the ix_generations_search expression. Literals are
+# inlined (not bound) so Postgres matches the expression index.
+_columns = Generation.__table__.c
+SEARCH_CONFIG = text("'simple'::regconfig")
+SEARCH_DOCUMENT = func.to_tsvector(
+    SEARCH_CONFIG,
+    func.coalesce(_columns.prompt, literal_column("''"))
+    .op("||")(literal_column("' '"))
+    .op("||")(func.coalesce(_columns.lyrics, literal_column("''"))),
+)
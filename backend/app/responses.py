@@ -0,0 +1,46 @@
+"""Fast JSON responses for the hot read endpoints.
+
+Returning a pydantic model with ``response_model`` validates the payload
+twice (once when the endpoint builds the model, again against the response
+model) before it is serialized. History pages, search results and
+status polls instead build plain dicts straight from row projections and
+in-memory state, and return a ``RawJSONResponse``: one encode, with orjson
+when installed (the stdlib encoder otherwise), into a body whose length is
+known up front. ``response_model`` stays on the routes for the OpenAPI
+schema; FastAPI doesn't re-check a ``Response``, so the dicts must match it.
+"""
+
+import json
+from datetime import datetime
+from typing import Any
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # in requirements.txt; the stdlib encoder is the fallback
+    orjson = None
+
+
+def _default(value: Any):
+    if isinstance(value, datetime):
+        # Same form as pydantic: UTC as "Z"
+        text = value.isoformat()
+        return text[:-6] + "Z" if text.endswith("+00:00") else text
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Compact JSON, datetimes as ISO 8601 (UTC as "Z")."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
+
+
+class RawJSONResponse(Response):
+    """JSON response for content that is already plain dicts/lists (no validation, no jsonable_encoder)."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
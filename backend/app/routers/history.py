@@ -1,86 +1,281 @@
-"""History endpoints — CRUD for past generations."""
+"""History endpoints — CRUD for past generations.
+
+Reads go to the read replica when one is configured (``get_read_db``), so
+a generation created a moment ago may show up after replication catches
+up; status changes are overlaid from memory either way. Deletes use the
+primary and go through services/retention, which also removes audio
+files no other generation uses.
+
+The list and search endpoints return ``RawJSONResponse`` bodies built
+from row projections (see app/responses); the schemas in
+``response_model`` document their shape.
+"""
+
+import base64
+import time
+from datetime import datetime
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select, func, desc
+from sqlalchemy import select, func, desc, text, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.config import settings
+from app.database import get_db, get_read_db
 from app.models import Generation
-from app.schemas import GenerationItem, HistoryResponse
+from app.responses import RawJSONResponse
+from app.schemas import (
+    BulkDeleteRequest, BulkDeleteResponse, GenerationItem, HistoryResponse, HistorySearchResponse,
+)
+from app.services import coordination, history_search, retention, status_poller, status_writer
 
 router = APIRouter(prefix="/api/history", tags=["history"])
 
+# List views only need enough of the prompt for a one-line title
+LIST_PROMPT_CHARS = 200
+
+# (total, monotonic expiry) for _total_count
+_count_cache: tuple[int, float] = (0, 0.0)
+
+
+def _encode_cursor(created_at: datetime, gen_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{gen_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, gen_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(gen_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def _total_count(db: AsyncSession) -> int:
+    """Row count, cached for a few seconds.
+
+    On Postgres, large tables use the planner's estimate (pg_class.reltuples)
+    instead of a full COUNT(*) scan.
+    """
+    global _count_cache
+    value, expires = _count_cache
+    if time.monotonic() < expires:
+        return value
+
+    value = None
+    if db.bind.dialect.name == "postgresql":
+        estimate = (await db.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE relname = 'generations'")
+        )).scalar()
+        if estimate is not None and estimate >= settings.history_count_estimate_threshold:
+            value = estimate
+    if value is None:
+        value = (await db.execute(select(func.count(Generation.id)))).scalar() or 0
+
+    _count_cache = (value, time.monotonic() + settings.history_count_ttl)
+    return value
+
+
+def _invalidate_count(message: dict | None = None):
+    global _count_cache
+    _count_cache = (0, 0.0)
+
+
+# Deletes on other workers
+coordination.subscribe("history_changed", _invalidate_count)
+
+
+# Columns for list views (see GenerationListItem)
+_LIST_COLUMNS = (
+    Generation.id,
+    Generation.task_id,
+    Generation.status,
+    func.substr(Generation.prompt, 1, LIST_PROMPT_CHARS).label("prompt"),
+    Generation.duration,
+    Generation.bpm,
+    Generation.key_scale,
+    Generation.vocal_language,
+    Generation.audio_paths,
+    Generation.audio_analysis,
+    Generation.created_at,
+    Generation.completed_at,
+)
+
+
+def _overlay(item: dict) -> dict:
+    """Apply status changes still in the write-behind buffer to a list item."""
+    pending = status_writer.overlay(item["task_id"])
+    if pending:
+        item["status"] = pending.get("status", item["status"])
+        item["audio_urls"] = pending.get("audio_paths", item["audio_urls"]) or []
+        item["audio_analysis"] = pending.get("audio_analysis", item["audio_analysis"])
+        item["completed_at"] = pending.get("completed_at", item["completed_at"])
+    return item
+
+
+def _list_item(r) -> dict:
+    """GenerationListItem as a plain dict, from a ``_LIST_COLUMNS`` row."""
+    # Unpacking the row is much cheaper than a dozen attribute lookups
+    gen_id, task_id, status, prompt, duration, bpm, key_scale, language, audio_paths, analysis, created, completed = r
+    return _overlay({
+        "id": gen_id,
+        "task_id": task_id,
+        "status": status,
+        "prompt": prompt or "",
+        "duration": duration,
+        "bpm": bpm,
+        "key_scale": key_scale,
+        "vocal_language": language,
+        "audio_urls": audio_paths or [],
+        "audio_analysis": analysis,
+        "created_at": created,
+        "completed_at": completed,
+    })
+
 
 @router.get("", response_model=HistoryResponse)
 async def list_history(
-    page: int = Query(1, ge=1),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
     page_size: int = Query(20, ge=1, le=100),
-    db: AsyncSession = Depends(get_db),
+    include_total: bool = Query(False, description="Also return the (cached/estimated) total"),
+    db: AsyncSession = Depends(get_read_db),
 ):
-    """Return paginated list of past generations, newest first."""
-    offset = (page - 1) * page_size
+    """Return a page of past generations, newest first.
+
+    Keyset-paginated on (created_at, id) so deep pages cost the same as the
+    first one. Rows are a projection without lyrics/metadata — use
+    GET /api/history/{id} for the full record.
+    """
+    stmt = (
+        select(*_LIST_COLUMNS)
+        .order_by(desc(Generation.created_at), desc(Generation.id))
+        .limit(page_size + 1)
+    )
+    if cursor:
+        created_at, gen_id = _decode_cursor(cursor)
+        stmt = stmt.where(tuple_(Generation.created_at, Generation.id) < tuple_(created_at, gen_id))
+
+    rows = (await db.execute(stmt)).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    items = [_list_item(r) for r in rows]
 
-    total_q = await db.execute(select(func.count(Generation.id)))
-    total = total_q.scalar() or 0
+    next_cursor = _encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+    total = await _total_count(db) if include_total else None
+
+    return RawJSONResponse({"items": items, "next_cursor": next_cursor, "total": total})
+
+
+@router.get("/search", response_model=HistorySearchResponse)
+async def search_history(
+    q: str = Query("", description="Full-text query over prompt and lyrics"),
+    vocal_language: str | None = None,
+    key_scale: str | None = None,
+    status: str | None = None,
+    bpm_min: int | None = Query(None, ge=0),
+    bpm_max: int | None = Query(None, ge=0),
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    page_size: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Search past generations by text with facet filters.
 
-    rows_q = await db.execute(
-        select(Generation).order_by(desc(Generation.created_at)).offset(offset).limit(page_size)
+    Results are ranked by relevance when ``q`` is given, newest first
+    otherwise. Facet counts (language, key, status, BPM bucket) come from
+    a single query; each facet ignores its own filter, so the values it
+    lists are the alternatives to the current selection.
+    """
+    filters = history_search.SearchFilters(
+        q=q,
+        vocal_language=vocal_language,
+        key_scale=key_scale,
+        status=status,
+        bpm_min=bpm_min,
+        bpm_max=bpm_max,
+        created_from=created_from,
+        created_to=created_to,
     )
-    rows = rows_q.scalars().all()
-
-    items = [
-        GenerationItem(
-            id=g.id,
-            task_id=g.task_id,
-            status=g.status,
-            prompt=g.prompt,
-            lyrics=g.lyrics,
-            duration=g.duration,
-            bpm=g.bpm,
-            key_scale=g.key_scale,
-            vocal_language=g.vocal_language,
-            audio_urls=g.audio_paths or [],
-            created_at=g.created_at,
-            completed_at=g.completed_at,
-        )
-        for g in rows
-    ]
-
-    return HistoryResponse(items=items, total=total)
+    clauses, rank = history_search.where_clauses(db.bind.dialect.name, filters)
+
+    order = [desc(Generation.created_at), desc(Generation.id)]
+    if rank is not None:
+        order.insert(0, desc(rank))
+    rows = (await db.execute(
+        select(*_LIST_COLUMNS).where(*clauses).order_by(*order).offset(offset).limit(page_size)
+    )).all()
+
+    facets, total = await history_search.facet_counts(db, filters)
+
+    return RawJSONResponse({"items": [_list_item(r) for r in rows], "total": total, "facets": facets})
 
 
 @router.get("/{gen_id}", response_model=GenerationItem)
-async def get_generation(gen_id: int, db: AsyncSession = Depends(get_db)):
+async def get_generation(gen_id: int, db: AsyncSession = Depends(get_read_db)):
     """Get details of a single generation."""
     result = await db.execute(select(Generation).where(Generation.id == gen_id))
     gen = result.scalar_one_or_none()
     if not gen:
         raise HTTPException(status_code=404, detail="Generation not found")
 
+    pending = status_writer.overlay(gen.task_id)
     return GenerationItem(
         id=gen.id,
         task_id=gen.task_id,
-        status=gen.status,
+        status=pending.get("status", gen.status),
         prompt=gen.prompt,
         lyrics=gen.lyrics,
         duration=gen.duration,
         bpm=gen.bpm,
         key_scale=gen.key_scale,
         vocal_language=gen.vocal_language,
-        audio_urls=gen.audio_paths or [],
+        audio_urls=pending.get("audio_paths", gen.audio_paths) or [],
+        audio_analysis=pending.get("audio_analysis", gen.audio_analysis),
         created_at=gen.created_at,
-        completed_at=gen.completed_at,
+        completed_at=pending.get("completed_at", gen.completed_at),
     )
 
 
 @router.delete("/{gen_id}")
 async def delete_generation(gen_id: int, db: AsyncSession = Depends(get_db)):
-    """Delete a generation record."""
-    result = await db.execute(select(Generation).where(Generation.id == gen_id))
-    gen = result.scalar_one_or_none()
-    if not gen:
-        raise HTTPException(status_code=404, detail="Generation not found")
+    """Delete a finished generation record and its audio files (unless another generation shares them).
 
-    await db.delete(gen)
-    await db.commit()
+    A generation that is still pending, queued or running can't be deleted
+    (409): its job is in the scheduler queue or on the GPU.
+    """
+    # Statuses still in the write-behind buffer count: the list already shows them
+    await status_writer.flush()
+    deleted, _ = await retention.delete_generations(
+        Generation.id == gen_id, Generation.status.in_(status_poller.TERMINAL), reason="api"
+    )
+    if not deleted:
+        if (await db.execute(select(Generation.id).where(Generation.id == gen_id))).first() is None:
+            raise HTTPException(status_code=404, detail="Generation not found")
+        raise HTTPException(status_code=409, detail="Generation hasn't finished yet")
+    _invalidate_count()
     return {"ok": True}
+
+
+@router.post("/bulk-delete", response_model=BulkDeleteResponse)
+async def bulk_delete(req: BulkDeleteRequest):
+    """Delete finished generations by id, status and/or age, with their audio files.
+
+    Queued and running generations are never matched. Deletes run in small
+    batches, so a large purge doesn't lock the table.
+    """
+    if req.ids is None and req.status is None and req.created_before is None:
+        raise HTTPException(status_code=400, detail="Give ids, status or created_before")
+    await status_writer.flush()  # match on statuses as the list shows them
+    criteria = [Generation.status.in_(status_poller.TERMINAL)]
+    if req.ids is not None:
+        criteria.append(Generation.id.in_(req.ids))
+    if req.status is not None:
+        criteria.append(Generation.status == req.status)
+    if req.created_before is not None:
+        criteria.append(Generation.created_at < req.created_before)
+    deleted, freed = await retention.delete_generations(*criteria, reason="api")
+    if deleted:
+        _invalidate_count()
+    return BulkDeleteResponse(deleted=deleted, bytes_reclaimed=sum(freed.values()))
@@ -1,23 +1,45 @@
 """Lyrics generation endpoints — proxy to Ollama."""
 
+import asyncio
+import json
+import logging
+import math
+import time
+
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.schemas import LyricsRequest, LyricsResponse, LyricsStreamSummary
+from app.config import settings
+from app.services import health, lyrics_cache, ollama_client, resilience
 
-from app.schemas import LyricsRequest, LyricsResponse
-from app.services import ollama_client
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/lyrics", tags=["lyrics"])
 
 
-@router.post("/generate", response_model=LyricsResponse)
-async def generate_lyrics(req: LyricsRequest):
-    """Generate song lyrics using Ollama + Qwen2.5."""
+async def _require_model():
     # Quick guard: tell the user if the model hasn't finished downloading yet
-    if not await ollama_client.is_model_ready():
+    if not await health.lyrics_model_ready():
         raise HTTPException(
             status_code=503,
             detail="Lyrics model is still loading. Please wait a minute and try again.",
         )
 
+
+def _params(req: LyricsRequest) -> lyrics_cache.LyricsParams:
+    return lyrics_cache.LyricsParams(req.theme, req.language, req.genre, req.mood)
+
+
+@router.post("/generate", response_model=LyricsResponse)
+async def generate_lyrics(req: LyricsRequest):
+    """Generate song lyrics using Ollama + Qwen2.5 (or the lyrics cache, when enabled)."""
+    params = _params(req)
+    cached = lyrics_cache.get(params, req.fresh)
+    if cached is not None:
+        return LyricsResponse(lyrics=cached, language=req.language, cached=True)
+
+    await _require_model()
     try:
         text = await ollama_client.generate_lyrics(
             theme=req.theme,
@@ -25,10 +47,105 @@ async def generate_lyrics(req: LyricsRequest):
             genre=req.genre,
             mood=req.mood,
         )
+    except resilience.CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Ollama unavailable: {e}")
 
     if not text:
         raise HTTPException(status_code=500, detail="Empty response from Ollama")
 
+    lyrics_cache.store(params, text)
     return LyricsResponse(lyrics=text.strip(), language=req.language)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/generate/stream")
+async def generate_lyrics_stream(req: LyricsRequest):
+    """Generate lyrics, streaming tokens as Server-Sent Events.
+
+    Emits ``token`` events (``{"text": ...}``) as Ollama produces them, then
+    one ``done`` event (LyricsStreamSummary) or an ``error`` event. If the
+    client disconnects, the upstream request is closed so Ollama stops
+    generating. A lyrics cache hit is sent as a single ``token`` event.
+    """
+    started = time.perf_counter()
+    params = _params(req)
+    cached = lyrics_cache.get(params, req.fresh)
+    if cached is not None:
+        async def replay():
+            yield _sse("token", {"text": cached})
+            ttft = round((time.perf_counter() - started) * 1000, 1)
+            summary = LyricsStreamSummary(lyrics=cached, language=req.language, cached=True, ttft_ms=ttft)
+            yield _sse("done", summary.model_dump())
+
+        return StreamingResponse(
+            replay(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    await _require_model()
+    try:
+        # Ollama answers once the first token is ready, so this wait includes loading a cold model
+        with resilience.deadline(settings.ollama_first_token_deadline):
+            chat = await ollama_client.open_lyrics_stream(req.theme, req.language, req.genre, req.mood)
+    except resilience.CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Ollama unavailable: {e}")
+
+    async def stream():
+        parts: list[str] = []
+        ttft = None
+        first_token_at = None
+        try:
+            async for chunk in ollama_client.iter_chat_chunks(chat):
+                text = chunk.get("message", {}).get("content", "")
+                if text:
+                    if ttft is None:
+                        first_token_at = time.perf_counter()
+                        ttft = first_token_at - started
+                    parts.append(text)
+                    yield _sse("token", {"text": text})
+                if chunk.get("done"):
+                    # Prefer Ollama's own decode stats; fall back to wall clock over streamed chunks
+                    tokens = chunk.get("eval_count") or len(parts)
+                    if chunk.get("eval_duration"):
+                        rate = tokens / (chunk["eval_duration"] / 1e9)
+                    elif first_token_at is not None and len(parts) > 1:
+                        rate = (len(parts) - 1) / (time.perf_counter() - first_token_at)
+                    else:
+                        rate = None
+                    summary = LyricsStreamSummary(
+                        lyrics="".join(parts).strip(),
+                        language=req.language,
+                        ttft_ms=round(ttft * 1000, 1) if ttft is not None else None,
+                        tokens=tokens,
+                        tokens_per_s=round(rate, 2) if rate is not None else None,
+                    )
+                    logger.info(
+                        "Lyrics stream: ttft=%sms tokens=%d rate=%s tok/s",
+                        summary.ttft_ms, summary.tokens, summary.tokens_per_s,
+                    )
+                    lyrics_cache.store(params, summary.lyrics)
+                    yield _sse("done", summary.model_dump())
+                    return
+            yield _sse("error", {"detail": "Ollama stream ended early"})
+        except asyncio.CancelledError:
+            logger.info("Lyrics stream cancelled by client after %d tokens", len(parts))
+            raise
+        except Exception as e:
+            yield _sse("error", {"detail": f"Ollama error: {e}"})
+        finally:
+            # Dropping the connection mid-stream is what tells Ollama to stop
+            await chat.aclose()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
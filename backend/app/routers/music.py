@@ -1,25 +1,55 @@
 """Music generation endpoints — proxy to ACE-Step API."""
 
+import asyncio
 import json
-from datetime import datetime, timezone
-from urllib.parse import urlparse, parse_qs
+import math
+import uuid
+from typing import Literal
 
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config import settings
 from app.database import get_db
 from app.models import Generation
-from app.schemas import MusicGenerateRequest, MusicGenerateResponse, TaskStatusResponse
-from app.services import acestep_client
+from app.responses import RawJSONResponse, dumps
+from app.schemas import (
+    BatchGenerateRequest, BatchGenerateResponse, BatchStatusResponse, MusicGenerateRequest, MusicGenerateResponse,
+    TaskStatusResponse,
+)
+from app.services import (
+    acestep_client, audio_analysis, audio_store, audio_transcode, batch_export, dedup, metrics, resilience, scheduler,
+    status_poller, status_writer,
+)
 
 router = APIRouter(prefix="/api/music", tags=["music"])
 
+# Seconds between SSE keep-alive comments (also how often disconnects are noticed)
+SSE_KEEPALIVE = 15.0
 
-@router.post("/generate", response_model=MusicGenerateResponse)
-async def generate_music(req: MusicGenerateRequest, db: AsyncSession = Depends(get_db)):
-    """Submit a music generation task to ACE-Step and store it in DB."""
+
+def _status_response(state: status_poller.TaskState) -> TaskStatusResponse:
+    return TaskStatusResponse(**_status_body(state))
+
+
+def _status_body(state: status_poller.TaskState) -> dict:
+    """TaskStatusResponse as a plain dict, for the polling and push paths."""
+    return {
+        "task_id": state.task_id,
+        "status": state.status,
+        "audio_urls": state.audio_urls,
+        "generation_meta": state.meta,
+        "queue_position": state.queue_position,
+        "eta_seconds": state.eta_seconds,
+    }
+
+
+def _payload(req: MusicGenerateRequest) -> dict:
+    """ACE-Step /release_task payload for a request."""
     payload = {
         "prompt": req.prompt,
         "lyrics": req.lyrics,
@@ -31,116 +61,442 @@ async def generate_music(req: MusicGenerateRequest, db: AsyncSession = Depends(g
         "thinking": req.thinking,
         "batch_size": req.batch_size,
         "inference_steps": req.inference_steps,
+        "seed": req.seed,
+        "use_random_seed": False if req.seed is not None else None,
     }
     # Remove None values so ACE-Step uses its own defaults
-    payload = {k: v for k, v in payload.items() if v is not None and v != ""}
+    return {k: v for k, v in payload.items() if v is not None and v != ""}
+
+
+def _columns(req: MusicGenerateRequest) -> dict:
+    """Generation columns copied from a request."""
+    return {
+        "prompt": req.prompt,
+        "lyrics": req.lyrics,
+        "duration": req.duration,
+        "bpm": req.bpm,
+        "key_scale": req.key_scale,
+        "vocal_language": req.vocal_language,
+        "batch_size": req.batch_size,
+    }
+
+
+def _client_id(request: Request) -> str:
+    return request.headers.get("x-client-id") or (request.client.host if request.client else "")
+
+
+@router.post("/generate", response_model=MusicGenerateResponse)
+async def generate_music(req: MusicGenerateRequest, request: Request, db: AsyncSession = Depends(get_db)):
+    """Queue a music generation task for ACE-Step and store it in DB.
+
+    Identical requests are deduplicated: they join a matching in-flight
+    task, and seeded requests reuse an earlier successful result. New work
+    goes through the fair backend queue; 429 with Retry-After when full.
+    """
+    payload = _payload(req)
+    params_hash = dedup.params_hash(payload)
+
+    existing = await dedup.find_existing(db, params_hash, deterministic=req.seed is not None)
+    if existing:
+        gen_id, task_id, status = existing
+        return MusicGenerateResponse(id=gen_id, task_id=task_id, status=status, deduplicated=True)
 
+    client_id = _client_id(request)
+
+    async def submit() -> tuple[int, str, str]:
+        try:
+            gen = await scheduler.enqueue(payload, client_id, **_columns(req), params_hash=params_hash)
+        except scheduler.QueueFull as e:
+            raise HTTPException(
+                status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))}
+            )
+        return gen.id, gen.task_id, gen.status
+
+    gen_id, task_id, status, deduplicated = await dedup.coalesce(params_hash, submit)
+    return MusicGenerateResponse(id=gen_id, task_id=task_id, status=status, deduplicated=deduplicated)
+
+
+def _too_many() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"A batch holds at most {settings.batch_max_items} items")
+
+
+async def _read_ndjson(request: Request) -> list[MusicGenerateRequest]:
+    """Parse one MusicGenerateRequest per line as the body streams in."""
+    items: list[MusicGenerateRequest] = []
+    buffer = b""
+
+    def parse(line: bytes):
+        if not line.strip():
+            return
+        if len(items) >= settings.batch_max_items:
+            raise _too_many()
+        try:
+            items.append(MusicGenerateRequest.model_validate(json.loads(line)))
+        except (ValueError, ValidationError) as e:
+            errors = e.errors(include_url=False, include_context=False) if isinstance(e, ValidationError) else str(e)
+            raise HTTPException(status_code=422, detail={"item": len(items) + 1, "errors": errors})
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            parse(line)
+    parse(buffer)
+    return items
+
+
+@router.post(
+    "/generate/batch",
+    response_model=BatchGenerateResponse,
+    openapi_extra={"requestBody": {"content": {
+        "application/json": {"schema": BatchGenerateRequest.model_json_schema()},
+        "application/x-ndjson": {"schema": {"type": "string"}},
+    }}},
+)
+async def generate_batch(request: Request):
+    """Queue many generations at once, e.g. a catalog job.
+
+    Body is a BatchGenerateRequest, or NDJSON (``application/x-ndjson``)
+    with one MusicGenerateRequest per line. All rows are inserted in one
+    statement; the tasks then go through the backend queue like any other,
+    in a lane of their own so they don't hold up interactive requests.
+    No deduplication. 429 with Retry-After when the batch backlog is full.
+    """
+    if "ndjson" in request.headers.get("content-type", ""):
+        items = await _read_ndjson(request)
+    else:
+        try:
+            items = BatchGenerateRequest.model_validate_json(await request.body()).items
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+        if len(items) > settings.batch_max_items:
+            raise _too_many()
+    if not items:
+        raise HTTPException(status_code=422, detail="Batch is empty")
+
+    batch_id = str(uuid.uuid4())
+    jobs = []
+    for req in items:
+        payload = _payload(req)
+        jobs.append((payload, {**_columns(req), "params_hash": dedup.params_hash(payload)}))
     try:
-        result = await acestep_client.submit_task(payload)
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"ACE-Step unavailable: {e}")
-
-    task_id = result.get("task_id", "")
-
-    gen = Generation(
-        task_id=task_id,
-        status="queued",
-        prompt=req.prompt,
-        lyrics=req.lyrics,
-        duration=req.duration,
-        bpm=req.bpm,
-        key_scale=req.key_scale,
-        vocal_language=req.vocal_language,
-        batch_size=req.batch_size,
+        task_ids = await scheduler.enqueue_many(jobs, _client_id(request), batch_id)
+    except scheduler.QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    return BatchGenerateResponse(batch_id=batch_id, total=len(task_ids), task_ids=task_ids)
+
+
+async def _batch_rows(db: AsyncSession, batch_id: str) -> list:
+    rows = (await db.execute(
+        select(Generation.task_id, Generation.status, Generation.prompt, Generation.audio_paths,
+               Generation.generation_meta)
+        .where(Generation.batch_id == batch_id)
+        .order_by(Generation.id)
+    )).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return rows
+
+
+def _batch_item(row) -> TaskStatusResponse:
+    # Live state from the poller where it has one; it's ahead of the table
+    state = status_poller.lookup(row.task_id)
+    if state is not None:
+        return _status_response(state)
+    row = status_writer.apply(row)
+    return TaskStatusResponse(
+        task_id=row.task_id, status=row.status, audio_urls=row.audio_paths or [], generation_meta=row.generation_meta
+    )
+
+
+@router.get("/batch/{batch_id}", response_model=BatchStatusResponse)
+async def batch_status(batch_id: str, db: AsyncSession = Depends(get_db)):
+    """Aggregated progress of a batch, plus every task's status."""
+    items = [_batch_item(r) for r in await _batch_rows(db, batch_id)]
+    counts: dict[str, int] = {}
+    for item in items:
+        counts[item.status] = counts.get(item.status, 0) + 1
+    finished = sum(n for status, n in counts.items() if status in status_poller.TERMINAL)
+    etas = [item.eta_seconds for item in items if item.eta_seconds is not None]
+    return BatchStatusResponse(
+        batch_id=batch_id,
+        total=len(items),
+        counts=counts,
+        finished=finished,
+        progress=round(finished / len(items), 4),
+        eta_seconds=max(etas) if etas else None,
+        items=items,
     )
-    db.add(gen)
-    await db.commit()
-    await db.refresh(gen)
 
-    return MusicGenerateResponse(id=gen.id, task_id=task_id, status="queued")
+
+@router.get("/batch/{batch_id}/download")
+async def batch_download(batch_id: str, db: AsyncSession = Depends(get_db)):
+    """Zip of the batch's audio so far, streamed as it is built, with a manifest.json
+    listing every task (succeeded or not) and its files."""
+    rows = await _batch_rows(db, batch_id)
+    items = []
+    for index, row in enumerate(rows, start=1):
+        item = _batch_item(row)
+        items.append({
+            "index": index,
+            "task_id": item.task_id,
+            "status": item.status,
+            "prompt": row.prompt,
+            "audio_urls": item.audio_urls if item.status == "succeeded" else [],
+        })
+    return StreamingResponse(
+        batch_export.zip_stream(items),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="batch-{batch_id}.zip"'},
+    )
 
 
 @router.get("/status/{task_id}", response_model=TaskStatusResponse)
-async def get_task_status(task_id: str, db: AsyncSession = Depends(get_db)):
-    """Poll the status of a generation task."""
-    results = await acestep_client.query_task([task_id])
+async def get_task_status(task_id: str):
+    """Poll the status of a generation task.
 
-    if not results:
+    Answered from the background poller's in-memory state — this never
+    calls ACE-Step itself.
+    """
+    state = await status_poller.get_status(task_id)
+    if state is None:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    task = results[0]
-    status_code = task.get("status", 0)
-    status_map = {0: "running", 1: "succeeded", 2: "failed"}
-    status = status_map.get(status_code, "running")
+    return RawJSONResponse(_status_body(state))
+
+
+@router.get("/events/{task_id}")
+async def task_events(task_id: str, request: Request):
+    """Server-Sent Events stream of status changes for one task.
 
-    audio_urls: list[str] = []
-    meta = None
+    Sends the current state immediately, then one ``status`` event per
+    transition as soon as the poller sees it. The stream ends after a
+    terminal (succeeded/failed) event.
+    """
+    # Subscribe before reading state so no transition slips in between
+    queue = status_poller.subscribe(task_id)
+    state = await status_poller.get_status(task_id)
+    if state is None:
+        status_poller.unsubscribe(task_id, queue)
+        raise HTTPException(status_code=404, detail="Task not found")
 
-    # Parse the result JSON string when task succeeded
-    if status == "succeeded" and task.get("result"):
+    async def stream():
+        current = state
         try:
-            result_list = json.loads(task["result"]) if isinstance(task["result"], str) else task["result"]
-            for item in result_list:
-                file_path = item.get("file", "")
-                if file_path:
-                    # ACE-Step returns a relative URL like "/v1/audio?path=/app/.cache/.../x.mp3".
-                    # Extract just the real filesystem path so our proxy can fetch it cleanly.
-                    parsed = urlparse(file_path)
-                    actual_path = parse_qs(parsed.query).get("path", [file_path])[0]
-                    # No "/api" prefix — frontend audioUrl() adds it
-                    audio_urls.append(f"/music/audio?path={actual_path}")
-                meta = item.get("metas")
-        except (json.JSONDecodeError, TypeError):
+            yield f"event: status\ndata: {dumps(_status_body(current)).decode()}\n\n"
+            while current.status not in status_poller.TERMINAL:
+                try:
+                    current = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: status\ndata: {dumps(_status_body(current)).decode()}\n\n"
+        finally:
+            status_poller.unsubscribe(task_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Close code for a message that isn't a valid command (RFC 6455 "unsupported data")
+WS_UNSUPPORTED_DATA = 1003
+
+
+def _ws_command(msg) -> tuple[list[str], list[str]] | None:
+    """(subscribe, unsubscribe) task ids of a WebSocket command, or None if it's malformed."""
+    if not isinstance(msg, dict) or not msg.keys() <= {"subscribe", "unsubscribe"}:
+        return None
+    lists = (msg.get("subscribe", []), msg.get("unsubscribe", []))
+    if not all(isinstance(ids, list) and all(isinstance(i, str) for i in ids) for ids in lists):
+        return None
+    return lists
+
+
+@router.websocket("/ws")
+async def task_socket(ws: WebSocket):
+    """Multiplexed status push for many tasks over one WebSocket.
+
+    Client sends ``{"subscribe": [task_id, ...]}`` / ``{"unsubscribe": [...]}``;
+    server sends one TaskStatusResponse JSON per change of any subscribed task,
+    starting with the current state of each newly subscribed task. Anything
+    else closes the socket with code 1003.
+    """
+    await ws.accept()
+    queue: asyncio.Queue = asyncio.Queue()
+    subscribed: set[str] = set()
+
+    async def read_commands():
+        while True:
+            try:
+                command = _ws_command(await ws.receive_json())
+            except WebSocketDisconnect:
+                return
+            except (ValueError, KeyError, TypeError):  # not JSON, or a binary frame
+                command = None
+            if command is None:
+                await ws.close(code=WS_UNSUPPORTED_DATA, reason="Expected subscribe/unsubscribe lists of task ids")
+                return
+            to_subscribe, to_unsubscribe = command
+            for task_id in to_subscribe:
+                if task_id in subscribed:
+                    continue
+                status_poller.subscribe(task_id, queue)
+                state = await status_poller.get_status(task_id)
+                if state is None:
+                    status_poller.unsubscribe(task_id, queue)
+                    await ws.send_json({"task_id": task_id, "error": "Task not found"})
+                    continue
+                subscribed.add(task_id)
+                queue.put_nowait(state)
+            for task_id in to_unsubscribe:
+                subscribed.discard(task_id)
+                status_poller.unsubscribe(task_id, queue)
+
+    reader = asyncio.create_task(read_commands())
+    try:
+        while True:
+            getter = asyncio.create_task(queue.get())
+            done, _ = await asyncio.wait({getter, reader}, return_when=asyncio.FIRST_COMPLETED)
+            if reader in done:
+                getter.cancel()
+                break
+            state = getter.result()
+            if state.task_id in subscribed:
+                await ws.send_text(dumps(_status_body(state)).decode())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+        try:
+            await reader  # surfaces an error that ended the reader
+        except (asyncio.CancelledError, WebSocketDisconnect):
             pass
+        for task_id in subscribed:
+            status_poller.unsubscribe(task_id, queue)
 
-    # Update DB record
-    stmt = select(Generation).where(Generation.task_id == task_id)
-    result_row = await db.execute(stmt)
-    gen = result_row.scalar_one_or_none()
-    if gen:
-        gen.status = status
-        if audio_urls:
-            gen.audio_paths = audio_urls
-        if meta:
-            gen.generation_meta = meta
-        if status in ("succeeded", "failed"):
-            gen.completed_at = datetime.now(timezone.utc)
-        await db.commit()
 
-    return TaskStatusResponse(
-        task_id=task_id,
-        status=status,
-        audio_urls=audio_urls,
-        generation_meta=meta,
+# Seconds clients may cache the original served in place of a rendition still being encoded
+RENDITION_PENDING_MAX_AGE = 60
+
+Quality = Literal["low", "medium", "original"]
+QUALITY_QUERY = Query(
+    None, description="Preview rendition; default original (low with Save-Data). Codec follows Accept."
+)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match check: a comma-separated list of entity tags, or "*" (weak comparison)."""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def _immutable_file(path, media_type: str, etag: str, request: Request, headers: dict | None = None) -> Response:
+    """File response with Range support, ETag revalidation and long-lived caching."""
+    headers = {"etag": etag, "cache-control": settings.audio_cache_control, **(headers or {})}
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+def _audio_response(stored: audio_store.StoredAudio, request: Request, quality: Quality | None) -> Response:
+    """The original file or the negotiated preview rendition of it."""
+    rendition = audio_transcode.negotiate(
+        quality, request.headers.get("accept", ""), request.headers.get("save-data", "").lower() == "on"
     )
+    # Without ?quality the choice depends on Save-Data; with one, on Accept
+    headers = {"vary": "Accept, Save-Data"} if quality != "original" else {}
+    if rendition is not None:
+        path = audio_transcode.lookup(stored, rendition)
+        if path is not None:
+            metrics.audio_responses.inc(rendition.name)
+            return _immutable_file(
+                path, rendition.media_type, f'"{stored.digest}-{rendition.name}"', request,
+                {**headers, "x-audio-rendition": rendition.name},
+            )
+        # Not encoded yet: queue it and let the client cache the original only briefly
+        audio_transcode.request(stored, rendition)
+        headers["cache-control"] = f"public, max-age={RENDITION_PENDING_MAX_AGE}"
+
+    metrics.audio_responses.inc("original")
+    return _immutable_file(
+        stored.path, stored.media_type, f'"{stored.digest}"', request, {**headers, "x-audio-rendition": "original"}
+    )
+
 
+@router.api_route("/audio", methods=["GET", "HEAD"])
+async def proxy_audio(path: str, request: Request, node: str = "", quality: Quality | None = QUALITY_QUERY):
+    """Serve generated audio from the local store, fetching it once from the
+    ACE-Step node that produced it.
 
-@router.get("/audio")
-async def proxy_audio(path: str):
-    """Proxy audio download from ACE-Step to the frontend."""
+    Supports Range requests (206), conditional requests via ETag and
+    long-lived client caching — the content behind a path never changes.
+    ``quality`` selects a low-bitrate preview rendition.
+    """
     try:
-        resp, client = await acestep_client.get_audio_stream(path)
+        with resilience.deadline(settings.upstream_deadline):
+            stored = await audio_store.fetch(path, node)
+    except resilience.CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            raise HTTPException(status_code=404, detail="Audio not found")
+        raise HTTPException(status_code=502, detail=f"Audio fetch failed: {e}")
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Audio fetch failed: {e}")
 
-    content_type = resp.headers.get("content-type", "audio/mpeg")
+    return _audio_response(stored, request, quality)
 
-    async def stream():
-        try:
-            async for chunk in resp.aiter_bytes(chunk_size=8192):
-                yield chunk
-        finally:
-            await resp.aclose()
-            await client.aclose()
 
-    return StreamingResponse(stream(), media_type=content_type)
+@router.api_route("/audio/{audio_id}", methods=["GET", "HEAD"])
+async def local_audio(audio_id: str, request: Request, quality: Quality | None = QUALITY_QUERY):
+    """Serve ingested audio by its local id — never touches ACE-Step."""
+    stored = audio_store.get(audio_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Audio not found")
+
+    return _audio_response(stored, request, quality)
+
+
+@router.get("/peaks/{audio_id}")
+async def audio_peaks(audio_id: str, request: Request):
+    """Waveform peaks, exact duration and loudness of a stored track.
+
+    Compact binary (layout in services/audio_analysis), a few KB per track.
+    Computed on the spot if background analysis hasn't reached the track yet.
+    """
+    stored = audio_store.get(audio_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    try:
+        await audio_analysis.analyze(stored)
+    except audio_analysis.AnalysisError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return _immutable_file(
+        audio_store.peaks_path(stored.digest),
+        "application/octet-stream",
+        f'"{stored.digest}-peaks{audio_analysis.VERSION}"',
+        request,
+    )
 
 
 @router.get("/models")
 async def list_models():
     """List available ACE-Step models."""
     try:
-        models = await acestep_client.list_models()
+        with resilience.deadline(settings.upstream_deadline):
+            models = await acestep_client.list_models()
         return {"models": models}
+    except resilience.CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
     except Exception as e:
         raise HTTPException(status_code=502, detail=str(e))
@@ -1,7 +1,8 @@
 """Pydantic request / response schemas."""
 
 from datetime import datetime
-from pydantic import BaseModel, Field
+from typing import Literal
+from pydantic import BaseModel, ConfigDict, Field
 
 
 # ---------- Music generation ----------
@@ -18,12 +19,15 @@ class MusicGenerateRequest(BaseModel):
     thinking: bool = Field(True, description="Use LM for enhanced quality")
     batch_size: int = Field(2, ge=1, le=8)
     inference_steps: int = Field(8, ge=1, le=50)
+    seed: int | None = Field(None, ge=0, description="Fixed seed; identical seeded requests reuse earlier results")
 
 
 class MusicGenerateResponse(BaseModel):
     id: int
     task_id: str
     status: str
+    # True when answered by an identical in-flight or (seeded) finished generation
+    deduplicated: bool = False
 
 
 class TaskStatusResponse(BaseModel):
@@ -31,6 +35,29 @@ class TaskStatusResponse(BaseModel):
     status: str
     audio_urls: list[str] = []
     generation_meta: dict | None = None
+    queue_position: int | None = None
+    eta_seconds: float | None = None
+
+
+class BatchGenerateRequest(BaseModel):
+    """JSON form of a batch; the endpoint also takes one request per line as NDJSON."""
+    items: list[MusicGenerateRequest] = Field(..., min_length=1)
+
+
+class BatchGenerateResponse(BaseModel):
+    batch_id: str
+    total: int
+    task_ids: list[str]  # in submission order
+
+
+class BatchStatusResponse(BaseModel):
+    batch_id: str
+    total: int
+    counts: dict[str, int]  # status → number of tasks
+    finished: int  # succeeded + failed
+    progress: float  # finished / total
+    eta_seconds: float | None = None  # estimate for the last task still in the backend queue
+    items: list[TaskStatusResponse]
 
 
 # ---------- Lyrics generation ----------
@@ -40,15 +67,49 @@ class LyricsRequest(BaseModel):
     language: str = Field("en", description="en, ru, or by")
     genre: str = Field("pop", description="Music genre for context")
     mood: str = Field("", description="Mood / emotion")
+    fresh: bool = Field(False, description="Skip the lyrics cache and always generate new lyrics")
 
 
 class LyricsResponse(BaseModel):
     lyrics: str
     language: str
+    cached: bool = False  # served from the lyrics cache
+
+
+class LyricsStreamSummary(LyricsResponse):
+    """Final ``done`` event of the streaming lyrics endpoint."""
+    ttft_ms: float | None = None  # request start → first token, as seen by the backend
+    tokens: int = 0
+    tokens_per_s: float | None = None  # decode rate reported by Ollama
 
 
 # ---------- History ----------
 
+class AudioAnalysis(BaseModel):
+    """Measured properties of one generated track (see services/audio_analysis)."""
+    audio_id: str
+    duration: float  # seconds, exact
+    lufs: float | None  # integrated loudness
+    peaks_url: str
+
+
+class GenerationListItem(BaseModel):
+    """Lightweight history row — no lyrics or metadata, prompt truncated."""
+    id: int
+    task_id: str
+    status: str
+    prompt: str
+    duration: float | None
+    bpm: int | None
+    key_scale: str
+    vocal_language: str
+    audio_urls: list[str] = []
+    # Aligned with audio_urls; null until analyzed, null entries for tracks that couldn't be
+    audio_analysis: list[AudioAnalysis | None] | None = None
+    created_at: datetime
+    completed_at: datetime | None = None
+
+
 class GenerationItem(BaseModel):
     id: int
     task_id: str
@@ -60,13 +121,34 @@ class GenerationItem(BaseModel):
     key_scale: str
     vocal_language: str
     audio_urls: list[str] = []
+    # Aligned with audio_urls; null until analyzed, null entries for tracks that couldn't be
+    audio_analysis: list[AudioAnalysis | None] | None = None
     created_at: datetime
     completed_at: datetime | None = None
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class HistoryResponse(BaseModel):
-    items: list[GenerationItem]
+    items: list[GenerationListItem]
+    next_cursor: str | None = None
+    total: int | None = None
+
+
+class HistorySearchResponse(BaseModel):
+    items: list[GenerationListItem]
     total: int
+    # facet name → value → count, over all matching rows
+    facets: dict[str, dict[str, int]]
+
+
+class BulkDeleteRequest(BaseModel):
+    """Finished generations to delete: all criteria given must match."""
+    ids: list[int] | None = Field(None, max_length=1000)
+    status: Literal["succeeded", "failed"] | None = None
+    created_before: datetime | None = None
+
+
+class BulkDeleteResponse(BaseModel):
+    deleted: int
+    bytes_reclaimed: int
@@ -1,62 +1,111 @@
-"""HTTP client for communicating with the ACE-Step API server."""
+"""HTTP client for communicating with the ACE-Step API servers.
+
+Calls that concern an existing task take the owning node's name (see
+services/acestep_nodes); new tasks are routed to the least-loaded node.
+"""
 
 import httpx
 
 from app.config import settings
+from app.services import acestep_nodes, http_pool, resilience
 
-# Generous timeout — music generation can take 10-60s depending on duration
-TIMEOUT = httpx.Timeout(connect=10.0, read=120.0, write=10.0, pool=10.0)
+# Generous read timeout — music generation can take 10-60s depending on duration.
+# Short connect timeout: a node that doesn't accept connections is down, not slow.
+TIMEOUT = httpx.Timeout(connect=settings.upstream_connect_timeout, read=120.0, write=10.0, pool=10.0)
 
+_pool = http_pool.get_pool("acestep", TIMEOUT)
 
-async def submit_task(params: dict) -> dict:
-    """Submit a generation task to ACE-Step. Returns {task_id, status, queue_position}."""
-    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-        resp = await client.post(f"{settings.acestep_url}/release_task", json=params)
-        resp.raise_for_status()
+
+async def submit_task(params: dict, nodes: list[acestep_nodes.Node] | None = None) -> dict:
+    """Submit a generation task to the least-loaded healthy node (of ``nodes``, if given).
+
+    Returns {task_id, status, queue_position, node}. If a node can't be
+    reached at all (connect error, open circuit) the next one is tried —
+    the request never got there, so it can't run twice.
+    """
+    error: Exception | None = None
+    for node in nodes if nodes is not None else acestep_nodes.candidates():
+        async def send(url=node.url):
+            resp = await _pool.client.post(f"{url}/release_task", json=params)
+            resp.raise_for_status()
+            return resp
+
+        try:
+            # Not idempotent: only retried when the request never reached ACE-Step
+            resp = await resilience.call(f"acestep.release_task@{node.name}", send, idempotent=False)
+        except (resilience.CircuitOpen, httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            error = e
+            continue
         body = resp.json()
-        return body.get("data", body)
+        data = dict(body.get("data", body))
+        data["node"] = node.name
+        acestep_nodes.task_dispatched(node.name, data.get("queue_position"))
+        return data
+    raise error
+
 
+async def query_task(task_ids: list[str], node: str | None = None) -> list[dict]:
+    """Query status of one or more tasks on one node. Returns list of task result dicts."""
+    target = acestep_nodes.get(node)
 
-async def query_task(task_ids: list[str]) -> list[dict]:
-    """Query status of one or more tasks. Returns list of task result dicts."""
-    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-        resp = await client.post(
-            f"{settings.acestep_url}/query_result",
+    async def send():
+        resp = await _pool.client.post(
+            f"{target.url}/query_result",
             json={"task_id_list": task_ids},
         )
         resp.raise_for_status()
-        body = resp.json()
-        return body.get("data", [])
+        return resp
+
+    resp = await resilience.call(f"acestep.query_result@{target.name}", send, idempotent=True)
+    body = resp.json()
+    return body.get("data", [])
 
 
-async def get_audio_stream(path: str):
-    """Stream audio bytes from ACE-Step without buffering the whole file.
+async def get_audio_stream(path: str, node: str | None = None) -> httpx.Response:
+    """Stream audio bytes from the node that produced them, without buffering the whole file.
 
-    Returns (response, client) — caller must close both when done.
-    Uses send() with stream=True so bytes arrive incrementally.
+    Returns the response — caller must close it when done so the pooled
+    connection is released. Uses send() with stream=True so bytes arrive
+    incrementally. Retried on transient errors; if the response headers are
+    slow to arrive, a hedged second request races the first.
     """
-    client = httpx.AsyncClient(timeout=TIMEOUT)
-    req = client.build_request("GET", f"{settings.acestep_url}/v1/audio", params={"path": path})
-    resp = await client.send(req, stream=True)
-    resp.raise_for_status()
-    return resp, client
+    client = _pool.client
+    target = acestep_nodes.get(node)
+
+    async def send() -> httpx.Response:
+        req = client.build_request("GET", f"{target.url}/v1/audio", params={"path": path})
+        resp = await client.send(req, stream=True)
+        if resp.is_error:
+            await resp.aclose()
+        resp.raise_for_status()
+        return resp
 
+    async def discard(resp: httpx.Response):
+        await resp.aclose()
 
-async def health_check() -> bool:
-    """Check if ACE-Step is reachable."""
-    try:
-        async with httpx.AsyncClient(timeout=httpx.Timeout(5.0)) as client:
-            resp = await client.get(f"{settings.acestep_url}/health")
-            return resp.status_code == 200
-    except Exception:
-        return False
+    return await resilience.call(
+        f"acestep.audio@{target.name}", send, idempotent=True,
+        hedge_after=settings.audio_hedge_delay or None, discard=discard,
+    )
+
+
+async def ping(node: str | None = None, timeout: float = 5.0):
+    """Hit a node's /health endpoint; raises if it's unreachable or unhealthy."""
+    target = acestep_nodes.get(node)
+    resp = await _pool.client.get(f"{target.url}/health", timeout=httpx.Timeout(timeout))
+    resp.raise_for_status()
 
 
 async def list_models() -> list[dict]:
-    """List available DiT models on the ACE-Step server."""
-    async with httpx.AsyncClient(timeout=httpx.Timeout(10.0)) as client:
-        resp = await client.get(f"{settings.acestep_url}/v1/models")
+    """List available DiT models (from the best available node — all serve the same models)."""
+    target = acestep_nodes.candidates()[0]
+
+    async def send():
+        resp = await _pool.client.get(f"{target.url}/v1/models", timeout=httpx.Timeout(10.0))
         resp.raise_for_status()
-        body = resp.json()
-        data = body.get("data", {})
-        return data.get("models", [])
+        return resp
+
+    resp = await resilience.call(f"acestep.models@{target.name}", send, idempotent=True)
+    body = resp.json()
+    data = body.get("data", {})
+    return data.get("models", [])
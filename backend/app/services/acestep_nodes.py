@@ -0,0 +1,103 @@
+"""Pool of ACE-Step GPU nodes with load-aware routing.
+
+``settings.acestep_urls`` (comma-separated) lists the nodes; without it
+``acestep_url`` is the only node. A node is named by its ``host:port``,
+which is what ``Generation.node`` and the ``node`` parameter of audio
+proxy URLs hold, so polling and audio fetches go back to the node that
+owns the task. Unknown or empty names (rows from before multi-node
+support) resolve to the first node.
+
+New tasks go to the healthy node with the lowest estimated load: the
+larger of the tasks we have in flight there and the queue depth it last
+reported from /release_task. Health comes from the background probes
+(services/health) and the node's circuit breaker.
+"""
+
+import time
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+from app.config import settings
+from app.services import resilience
+
+
+@dataclass
+class Node:
+    name: str
+    url: str
+    healthy: bool = True  # until a probe says otherwise
+    inflight: int = 0  # non-terminal tasks we know are on this node
+    reported_depth: int = 0
+    reported_at: float = 0.0
+    dispatched: int = 0
+
+    @property
+    def load(self) -> int:
+        # A reported depth goes stale as tasks finish; only trust it for a while
+        fresh = time.monotonic() - self.reported_at < settings.acestep_depth_ttl
+        return max(self.inflight, self.reported_depth if fresh else 0)
+
+    @property
+    def usable(self) -> bool:
+        """Healthy and accepting new tasks (submit circuit not open)."""
+        return self.healthy and self.breaker("release_task").available()
+
+    def breaker(self, endpoint: str) -> resilience.CircuitBreaker:
+        return resilience.breaker(f"acestep.{endpoint}@{self.name}")
+
+
+_nodes: dict[str, Node] = {}
+
+
+def node_name(url: str) -> str:
+    return urlparse(url).netloc or url
+
+
+def nodes() -> list[Node]:
+    if not _nodes:
+        urls = [u.strip().rstrip("/") for u in settings.acestep_urls.split(",") if u.strip()]
+        for url in urls or [settings.acestep_url.rstrip("/")]:
+            _nodes.setdefault(node_name(url), Node(node_name(url), url))
+    return list(_nodes.values())
+
+
+def get(name: str | None) -> Node:
+    """Node by name; the first node for legacy/unknown names."""
+    all_nodes = nodes()
+    return _nodes.get(name or "", all_nodes[0])
+
+
+def candidates() -> list[Node]:
+    """Nodes to try for a new task, best first; unhealthy ones only as a last resort."""
+    def rank(n: Node):
+        return (not n.usable, n.load, n.dispatched)
+    return sorted(nodes(), key=rank)
+
+
+def task_dispatched(name: str, queue_depth: int | None):
+    node = get(name)
+    node.inflight += 1
+    node.dispatched += 1
+    if queue_depth is not None:
+        node.reported_depth = queue_depth
+        node.reported_at = time.monotonic()
+
+
+def set_inflight(counts: dict[str, int]):
+    """Replace in-flight counts with the poller's view of non-terminal tasks per node."""
+    for node in nodes():
+        node.inflight = counts.get(node.name, 0)
+
+
+def snapshot() -> dict:
+    return {
+        n.name: {
+            "url": n.url,
+            "healthy": n.healthy,
+            "inflight": n.inflight,
+            "reported_depth": n.reported_depth,
+            "load": n.load,
+            "dispatched": n.dispatched,
+        }
+        for n in nodes()
+    }
@@ -0,0 +1,265 @@
+"""Waveform peaks, exact duration and loudness of generated audio.
+
+Once ingestion has stored a task's outputs locally, each file is decoded
+by ffmpeg in a small process pool (``audio_analysis_workers``), off the
+event loop. A worker computes:
+
+- min/max waveform peaks at several resolutions (``PEAK_LEVELS`` buckets
+  across the whole track), as int8 pairs;
+- the exact duration, from the decoded sample count;
+- integrated loudness (EBU R128, LUFS) from ffmpeg's ebur128 filter.
+
+Peaks are written to a sidecar file in the audio store, keyed by the
+audio's digest. Duration and loudness also go to the generation's
+``audio_analysis`` column, so the history list has them without opening
+any file. Players fetch the few-KB peaks file from
+GET /api/music/peaks/{audio_id} and draw right away instead of
+downloading and decoding the whole track.
+
+Peaks file layout (little-endian):
+
+    header  b"PEAK" | u16 version | u16 level count | u32 sample rate
+            | u64 sample count | f32 integrated loudness (NaN if unknown)
+    level   u32 bucket count | bucket count × (i8 min, i8 max)
+
+Levels are stored coarsest first.
+"""
+
+import asyncio
+import logging
+import math
+import multiprocessing
+import re
+import struct
+import subprocess
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from sqlalchemy import String, cast, select
+
+from app.config import settings
+from app.database import async_session
+from app.models import Generation
+from app.services import audio_store, coordination, status_writer
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"PEAK"
+VERSION = 1
+# Buckets per level; players pick the one closest to their width in pixels
+PEAK_LEVELS = (128, 512, 2048)
+# Decode rate for peaks — far more than a waveform needs, and keeps PCM small
+SAMPLE_RATE = 8000
+# Give up on a file that takes longer than this to decode (s)
+DECODE_TIMEOUT = 120.0
+
+_HEADER = struct.Struct("<4sHHIQf")
+_LEVEL = struct.Struct("<I")
+_LOUDNESS = re.compile(rb"I:\s+(-?\d+(?:\.\d+)?) LUFS")
+
+
+class AnalysisError(Exception):
+    """The file couldn't be decoded."""
+
+
+@dataclass
+class Analysis:
+    duration: float
+    lufs: float | None
+
+    def summary(self, audio_id: str) -> dict:
+        """Entry for the generation's ``audio_analysis`` column."""
+        return {
+            "audio_id": audio_id,
+            "duration": round(self.duration, 3),
+            "lufs": None if self.lufs is None else round(self.lufs, 1),
+            # No "/api" prefix, like audio URLs — frontend adds it
+            "peaks_url": f"/music/peaks/{audio_id}",
+        }
+
+
+class AnalysisStats:
+    def __init__(self):
+        self.files = 0
+        self.failed = 0
+        self.seconds = 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "files": self.files,
+            "failed": self.failed,
+            "avg_seconds": round(self.seconds / self.files, 3) if self.files else 0.0,
+            "pending_tasks": len(_jobs),
+        }
+
+
+stats = AnalysisStats()
+_pool: ProcessPoolExecutor | None = None
+_inflight: dict[str, asyncio.Task] = {}  # digest → analysis in progress
+_jobs: dict[str, asyncio.Task] = {}  # task id → analysis of its outputs
+
+
+# --- Worker side (runs in the process pool) ---
+
+def _peaks(samples: array, buckets: int) -> bytes:
+    out = bytearray(2 * buckets)
+    n = len(samples)
+    for i in range(buckets):
+        start = i * n // buckets
+        chunk = samples[start:max((i + 1) * n // buckets, start + 1)]
+        if chunk:
+            # s16 → i8, stored as two's complement bytes
+            out[2 * i] = (min(chunk) >> 8) & 0xFF
+            out[2 * i + 1] = (max(chunk) >> 8) & 0xFF
+    return bytes(out)
+
+
+def _analyze_file(ffmpeg: str, path: str) -> bytes:
+    """Decode one audio file and build its peaks file."""
+    try:
+        proc = subprocess.run(
+            [
+                ffmpeg, "-nostdin", "-hide_banner", "-nostats", "-i", path,
+                "-af", f"ebur128=framelog=quiet,aresample={SAMPLE_RATE},"
+                       "aformat=sample_fmts=s16:channel_layouts=mono",
+                "-f", "s16le", "-",
+            ],
+            capture_output=True,
+            timeout=DECODE_TIMEOUT,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise AnalysisError(f"ffmpeg failed: {e}")
+    if proc.returncode != 0:
+        last = proc.stderr.decode(errors="replace").strip().splitlines()[-1:] or [""]
+        raise AnalysisError(f"ffmpeg exited with {proc.returncode}: {last[0]}")
+
+    samples = array("h")
+    samples.frombytes(proc.stdout[: len(proc.stdout) // 2 * 2])
+    if sys.byteorder == "big":
+        samples.byteswap()
+    # The summary comes last; earlier matches would be per-frame logs
+    found = _LOUDNESS.findall(proc.stderr)
+    lufs = float(found[-1]) if found else math.nan
+
+    header = _HEADER.pack(MAGIC, VERSION, len(PEAK_LEVELS), SAMPLE_RATE, len(samples), lufs)
+    return header + b"".join(_LEVEL.pack(n) + _peaks(samples, n) for n in PEAK_LEVELS)
+
+
+# --- Event loop side ---
+
+def _parse_header(data: bytes) -> Analysis:
+    magic, version, _, sample_rate, sample_count, lufs = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise AnalysisError("Unknown peaks file format")
+    return Analysis(sample_count / sample_rate, None if math.isnan(lufs) else lufs)
+
+
+def _read_header(path: Path) -> Analysis | None:
+    try:
+        with open(path, "rb") as f:
+            return _parse_header(f.read(_HEADER.size))
+    except (FileNotFoundError, struct.error, AnalysisError):
+        return None
+
+
+async def _run(stored: audio_store.StoredAudio) -> Analysis:
+    if _pool is None:
+        raise AnalysisError("Audio analysis is disabled")
+    started = time.perf_counter()
+    try:
+        data = await asyncio.get_running_loop().run_in_executor(
+            _pool, _analyze_file, settings.ffmpeg_path, str(stored.path)
+        )
+    except AnalysisError:
+        stats.failed += 1
+        raise
+    await asyncio.to_thread(audio_store.save_peaks, stored.digest, data)
+    stats.files += 1
+    stats.seconds += time.perf_counter() - started
+    return _parse_header(data)
+
+
+async def analyze(stored: audio_store.StoredAudio) -> Analysis:
+    """Analysis of a stored file, computing it (once, however many callers) if needed."""
+    cached = _read_header(audio_store.peaks_path(stored.digest))
+    if cached is not None:
+        return cached
+
+    task = _inflight.get(stored.digest)
+    if task is None:
+        task = asyncio.create_task(_run(stored))
+        _inflight[stored.digest] = task
+        task.add_done_callback(lambda _: _inflight.pop(stored.digest, None))
+    # Shield so a client giving up doesn't cancel work other callers wait on
+    return await asyncio.shield(task)
+
+
+async def _analyze_task(task_id: str, urls: list[str]):
+    entries = []
+    for url in urls:
+        audio_id = url.rsplit("/", 1)[-1]
+        stored = audio_store.get(audio_id)
+        if stored is None:
+            entries.append(None)
+            continue
+        try:
+            entries.append((await analyze(stored)).summary(audio_id))
+        except AnalysisError as e:
+            logger.warning("Analysis of %s (task %s) failed: %s", audio_id, task_id, e)
+            entries.append(None)
+    status_writer.write(task_id, audio_analysis=entries)
+
+
+def submit(task_id: str, urls: list[str]):
+    """Schedule analysis of a task's locally stored outputs (no-op when disabled or already running)."""
+    if _pool is None or task_id in _jobs:
+        return
+    job = asyncio.create_task(_analyze_task(task_id, list(urls)))
+    _jobs[task_id] = job
+    job.add_done_callback(lambda _: _jobs.pop(task_id, None))
+
+
+async def _backfill():
+    """Queue ingested generations that were never analyzed."""
+    async with async_session() as session:
+        rows = await session.execute(
+            select(Generation.task_id, Generation.audio_paths)
+            .where(Generation.status == "succeeded")
+            .where(Generation.audio_analysis.is_(None))
+            .where(Generation.audio_paths.is_not(None))
+            .where(cast(Generation.audio_paths, String).not_like("%audio?path=%"))
+            .order_by(Generation.id.desc())
+            .limit(settings.ingest_backfill_limit)
+        )
+        for r in rows:
+            submit(r.task_id, r.audio_paths or [])
+
+
+async def start():
+    global _pool
+    if not settings.audio_analysis_enabled:
+        return
+    # spawn, not fork: the parent has an event loop and threads running
+    _pool = ProcessPoolExecutor(
+        max_workers=settings.audio_analysis_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+    # Every worker analyzes on demand; only the leader sweeps the table
+    coordination.add_leader_role("analysis_backfill", _backfill, _cancel_jobs)
+
+
+async def _cancel_jobs():
+    for job in list(_jobs.values()):
+        job.cancel()
+    await asyncio.gather(*_jobs.values(), return_exceptions=True)
+
+
+async def stop():
+    global _pool
+    await _cancel_jobs()
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
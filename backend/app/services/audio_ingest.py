@@ -0,0 +1,156 @@
+"""Eager ingestion of finished audio off the GPU host.
+
+As soon as the status poller sees a task succeed, every output file is
+pulled from ACE-Step into the local audio library (a bounded number of
+downloads run at once across all tasks), size-checked, and the
+generation's ``audio_paths`` are rewritten from ACE-Step proxy URLs to
+local ids. History playback then never depends on ACE-Step's cache.
+Ingested files are then handed to ``audio_analysis`` for waveform peaks
+and to ``audio_transcode`` for preview renditions.
+"""
+
+import asyncio
+import logging
+import time
+from urllib.parse import urlparse, parse_qs
+
+from sqlalchemy import select, cast, String
+
+from app.config import settings
+from app.database import async_session
+from app.models import Generation
+from app.services import audio_analysis, audio_store, audio_transcode, coordination, status_poller, status_writer
+
+logger = logging.getLogger(__name__)
+
+
+class IngestStats:
+    def __init__(self):
+        self.tasks = 0
+        self.failed_tasks = 0
+        self.files = 0
+        self.bytes = 0
+        self.download_seconds = 0.0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "tasks": self.tasks,
+            "failed_tasks": self.failed_tasks,
+            "files": self.files,
+            "bytes": self.bytes,
+            "throughput_bytes_per_s": round(self.bytes / self.download_seconds) if self.download_seconds else 0,
+            "latency_avg_s": round(self.latency_total / self.tasks, 3) if self.tasks else 0.0,
+            "latency_max_s": round(self.latency_max, 3),
+            "pending": len(_jobs),
+        }
+
+
+stats = IngestStats()
+_slots: asyncio.Semaphore | None = None
+_jobs: dict[str, asyncio.Task] = {}
+
+
+def local_url(audio_id: str) -> str:
+    # No "/api" prefix — frontend audioUrl() adds it
+    return f"/music/audio/{audio_id}"
+
+
+def source_path(url: str) -> str | None:
+    """ACE-Step file path behind a "/music/audio?path=..." proxy URL, or None if already local."""
+    parsed = urlparse(url)
+    return parse_qs(parsed.query).get("path", [None])[0]
+
+
+def source_node(url: str) -> str | None:
+    """ACE-Step node named in a proxy URL (None for single-node era URLs)."""
+    return parse_qs(urlparse(url).query).get("node", [None])[0]
+
+
+async def resolve(url: str) -> audio_store.StoredAudio | None:
+    """Local copy of a generation audio URL, fetching ACE-Step proxy URLs on a miss.
+
+    None for a local id that is no longer in the store.
+    """
+    source = source_path(url)
+    if source is None:
+        return audio_store.get(url.rsplit("/", 1)[-1])
+    return await audio_store.fetch(source, source_node(url))
+
+
+async def _download(url: str) -> audio_store.StoredAudio:
+    async with _slots:
+        started = time.perf_counter()
+        stored = await audio_store.fetch(source_path(url), source_node(url), keep=True)
+        stats.download_seconds += time.perf_counter() - started
+    stats.files += 1
+    stats.bytes += stored.size
+    return stored
+
+
+async def _ingest(task_id: str, urls: list[str]):
+    started = time.perf_counter()
+    sources = [source_path(u) for u in urls]
+    try:
+        stored = await asyncio.gather(*(_download(u) for s, u in zip(sources, urls) if s))
+    except Exception:
+        stats.failed_tasks += 1
+        logger.exception("Ingest of task %s failed; keeping ACE-Step URLs", task_id)
+        return
+
+    local = iter(stored)
+    new_urls = [local_url(next(local).audio_id) if s else u for s, u in zip(sources, urls)]
+
+    status_writer.write(task_id, audio_paths=new_urls)
+    status_poller.set_state(task_id, audio_urls=new_urls)
+    audio_analysis.submit(task_id, new_urls)
+    audio_transcode.submit(task_id, new_urls)
+
+    elapsed = time.perf_counter() - started
+    stats.tasks += 1
+    stats.latency_total += elapsed
+    stats.latency_max = max(stats.latency_max, elapsed)
+    logger.info("Ingested %d files for task %s in %.2fs", len(stored), task_id, elapsed)
+
+
+def submit(task_id: str, urls: list[str]):
+    """Schedule ingestion of a task's outputs (no-op if already running or nothing to fetch)."""
+    if task_id in _jobs or not any(source_path(u) for u in urls):
+        return
+    job = asyncio.create_task(_ingest(task_id, list(urls)))
+    _jobs[task_id] = job
+    job.add_done_callback(lambda _: _jobs.pop(task_id, None))
+
+
+def _on_transition(state: status_poller.TaskState):
+    if state.status == "succeeded":
+        submit(state.task_id, state.audio_urls)
+
+
+async def _backfill():
+    """Re-queue succeeded generations whose audio still lives only on ACE-Step."""
+    async with async_session() as session:
+        rows = await session.execute(
+            select(Generation.task_id, Generation.audio_paths)
+            .where(Generation.status == "succeeded")
+            .where(cast(Generation.audio_paths, String).like("%audio?path=%"))
+            .order_by(Generation.id.desc())
+            .limit(settings.ingest_backfill_limit)
+        )
+        for r in rows:
+            submit(r.task_id, r.audio_paths or [])
+
+
+async def start():
+    global _slots
+    _slots = asyncio.Semaphore(settings.ingest_concurrency)
+    status_poller.add_transition_hook(_on_transition)
+    # Transitions only fire on the leader; so should the backfill
+    coordination.add_leader_role("ingest_backfill", _backfill, stop)
+
+
+async def stop():
+    for job in list(_jobs.values()):
+        job.cancel()
+    await asyncio.gather(*_jobs.values(), return_exceptions=True)
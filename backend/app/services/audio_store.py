@@ -0,0 +1,445 @@
+"""Local content-addressed cache for generated audio.
+
+Files fetched from ACE-Step's /v1/audio are stored once under
+``settings.audio_dir``:
+
+    objects/ab/abcdef….mp3   cached audio bytes, named by their SHA-256
+    library/ab/abcdef….mp3   ingested audio owned by a generation (never evicted)
+    refs/<sha256 of source path>   text file holding "<digest>.<ext>"
+    peaks/ab/abcdef….peaks   waveform peaks (services/audio_analysis)
+    renditions/ab/abcdef….low-aac.m4a   preview transcodes (services/audio_transcode)
+
+so playback, seeks and replays are served from local disk. The cache area
+is bounded by ``audio_cache_max_bytes`` with least-recently-used eviction.
+Recency is tracked in memory; each use also sets the object's atime
+explicitly (so it works on noatime mounts), which orders the index when
+it is rebuilt at startup. Evicted files are deleted off the event loop. The library only shrinks
+when generations are deleted (``remove``) and through the garbage
+collector's sweep (services/retention).
+"""
+
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import time
+from collections import Counter, OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+
+from app.config import settings
+from app.services import acestep_client, metrics
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# Downloaded chunks are written out (off the event loop) in batches of about this size
+WRITE_SIZE = 1024 * 1024
+
+# Local audio ids are object file names: "<sha256>.<ext>"
+_AUDIO_ID = re.compile(r"^[0-9a-f]{64}\.[A-Za-z0-9]{1,8}$")
+
+
+class IntegrityError(Exception):
+    """Downloaded audio doesn't match what the upstream announced."""
+
+
+@dataclass
+class StoredAudio:
+    digest: str
+    path: Path
+    size: int
+    media_type: str
+
+    @property
+    def audio_id(self) -> str:
+        return self.path.name
+
+
+_objects: OrderedDict[Path, int] = OrderedDict()  # object path → size in bytes, least recently used first
+_total_bytes = 0
+_inflight: dict[str, asyncio.Task] = {}
+_pinning: Counter = Counter()  # source → fetches that will pin it
+_held: dict[str, Path] = {}  # source → its cached object, kept from eviction until pinned
+
+
+def _root() -> Path:
+    return Path(settings.audio_dir)
+
+
+def _object_path(digest: str, ext: str, area: str = "objects") -> Path:
+    return _root() / area / digest[:2] / f"{digest}{ext}"
+
+
+def _find(name: str) -> Path | None:
+    """Locate an object by file name, preferring the library over the cache."""
+    digest, ext = name[:64], name[64:]
+    for area in ("library", "objects"):
+        path = _object_path(digest, ext, area)
+        if path.is_file():
+            return path
+    return None
+
+
+def _ref_path(source: str) -> Path:
+    key = hashlib.sha256(source.encode()).hexdigest()
+    return _root() / "refs" / key[:2] / key
+
+
+def _stored(path: Path) -> StoredAudio:
+    media_type = mimetypes.guess_type(path.name)[0] or "audio/mpeg"
+    return StoredAudio(path.stem, path, _objects.get(path) or path.stat().st_size, media_type)
+
+
+def _touch(path: Path):
+    """Mark an object as recently used without changing its mtime (Last-Modified)."""
+    if path in _objects:
+        _objects.move_to_end(path)
+    try:
+        st = path.stat()
+        os.utime(path, (time.time(), st.st_mtime))
+    except FileNotFoundError:
+        pass
+
+
+def _scan():
+    global _total_bytes
+    _objects.clear()
+    found = []  # (atime, path, size)
+    objects_dir = _root() / "objects"
+    if objects_dir.is_dir():
+        for path in objects_dir.glob("*/*"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.is_file():
+                found.append((st.st_atime, path, st.st_size))
+    for _, path, size in sorted(found):
+        _objects[path] = size
+    _total_bytes = sum(_objects.values())
+
+
+async def init():
+    """Create the store layout and index existing objects (runs off the event loop)."""
+    for sub in ("objects", "library", "refs", "peaks", "renditions", "tmp"):
+        (_root() / sub).mkdir(parents=True, exist_ok=True)
+    await asyncio.to_thread(_scan)
+    logger.info("Audio store: %d objects, %d bytes", len(_objects), _total_bytes)
+
+
+def lookup(source: str) -> StoredAudio | None:
+    """Cached object for an ACE-Step audio path, or None on a miss."""
+    try:
+        name = _ref_path(source).read_text().strip()
+    except FileNotFoundError:
+        return None
+    path = _find(name)
+    if path is None:
+        return None
+    _touch(path)
+    return _stored(path)
+
+
+def get(audio_id: str) -> StoredAudio | None:
+    """Stored object by local audio id, or None if unknown or evicted."""
+    if not _AUDIO_ID.match(audio_id):
+        return None
+    path = _find(audio_id)
+    if path is None:
+        return None
+    _touch(path)
+    return _stored(path)
+
+
+def peaks_path(digest: str) -> Path:
+    return _root() / "peaks" / digest[:2] / f"{digest}.peaks"
+
+
+def rendition_path(digest: str, name: str, ext: str) -> Path:
+    return _root() / "renditions" / digest[:2] / f"{digest}.{name}{ext}"
+
+
+def tmp_dir() -> Path:
+    """Scratch directory on the store's filesystem, for files moved in with os.replace."""
+    return _root() / "tmp"
+
+
+def save_peaks(digest: str, data: bytes) -> Path:
+    """Atomically write the peaks file for an object (blocking; call off the event loop)."""
+    path = peaks_path(digest)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=_root() / "tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+    return path
+
+
+def pin(stored: StoredAudio) -> StoredAudio:
+    """Move an object from the evictable cache into the permanent library.
+
+    Identical bytes may already be there (pinned by another ingestion);
+    the cached copy is then dropped.
+    """
+    global _total_bytes
+    target = _object_path(stored.digest, stored.path.suffix, "library")
+    if stored.path == target:
+        return stored
+    if target.exists():
+        _unlink(stored.path)
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.replace(stored.path, target)
+        except FileNotFoundError:
+            if not target.exists():  # evicted, not pinned by someone else
+                raise
+    size = _objects.pop(stored.path, None)
+    if size is not None:
+        _total_bytes -= size
+    return StoredAudio(stored.digest, target, stored.size, stored.media_type)
+
+
+def _unlink(path: Path) -> int:
+    """Delete a file; returns its size (0 if it was already gone)."""
+    try:
+        size = path.stat().st_size
+        path.unlink()
+    except FileNotFoundError:
+        return 0
+    return size
+
+
+def _has_audio(digest: str) -> bool:
+    """Whether the library or the cache still holds audio with this digest (any extension)."""
+    return any(any((_root() / area / digest[:2]).glob(f"{digest}.*")) for area in ("library", "objects"))
+
+
+def _remove_derived(digest: str) -> dict[str, int]:
+    freed = {"peaks": _unlink(peaks_path(digest)), "renditions": 0}
+    for path in (_root() / "renditions" / digest[:2]).glob(f"{digest}.*"):
+        freed["renditions"] += _unlink(path)
+    return freed
+
+
+def _expired(path: Path, cutoff: float) -> bool:
+    """Whether a file was last modified (or moved in) before ``cutoff``; False once it's gone."""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return False
+    # ctime too: pin() moves files in with os.replace, which keeps the download's mtime
+    return max(st.st_mtime, st.st_ctime) < cutoff
+
+
+def remove(audio_id: str, grace: float) -> dict[str, int]:
+    """Delete an ingested file from the library, with its peaks and renditions
+    unless a cached copy remains (blocking; call off the event loop).
+
+    A file modified within the last ``grace`` seconds is kept, like in
+    ``sweep``: a generation ingested since the caller counted references
+    may have just been pointed at it. The sweep collects it later if it
+    really is unused. Cached copies in objects/ are left to LRU eviction.
+    Returns bytes freed per area.
+    """
+    if not _AUDIO_ID.match(audio_id):
+        return {}
+    digest, ext = audio_id[:64], audio_id[64:]
+    path = _object_path(digest, ext, "library")
+    if not _expired(path, time.time() - grace):
+        return {}
+    freed = {"library": _unlink(path)}
+    if not _has_audio(digest):
+        freed.update(_remove_derived(digest))
+    return freed
+
+
+def library_bytes() -> int:
+    """Total size of the library area (blocking)."""
+    total = 0
+    for path in (_root() / "library").glob("*/*"):
+        try:
+            total += path.stat().st_size
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def sweep(referenced: Callable[[str], bool], grace: float) -> dict[str, int]:
+    """Sweep phase of garbage collection (blocking; call off the event loop).
+
+    Deletes library files whose audio id ``referenced`` rejects, peaks and
+    renditions of audio gone from both library and cache, refs to missing
+    objects, and leftover scratch files. Files modified within the last
+    ``grace`` seconds are kept, so an ingestion in progress is safe.
+    Returns bytes freed per area.
+    """
+    root = _root()
+    cutoff = time.time() - grace
+    freed: dict[str, int] = {}
+
+    def drop(area: str, path: Path):
+        freed[area] = freed.get(area, 0) + _unlink(path)
+
+    digests: set[str] = set()
+    for path in (root / "library").glob("*/*"):
+        if not referenced(path.name) and _expired(path, cutoff):
+            drop("library", path)
+        else:
+            digests.add(path.name[:64])
+    digests.update(path.name[:64] for path in (root / "objects").glob("*/*"))
+
+    for area in ("peaks", "renditions"):
+        for path in (root / area).glob("*/*"):
+            if path.name[:64] not in digests and _expired(path, cutoff):
+                drop(area, path)
+    for path in (root / "refs").glob("*/*"):
+        try:
+            name = path.read_text().strip()
+        except FileNotFoundError:
+            continue
+        if name[:64] not in digests and _expired(path, cutoff):
+            drop("refs", path)
+    for path in (root / "tmp").iterdir():
+        if path.is_file() and _expired(path, cutoff):
+            drop("tmp", path)
+    return freed
+
+
+async def _add_object(path: Path, size: int):
+    global _total_bytes
+    if path not in _objects:
+        _objects[path] = size
+        _total_bytes += size
+    _objects.move_to_end(path)
+    victims = _evict(keep=path)
+    if victims:
+        await asyncio.to_thread(_unlink_all, victims)
+
+
+def _evict(keep: Path) -> list[Path]:
+    """Drop least-recently-used objects from the index until the store fits its
+    size budget; returns their paths, to delete off the event loop."""
+    global _total_bytes
+    if _total_bytes <= settings.audio_cache_max_bytes:
+        return []
+    victims = []
+    held = {keep, *_held.values()}
+    for path in list(_objects):
+        if _total_bytes <= settings.audio_cache_max_bytes:
+            break
+        if path in held:
+            continue
+        _total_bytes -= _objects.pop(path)
+        victims.append(path)
+    return victims
+
+
+def _unlink_all(paths: list[Path]):
+    for path in paths:
+        path.unlink(missing_ok=True)
+        logger.info("Evicted %s from audio store", path.name)
+
+
+async def _download(source: str, node: str | None) -> StoredAudio:
+    """Stream one file from ACE-Step into the store, hashing as it arrives.
+
+    The SHA-256 only names the object (identical bytes are stored once);
+    the integrity check is the size ACE-Step announced, when it sent one.
+    """
+    ext = PurePosixPath(source).suffix or ".mp3"
+    resp = await acestep_client.get_audio_stream(source, node)
+    hasher = hashlib.sha256()
+    size = 0
+    fd, tmp_name = tempfile.mkstemp(dir=_root() / "tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pending: list[bytes] = []
+            buffered = 0
+            async for chunk in resp.aiter_bytes(chunk_size=CHUNK_SIZE):
+                hasher.update(chunk)
+                size += len(chunk)
+                pending.append(chunk)
+                buffered += len(chunk)
+                if buffered >= WRITE_SIZE:
+                    await asyncio.to_thread(f.write, b"".join(pending))
+                    pending, buffered = [], 0
+            if pending:
+                await asyncio.to_thread(f.write, b"".join(pending))
+        # Only comparable when httpx hasn't decoded a content-encoding
+        expected = resp.headers.get("content-length")
+        if expected is not None and "content-encoding" not in resp.headers and int(expected) != size:
+            raise IntegrityError(f"{source}: got {size} bytes, expected {expected}")
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+    finally:
+        await resp.aclose()
+    metrics.audio_fetched_bytes.inc(node or "", amount=size)
+
+    digest = hasher.hexdigest()
+    path = _find(f"{digest}{ext}")
+    if path is not None:
+        os.unlink(tmp_name)  # identical bytes already stored
+        _touch(path)  # also bumps its ctime: a new reference restarts the sweep grace period
+    else:
+        path = _object_path(digest, ext)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_name, path)
+
+    ref = _ref_path(source)
+    ref.parent.mkdir(parents=True, exist_ok=True)
+    ref.write_text(path.name)
+
+    if path.parent.parent.name == "objects":
+        if _pinning[source]:
+            _held[source] = path
+        await _add_object(path, size)
+    return _stored(path)
+
+
+async def fetch(source: str, node: str | None = None, keep: bool = False) -> StoredAudio:
+    """Return the local copy of an ACE-Step audio file, downloading it on a miss
+    from ``node`` (the ACE-Step node that produced it).
+
+    Concurrent misses for the same file share a single upstream download.
+    With ``keep``, the file is moved into the library (see ``pin``) and
+    can't be evicted in between.
+    """
+    if keep:
+        _pinning[source] += 1
+    try:
+        stored = lookup(source)
+        if stored is None:
+            task = _inflight.get(source)
+            if task is None:
+                task = asyncio.create_task(_download(source, node))
+                _inflight[source] = task
+                task.add_done_callback(lambda _: _inflight.pop(source, None))
+            # Shield so one listener disconnecting doesn't cancel the download for the rest
+            stored = await asyncio.shield(task)
+        return pin(stored) if keep else stored
+    finally:
+        if keep:
+            _pinning[source] -= 1
+            if not _pinning[source]:
+                del _pinning[source]
+                _held.pop(source, None)
+
+
+def stats() -> dict:
+    return {
+        "cached_objects": len(_objects),
+        "bytes": _total_bytes,
+        "max_bytes": settings.audio_cache_max_bytes,
+        "inflight": len(_inflight),
+    }
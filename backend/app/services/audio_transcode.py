@@ -0,0 +1,237 @@
+"""Low-bitrate preview renditions of generated audio.
+
+Originals from ACE-Step are full-quality files, several MB for a long
+track. After ingestion each output is transcoded by ffmpeg in a bounded
+process pool (``transcode_workers``) into the renditions below — Opus in
+Ogg for clients that ask for it, AAC in MP4 for everyone else — and kept
+next to the original in the audio store.
+
+The audio endpoints pick a rendition with ``?quality=low|medium|original``;
+without the parameter, clients sending ``Save-Data: on`` get ``low``. The
+codec follows the Accept header. A rendition that isn't ready yet is
+queued and the original is served meanwhile.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from app.config import settings
+from app.services import audio_store
+
+logger = logging.getLogger(__name__)
+
+# Give up on a file that takes longer than this to encode (s)
+ENCODE_TIMEOUT = 300.0
+
+
+@dataclass(frozen=True)
+class Rendition:
+    quality: str
+    codec: str
+    bitrate: str
+    ext: str
+    media_type: str
+    args: tuple[str, ...]
+
+    @property
+    def name(self) -> str:
+        return f"{self.quality}-{self.codec}"
+
+
+_OPUS = (".opus", "audio/ogg", ("-c:a", "libopus", "-vbr", "on", "-f", "ogg"))
+_AAC = (".m4a", "audio/mp4", ("-c:a", "aac", "-movflags", "+faststart", "-f", "mp4"))
+
+RENDITIONS = {
+    ("low", "opus"): Rendition("low", "opus", "32k", *_OPUS),
+    ("medium", "opus"): Rendition("medium", "opus", "64k", *_OPUS),
+    ("low", "aac"): Rendition("low", "aac", "48k", *_AAC),
+    ("medium", "aac"): Rendition("medium", "aac", "96k", *_AAC),
+}
+# Media types that mean a client can play Opus in Ogg
+_OPUS_TYPES = ("audio/ogg", "audio/opus")
+
+
+class TranscodeError(Exception):
+    """ffmpeg couldn't produce a rendition."""
+
+
+class TranscodeStats:
+    def __init__(self):
+        self.files = 0
+        self.failed = 0
+        self.seconds = 0.0
+        self.source_bytes = 0
+        self.output_bytes = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "files": self.files,
+            "failed": self.failed,
+            "avg_seconds": round(self.seconds / self.files, 3) if self.files else 0.0,
+            # Rendition size relative to the original
+            "size_ratio": round(self.output_bytes / self.source_bytes, 3) if self.source_bytes else 0.0,
+            "pending_tasks": len(_jobs),
+        }
+
+
+stats = TranscodeStats()
+_pool: ProcessPoolExecutor | None = None
+_inflight: dict[tuple[str, str], asyncio.Task] = {}  # (digest, rendition) → transcode in progress
+_jobs: dict[str, asyncio.Task] = {}  # task id → transcodes of its outputs
+
+
+def _accept_q(accept: str, media_type: str) -> float:
+    """Quality value the Accept header gives an exact media type (0 if not listed)."""
+    for part in accept.split(","):
+        kind, *params = (p.strip() for p in part.split(";"))
+        if kind.lower() != media_type:
+            continue
+        for p in params:
+            if p.startswith("q="):
+                try:
+                    return float(p[2:])
+                except ValueError:
+                    return 0.0
+        return 1.0
+    return 0.0
+
+
+def negotiate(quality: str | None, accept: str, save_data: bool) -> Rendition | None:
+    """Rendition to serve, or None for the original."""
+    if quality is None:
+        quality = "low" if save_data else "original"
+    if quality == "original":
+        return None
+    opus = max(_accept_q(accept, t) for t in _OPUS_TYPES)
+    # Opus only when asked for explicitly ("*/*" doesn't say the client can decode it)
+    codec = "opus" if opus > 0 and opus >= _accept_q(accept, "audio/mp4") else "aac"
+    return RENDITIONS[(quality, codec)]
+
+
+def _path(stored: audio_store.StoredAudio, rendition: Rendition) -> Path:
+    return audio_store.rendition_path(stored.digest, rendition.name, rendition.ext)
+
+
+def lookup(stored: audio_store.StoredAudio, rendition: Rendition) -> Path | None:
+    path = _path(stored, rendition)
+    return path if path.is_file() else None
+
+
+def _transcode_file(ffmpeg: str, source: str, target: str, bitrate: str, args: tuple[str, ...]):
+    """Encode one rendition (runs in the process pool)."""
+    try:
+        proc = subprocess.run(
+            [ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-y", "-i", source,
+             "-vn", "-map_metadata", "-1", "-b:a", bitrate, *args, target],
+            capture_output=True,
+            timeout=ENCODE_TIMEOUT,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise TranscodeError(f"ffmpeg failed: {e}")
+    if proc.returncode != 0:
+        last = proc.stderr.decode(errors="replace").strip().splitlines()[-1:] or [""]
+        raise TranscodeError(f"ffmpeg exited with {proc.returncode}: {last[0]}")
+
+
+async def _run(stored: audio_store.StoredAudio, rendition: Rendition) -> Path:
+    if _pool is None:
+        raise TranscodeError("Transcoding is disabled")
+    started = time.perf_counter()
+    target = _path(stored, rendition)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=audio_store.tmp_dir())
+    os.close(fd)
+    try:
+        await asyncio.get_running_loop().run_in_executor(
+            _pool, _transcode_file, settings.ffmpeg_path, str(stored.path), tmp_name,
+            rendition.bitrate, rendition.args,
+        )
+        os.replace(tmp_name, target)
+    except BaseException as e:
+        os.unlink(tmp_name)
+        if isinstance(e, TranscodeError):
+            stats.failed += 1
+        raise
+    stats.files += 1
+    stats.seconds += time.perf_counter() - started
+    stats.source_bytes += stored.size
+    stats.output_bytes += target.stat().st_size
+    return target
+
+
+def transcode(stored: audio_store.StoredAudio, rendition: Rendition) -> asyncio.Task:
+    """Start (or join) producing a rendition; concurrent callers share one encode."""
+    key = (stored.digest, rendition.name)
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_run(stored, rendition))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return task
+
+
+def request(stored: audio_store.StoredAudio, rendition: Rendition):
+    """Queue a missing rendition in the background (no-op when disabled)."""
+    if _pool is None or (stored.digest, rendition.name) in _inflight:
+        return
+    transcode(stored, rendition).add_done_callback(_log_failure)
+
+
+def _log_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Transcode failed: %s", task.exception())
+
+
+async def _transcode_task(task_id: str, urls: list[str]):
+    # One encode at a time per task so on-demand requests aren't stuck behind a whole backlog
+    for url in urls:
+        stored = audio_store.get(url.rsplit("/", 1)[-1])
+        if stored is None:
+            continue
+        for rendition in RENDITIONS.values():
+            if lookup(stored, rendition) is not None:
+                continue
+            try:
+                await asyncio.shield(transcode(stored, rendition))
+            except TranscodeError as e:
+                logger.warning("Transcode of %s to %s (task %s) failed: %s", stored.audio_id, rendition.name, task_id, e)
+
+
+def submit(task_id: str, urls: list[str]):
+    """Schedule all renditions of a task's locally stored outputs (no-op when disabled or already running)."""
+    if _pool is None or task_id in _jobs:
+        return
+    job = asyncio.create_task(_transcode_task(task_id, list(urls)))
+    _jobs[task_id] = job
+    job.add_done_callback(lambda _: _jobs.pop(task_id, None))
+
+
+async def start():
+    global _pool
+    if not settings.transcode_enabled:
+        return
+    # spawn, not fork: the parent has an event loop and threads running
+    _pool = ProcessPoolExecutor(
+        max_workers=settings.transcode_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+async def stop():
+    global _pool
+    for job in list(_jobs.values()):
+        job.cancel()
+    await asyncio.gather(*_jobs.values(), return_exceptions=True)
+    for task in list(_inflight.values()):
+        task.cancel()
+    await asyncio.gather(*_inflight.values(), return_exceptions=True)
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
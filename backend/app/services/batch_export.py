@@ -0,0 +1,77 @@
+"""Streamed zip download of a batch's audio.
+
+Archives are written on the fly: each file is copied from the local audio
+store (fetched from ACE-Step first if ingestion hasn't got to it yet) and
+handed to the client as it is compressed, so memory stays at about one
+file regardless of batch size. Audio is already compressed, so entries
+are stored, not deflated.
+"""
+
+import asyncio
+import json
+import logging
+import zipfile
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+from app.services import audio_ingest
+
+logger = logging.getLogger(__name__)
+
+_CHUNK = 1024 * 1024
+
+
+class _Sink:
+    """Write-only file object collecting zip output between yields (non-seekable)."""
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _add_file(zf: zipfile.ZipFile, arcname: str, path: Path):
+    with open(path, "rb") as src, zf.open(arcname, "w", force_zip64=True) as dst:
+        while chunk := src.read(_CHUNK):
+            dst.write(chunk)
+
+
+async def zip_stream(items: list[dict]) -> AsyncIterator[bytes]:
+    """Zip of every item's audio plus a ``manifest.json``.
+
+    ``items`` are dicts with ``index``, ``task_id``, ``status``, ``prompt``
+    and ``audio_urls``; the manifest repeats them with the archive names.
+    Files that can't be fetched are skipped and noted in the manifest.
+    """
+    sink = _Sink()
+    zf = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED)
+    manifest = []
+    for item in items:
+        files, missing = [], []
+        for n, url in enumerate(item["audio_urls"]):
+            try:
+                stored = await audio_ingest.resolve(url)
+            except Exception as e:
+                logger.warning("Batch export: fetching %s failed: %s", url, e)
+                stored = None
+            if stored is None:
+                missing.append(url)
+                continue
+            arcname = f"{item['index']:04d}_{item['task_id'][:8]}_{n + 1}{stored.path.suffix}"
+            await asyncio.to_thread(_add_file, zf, arcname, stored.path)
+            files.append(arcname)
+            yield sink.drain()
+        manifest.append({**item, "files": files, "missing": missing})
+    zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+    zf.close()
+    yield sink.drain()
@@ -0,0 +1,264 @@
+"""Coordination between backend workers and replicas, over the app's Postgres.
+
+- Leader election: every process tries ``pg_try_advisory_lock`` on one key
+  from its own dedicated connection. The holder is the leader and runs the
+  singleton jobs registered with ``add_leader_role`` (status polling, queue
+  dispatch, backfills, model pulls, lyrics prefetch). The lock belongs to
+  the session, so when the leader dies or loses its connection another
+  process takes over within ``coordination_interval``.
+- Events: ``publish`` sends a JSON message with NOTIFY on one channel;
+  every process LISTENs and passes messages from the others to the handlers
+  registered with ``subscribe`` for the message type. The leader broadcasts
+  task state changes so any worker can push SSE/WebSocket updates;
+  followers announce jobs they enqueued; caches are invalidated everywhere.
+
+Delivery is best-effort, like NOTIFY itself: messages sent while a
+connection is down are lost, and the table remains the source of truth
+(a new leader reloads its state from it).
+
+With SQLite, or ``coordination_enabled`` off, the process is always the
+leader and ``publish`` is a no-op — run a single worker then.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from sqlalchemy.engine import make_url
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY payloads must stay under 8000 bytes
+MAX_PAYLOAD = 7900
+
+NODE_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+Handler = Callable[[dict], None]
+
+
+@dataclass
+class _Role:
+    name: str
+    start: Callable[[], Awaitable[None]]
+    stop: Callable[[], Awaitable[None]]
+
+
+class CoordinationStats:
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+        self.elections = 0  # times this process became leader
+
+    def snapshot(self) -> dict:
+        return {
+            "node": NODE_ID,
+            "clustered": clustered(),
+            "leader": _leader,
+            "connected": _conn is not None and not _conn.is_closed(),
+            "sent": self.sent,
+            "received": self.received,
+            "dropped": self.dropped,
+            "elections": self.elections,
+        }
+
+
+stats = CoordinationStats()
+_roles: list[_Role] = []
+_handlers: dict[str, list[Handler]] = {}
+_reconnect_hooks: list[Callable[[], None]] = []
+_clustered = False
+_leader = False
+_conn = None  # asyncpg.Connection, outside the SQLAlchemy pool
+_conn_lock = asyncio.Lock()  # one operation at a time on _conn
+_outbox: asyncio.Queue[str] = asyncio.Queue()
+_lost = asyncio.Event()  # the connection dropped
+_workers: list[asyncio.Task] = []
+
+
+def clustered() -> bool:
+    """Whether other processes may be sharing the work (set by ``start``)."""
+    return _clustered
+
+
+def is_leader() -> bool:
+    return _leader
+
+
+def add_leader_role(name: str, start: Callable[[], Awaitable[None]], stop: Callable[[], Awaitable[None]]):
+    """Run ``start`` when this process becomes leader and ``stop`` when it steps down."""
+    _roles.append(_Role(name, start, stop))
+
+
+def subscribe(kind: str, handler: Handler):
+    """Call ``handler(message)`` for every ``kind`` message from another process."""
+    _handlers.setdefault(kind, []).append(handler)
+
+
+def add_reconnect_hook(hook: Callable[[], None]):
+    """Called after the listener connection is re-established (messages may have been missed)."""
+    _reconnect_hooks.append(hook)
+
+
+def publish(kind: str, **data) -> bool:
+    """Broadcast a message to the other processes. False if it was dropped (too large)."""
+    if not _clustered:
+        return True
+    payload = json.dumps({"kind": kind, "from": NODE_ID, **data}, separators=(",", ":"), default=str)
+    if len(payload.encode()) > MAX_PAYLOAD:
+        stats.dropped += 1
+        logger.debug("Dropped oversized %s message (%d bytes)", kind, len(payload))
+        return False
+    _outbox.put_nowait(payload)
+    return True
+
+
+def _on_notify(conn, pid, channel, payload: str):
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        return
+    if message.get("from") == NODE_ID:
+        return
+    stats.received += 1
+    for handler in _handlers.get(message.get("kind"), ()):
+        try:
+            handler(message)
+        except Exception:
+            logger.exception("Handler for %s message failed", message.get("kind"))
+
+
+def _on_terminated(conn):
+    _lost.set()
+
+
+async def _become_leader():
+    global _leader
+    _leader = True
+    stats.elections += 1
+    logger.info("%s is now the leader", NODE_ID)
+    # Followers re-announce what they need from the leader (see status_poller)
+    publish("leader")
+    for role in _roles:
+        try:
+            await role.start()
+        except Exception:
+            logger.exception("Starting leader role %s failed", role.name)
+
+
+async def _step_down():
+    global _leader
+    if not _leader:
+        return
+    _leader = False
+    logger.warning("%s stepped down as leader", NODE_ID)
+    for role in reversed(_roles):
+        try:
+            await role.stop()
+        except Exception:
+            logger.exception("Stopping leader role %s failed", role.name)
+
+
+async def _connect():
+    global _conn
+    import asyncpg
+
+    dsn = make_url(settings.database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+    conn = await asyncpg.connect(dsn, statement_cache_size=0)
+    await conn.add_listener(settings.coordination_channel, _on_notify)
+    conn.add_termination_listener(_on_terminated)
+    _lost.clear()
+    _conn = conn
+    for hook in _reconnect_hooks:
+        hook()
+
+
+async def _disconnect():
+    global _conn
+    conn, _conn = _conn, None
+    if conn is not None and not conn.is_closed():
+        try:
+            await conn.close(timeout=2)
+        except Exception:
+            conn.terminate()
+
+
+async def _elect():
+    """One round: (re)connect, then try to take the lock or confirm we still hold it."""
+    if _conn is None or _conn.is_closed():
+        await _step_down()  # a lost session means a lost lock
+        await _connect()
+    async with _conn_lock:
+        if _leader:
+            await _conn.fetchval("SELECT 1")
+            return
+        won = await _conn.fetchval("SELECT pg_try_advisory_lock($1)", settings.coordination_lock_key)
+    if won:
+        await _become_leader()
+
+
+async def _run_election():
+    while True:
+        try:
+            await _elect()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Coordination connection failed: %s", e)
+            await _step_down()
+            await _disconnect()
+        try:
+            await asyncio.wait_for(_lost.wait(), timeout=settings.coordination_interval)
+            # Dropped connection: step down at once rather than at the next round
+            await _step_down()
+            await _disconnect()
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _run_sender():
+    while True:
+        payload = await _outbox.get()
+        if _conn is None or _conn.is_closed():
+            stats.dropped += 1
+            continue
+        try:
+            async with _conn_lock:
+                await _conn.execute("SELECT pg_notify($1, $2)", settings.coordination_channel, payload)
+            stats.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            stats.dropped += 1
+            logger.warning("Publishing event failed: %s", e)
+
+
+async def start():
+    """Join the cluster (or, unclustered, simply lead). Call after every service has registered its roles."""
+    global _clustered
+    _clustered = settings.coordination_enabled and make_url(settings.database_url).get_backend_name() == "postgresql"
+    if not _clustered:
+        await _become_leader()
+        return
+    try:
+        await _elect()  # first round inline, so a lone instance leads from startup
+    except Exception as e:
+        logger.warning("Coordination connection failed: %s", e)
+        await _disconnect()
+    _workers.extend([asyncio.create_task(_run_election()), asyncio.create_task(_run_sender())])
+
+
+async def stop():
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    await _step_down()
+    # Closing the session releases the advisory lock; a follower takes over at its next round
+    await _disconnect()
@@ -0,0 +1,94 @@
+"""Deduplication of identical music generation requests.
+
+Every request is reduced to a canonical hash of the payload sent to
+ACE-Step. Identical submissions are coalesced onto one ACE-Step task while
+it is in flight, and — when the request pins a seed, so the output is
+deterministic — answered from an earlier successful generation.
+"""
+
+import asyncio
+import hashlib
+import json
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import Generation
+from app.services import status_poller, status_writer
+
+IN_FLIGHT = ("pending", "dispatching", "queued", "running")
+
+# params hash → future resolving to (generation id, task id, status)
+_pending: dict[str, asyncio.Future] = {}
+
+
+def params_hash(payload: dict) -> str:
+    """Stable SHA-256 over the normalized ACE-Step payload."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _current_status(task_id: str, status: str) -> str:
+    """The row's status as the poller knows it, which may be ahead of the table."""
+    state = status_poller.lookup(task_id)
+    if state is not None:
+        return state.status
+    return status_writer.overlay(task_id).get("status", status)
+
+
+async def find_existing(db: AsyncSession, digest: str, deterministic: bool) -> tuple[int, str, str] | None:
+    """An earlier generation that can answer this request, as (id, task_id, status).
+
+    Matches tasks still in flight that were submitted within the dedup
+    window, and — for deterministic requests only — any succeeded
+    generation. Rows are checked against the poller's in-memory status, so
+    a task that has finished but isn't flushed yet counts as finished.
+    """
+    window_start = datetime.now(timezone.utc) - timedelta(seconds=settings.dedup_inflight_window)
+    reusable = and_(Generation.status.in_(IN_FLIGHT), Generation.created_at >= window_start)
+    if deterministic:
+        reusable = or_(reusable, Generation.status == "succeeded")
+
+    rows = await db.execute(
+        select(Generation.id, Generation.task_id, Generation.status)
+        .where(Generation.params_hash == digest)
+        .where(reusable)
+        .order_by(Generation.created_at.desc())
+    )
+    for gen_id, task_id, status in rows:
+        status = _current_status(task_id, status)
+        if status in IN_FLIGHT or (deterministic and status == "succeeded"):
+            # A claimed row is still waiting in the backend queue as far as clients are concerned
+            return gen_id, task_id, "pending" if status == "dispatching" else status
+    return None
+
+
+async def coalesce(digest: str, submit: Callable[[], Awaitable[tuple[int, str, str]]]) -> tuple[int, str, str, bool]:
+    """Run ``submit`` unless an identical submission is already running.
+
+    Returns (id, task_id, status, deduplicated). Concurrent callers with the
+    same digest wait for the first one and share its result (or error).
+    """
+    pending = _pending.get(digest)
+    if pending is not None:
+        return (*await asyncio.shield(pending), True)
+
+    future = asyncio.get_running_loop().create_future()
+    _pending[digest] = future
+    try:
+        result = await submit()
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved even if nobody else was waiting
+        raise
+    else:
+        future.set_result(result)
+        return (*result, False)
+    finally:
+        del _pending[digest]
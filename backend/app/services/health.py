@@ -0,0 +1,229 @@
+"""Background health and readiness probes for ACE-Step and Ollama.
+
+Every ACE-Step node and Ollama are probed in parallel every
+``health_probe_interval`` seconds and the results cached, so request
+handlers (lyrics model guard, /api/health) read state in O(1) instead of
+making their own round trip.
+A result older than ``health_max_staleness`` is refreshed on demand
+before it's trusted. Readiness changes are pushed to subscribers (the
+/api/health/events SSE stream).
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+from app.config import settings
+from app.services import acestep_client, acestep_nodes, ollama_client, ollama_nodes
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProbeResult:
+    ok: bool
+    latency_ms: float
+    checked_at: float  # wall clock, for clients
+    monotonic: float  # for staleness checks
+    error: str | None = None
+    details: dict = field(default_factory=dict)
+
+
+class Upstream:
+    """Cached probe state for one upstream service."""
+
+    def __init__(self, name: str, probe: Callable[[], Awaitable[dict]],
+                 on_result: Callable[[ProbeResult], None] | None = None):
+        self.name = name
+        self._probe = probe
+        self._on_result = on_result
+        self.last: ProbeResult | None = None
+        self.history: deque[ProbeResult] = deque(maxlen=settings.health_history_size)
+        self.consecutive_failures = 0
+        self._inflight: asyncio.Task | None = None
+
+    def fresh(self) -> bool:
+        return self.last is not None and time.monotonic() - self.last.monotonic <= settings.health_max_staleness
+
+    async def _run(self) -> ProbeResult:
+        started = time.perf_counter()
+        try:
+            details = await asyncio.wait_for(self._probe(), settings.health_probe_timeout)
+            error = None
+        except Exception as e:
+            details = {}
+            error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+        result = ProbeResult(
+            ok=error is None,
+            latency_ms=round((time.perf_counter() - started) * 1000, 1),
+            checked_at=time.time(),
+            monotonic=time.monotonic(),
+            error=error,
+            details=details,
+        )
+        if self.last is not None and self.last.ok != result.ok:
+            logger.warning("%s is now %s%s", self.name, "up" if result.ok else "down",
+                           f" ({error})" if error else "")
+        self.consecutive_failures = 0 if result.ok else self.consecutive_failures + 1
+        self.last = result
+        self.history.append(result)
+        if self._on_result is not None:
+            self._on_result(result)
+        return result
+
+    async def check(self) -> ProbeResult:
+        """Probe now; concurrent callers share one probe."""
+        if self._inflight is None:
+            self._inflight = asyncio.create_task(self._run())
+            self._inflight.add_done_callback(lambda _: setattr(self, "_inflight", None))
+        return await asyncio.shield(self._inflight)
+
+    async def get(self) -> ProbeResult:
+        """Cached result, re-probed first if it's missing or stale."""
+        if self.fresh():
+            return self.last
+        return await self.check()
+
+    def snapshot(self) -> dict:
+        last = self.last
+        latencies = [r.latency_ms for r in self.history if r.ok]
+        return {
+            "ok": last.ok if last else None,
+            "latency_ms": last.latency_ms if last else None,
+            "checked_at": last.checked_at if last else None,
+            "age_s": round(time.monotonic() - last.monotonic, 1) if last else None,
+            "error": last.error if last else None,
+            "consecutive_failures": self.consecutive_failures,
+            "latency_avg_ms": round(sum(latencies) / len(latencies), 1) if latencies else None,
+            "latency_max_ms": max(latencies) if latencies else None,
+            "history": [
+                {"checked_at": r.checked_at, "ok": r.ok, "latency_ms": r.latency_ms}
+                for r in self.history
+            ],
+            **(last.details if last else {}),
+        }
+
+
+def _acestep_upstream(node: acestep_nodes.Node) -> Upstream:
+    async def probe() -> dict:
+        await acestep_client.ping(node.name, timeout=settings.health_probe_timeout)
+        return {}
+
+    def record(result: ProbeResult):
+        node.healthy = result.ok
+
+    return Upstream(f"acestep@{node.name}", probe, record)
+
+
+def _ollama_upstream(replica: ollama_nodes.Replica) -> Upstream:
+    async def probe() -> dict:
+        timeout = settings.health_probe_timeout
+        pulled, loaded = await asyncio.gather(
+            ollama_client.list_local_models(replica.name, timeout),
+            ollama_client.list_loaded_models(replica.name, timeout),
+        )
+        return {"model_ready": ollama_client.has_model(pulled), "model_loaded": ollama_client.has_model(loaded)}
+
+    def record(result: ProbeResult):
+        replica.healthy = result.ok
+        if result.ok:
+            replica.model_pulled = result.details["model_ready"]
+            replica.model_loaded = result.details["model_loaded"]
+            ollama_client.maintain(replica)  # background pull / warm-up if needed
+
+    return Upstream(f"ollama@{replica.name}", probe, record)
+
+
+_upstreams = {
+    **{u.name: u for u in map(_acestep_upstream, acestep_nodes.nodes())},
+    **{u.name: u for u in map(_ollama_upstream, ollama_nodes.replicas())},
+}
+_subscribers: set[asyncio.Queue] = set()
+_readiness: dict[str, bool] = {}
+_worker: asyncio.Task | None = None
+
+
+def readiness() -> dict[str, bool]:
+    """Current readiness flags from cached results (unknown counts as not ready).
+
+    A service is ready while at least one of its nodes/replicas is.
+    """
+    ace = [u.last for name, u in _upstreams.items() if name.startswith("acestep@")]
+    ollama = [u.last for name, u in _upstreams.items() if name.startswith("ollama@")]
+    return {
+        "acestep": any(r and r.ok for r in ace),
+        "ollama": any(r and r.ok for r in ollama),
+        "lyrics_model": any(r and r.ok and r.details.get("model_ready") for r in ollama),
+    }
+
+
+def _publish_if_changed():
+    global _readiness
+    current = readiness()
+    if current == _readiness:
+        return
+    _readiness = current
+    for queue in _subscribers:
+        queue.put_nowait(current)
+
+
+async def lyrics_model_ready() -> bool:
+    """Whether any Ollama replica has the lyrics model (re-probing stale replicas first)."""
+    stale = [u.get() for name, u in _upstreams.items() if name.startswith("ollama@") and not u.fresh()]
+    if stale:
+        await asyncio.gather(*stale)
+        _publish_if_changed()
+    return readiness()["lyrics_model"]
+
+
+async def probe_all():
+    """Probe every upstream in parallel."""
+    await asyncio.gather(*(u.check() for u in _upstreams.values()))
+    _publish_if_changed()
+
+
+async def snapshot() -> dict:
+    """Per-upstream state for /api/health, refreshing stale entries first."""
+    stale = [u.get() for u in _upstreams.values() if not u.fresh()]
+    if stale:
+        await asyncio.gather(*stale)
+        _publish_if_changed()
+    return {name: u.snapshot() for name, u in _upstreams.items()}
+
+
+def subscribe() -> asyncio.Queue:
+    queue: asyncio.Queue = asyncio.Queue()
+    _subscribers.add(queue)
+    return queue
+
+
+def unsubscribe(queue: asyncio.Queue):
+    _subscribers.discard(queue)
+
+
+async def _run():
+    while True:
+        try:
+            await probe_all()
+        except Exception:
+            logger.exception("Health probe failed")
+        await asyncio.sleep(settings.health_probe_interval)
+
+
+def start():
+    global _worker
+    _worker = asyncio.create_task(_run())
+
+
+async def stop():
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+    _worker = None
@@ -0,0 +1,164 @@
+"""Full-text and faceted search over generation history.
+
+Postgres matches ``websearch_to_tsquery`` against the expression GIN index
+declared in ``models`` (``SEARCH_DOCUMENT``). SQLite (local dev / tests)
+falls back to an FTS5 external-content table kept in sync by triggers.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import ColumnElement, String, cast, func, literal, select, text, union_all
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.models import Generation, SEARCH_DOCUMENT, SEARCH_CONFIG
+
+# BPM facet buckets are this wide: 120 → "120-139"
+BPM_BUCKET = 20
+
+_SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE generations_fts USING fts5("
+    "prompt, lyrics, content='generations', content_rowid='id')",
+    "CREATE TRIGGER generations_fts_ai AFTER INSERT ON generations BEGIN "
+    "INSERT INTO generations_fts(rowid, prompt, lyrics) VALUES (new.id, new.prompt, new.lyrics); END",
+    "CREATE TRIGGER generations_fts_ad AFTER DELETE ON generations BEGIN "
+    "INSERT INTO generations_fts(generations_fts, rowid, prompt, lyrics) "
+    "VALUES ('delete', old.id, old.prompt, old.lyrics); END",
+    "CREATE TRIGGER generations_fts_au AFTER UPDATE OF prompt, lyrics ON generations BEGIN "
+    "INSERT INTO generations_fts(generations_fts, rowid, prompt, lyrics) "
+    "VALUES ('delete', old.id, old.prompt, old.lyrics); "
+    "INSERT INTO generations_fts(rowid, prompt, lyrics) VALUES (new.id, new.prompt, new.lyrics); END",
+    "INSERT INTO generations_fts(generations_fts) VALUES ('rebuild')",
+]
+
+
+@dataclass
+class SearchFilters:
+    q: str = ""
+    vocal_language: str | None = None
+    key_scale: str | None = None
+    status: str | None = None
+    bpm_min: int | None = None
+    bpm_max: int | None = None
+    created_from: datetime | None = None
+    created_to: datetime | None = None
+
+
+async def setup(conn: AsyncConnection):
+    """Create the SQLite FTS5 fallback index if needed (Postgres uses the model's GIN index)."""
+    if conn.dialect.name != "sqlite":
+        return
+    exists = (await conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'generations_fts'")
+    )).first()
+    if exists:
+        return
+    for ddl in _SQLITE_FTS_DDL:
+        await conn.execute(text(ddl))
+
+
+def _sqlite_match(q: str) -> str:
+    # Quote every term so user input can't inject FTS5 query syntax
+    return " ".join('"{}"'.format(term.replace('"', '""')) for term in q.split())
+
+
+def _text_clause(dialect: str, q: str) -> tuple[ColumnElement | None, ColumnElement | None]:
+    """Full-text match for ``q`` (None when blank) and its relevance expression (Postgres only)."""
+    if not q.strip():
+        return None, None
+    if dialect == "postgresql":
+        query = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+        return SEARCH_DOCUMENT.op("@@")(query), func.ts_rank(SEARCH_DOCUMENT, query)
+    matches = text("SELECT rowid FROM generations_fts WHERE generations_fts MATCH :fts_q")
+    return Generation.id.in_(matches.bindparams(fts_q=_sqlite_match(q))), None
+
+
+def _facet_clauses(f: SearchFilters, columns) -> dict[str, list[ColumnElement]]:
+    """Filters on facet columns, by facet; ``columns`` is the model or a CTE's ``.c``."""
+    by_facet: dict[str, list[ColumnElement]] = {"vocal_language": [], "key_scale": [], "status": [], "bpm": []}
+    if f.vocal_language:
+        by_facet["vocal_language"].append(columns.vocal_language == f.vocal_language)
+    if f.key_scale:
+        by_facet["key_scale"].append(columns.key_scale == f.key_scale)
+    if f.status:
+        by_facet["status"].append(columns.status == f.status)
+    if f.bpm_min is not None:
+        by_facet["bpm"].append(columns.bpm >= f.bpm_min)
+    if f.bpm_max is not None:
+        by_facet["bpm"].append(columns.bpm <= f.bpm_max)
+    return by_facet
+
+
+def _common_clauses(dialect: str, f: SearchFilters) -> tuple[list[ColumnElement], ColumnElement | None]:
+    """Filters that aren't facets (text, creation time), plus the relevance expression."""
+    clauses: list[ColumnElement] = []
+    match, rank = _text_clause(dialect, f.q)
+    if match is not None:
+        clauses.append(match)
+    if f.created_from is not None:
+        clauses.append(Generation.created_at >= f.created_from)
+    if f.created_to is not None:
+        clauses.append(Generation.created_at < f.created_to)
+    return clauses, rank
+
+
+def where_clauses(dialect: str, f: SearchFilters) -> tuple[list[ColumnElement], ColumnElement | None]:
+    """WHERE clauses for the filters, plus a relevance expression when there is a text query."""
+    clauses, rank = _common_clauses(dialect, f)
+    for facet_clauses in _facet_clauses(f, Generation).values():
+        clauses.extend(facet_clauses)
+    return clauses, rank
+
+
+async def facet_counts(db: AsyncSession, f: SearchFilters) -> tuple[dict[str, dict[str, int]], int]:
+    """Counts per value of every facet, and the number of matching rows, in a single query.
+
+    Each facet is counted with every filter applied except its own, so
+    picking a language still shows how many results the other languages
+    would give.
+    """
+    common, _ = _common_clauses(db.bind.dialect.name, f)
+    matched = select(
+        Generation.vocal_language,
+        Generation.key_scale,
+        Generation.status,
+        Generation.bpm,
+        # Cast so every UNION ALL branch yields a string value column
+        cast((Generation.bpm // BPM_BUCKET) * BPM_BUCKET, String).label("bpm_bucket"),
+    ).where(*common).cte("matched")
+    by_facet = _facet_clauses(f, matched.c)
+
+    def others(name: str) -> list[ColumnElement]:
+        return [c for facet_name, clauses in by_facet.items() if facet_name != name for c in clauses]
+
+    def facet(name: str, column):
+        return (
+            select(literal(name).label("facet"), column.label("value"), func.count().label("n"))
+            .select_from(matched)
+            .where(*others(name))
+            .group_by(column)
+        )
+
+    stmt = union_all(
+        facet("vocal_language", matched.c.vocal_language),
+        facet("key_scale", matched.c.key_scale),
+        facet("status", matched.c.status),
+        facet("bpm", matched.c.bpm_bucket),
+        select(literal("total"), cast(literal(""), String), func.count())
+        .select_from(matched)
+        .where(*others("")),
+    )
+
+    facets: dict[str, dict[str, int]] = {"vocal_language": {}, "key_scale": {}, "status": {}, "bpm": {}}
+    total = 0
+    for row in await db.execute(stmt):
+        if row.facet == "total":
+            total = row.n
+            continue
+        if row.value is None or row.value == "":
+            continue
+        value = row.value
+        if row.facet == "bpm":
+            value = f"{int(value)}-{int(value) + BPM_BUCKET - 1}"
+        facets[row.facet][str(value)] = row.n
+    return facets, total
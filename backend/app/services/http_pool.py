@@ -0,0 +1,193 @@
+"""Long-lived pooled HTTP clients, one per upstream service.
+
+Clients are created once in the app lifespan and reused by every request,
+so status polls and audio fetches ride on kept-alive connections instead
+of opening a new TCP connection per call.
+"""
+
+import asyncio
+import logging
+import time
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    """Request counters and connection-wait timings for one upstream pool."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0  # sent and not closed yet (streamed responses count until read or closed)
+        self.queued = 0  # in flight, still waiting for a pooled connection
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.waits = 0
+
+    def record_wait(self, seconds: float):
+        self.waits += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+
+class _CountedStream(httpx.AsyncByteStream):
+    """Response body that calls ``on_close`` once it's closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._on_close()
+
+
+class _InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """Transport that counts requests in flight and measures how long each waits for a pooled connection.
+
+    httpcore emits its first trace event only once a connection has been
+    assigned (either ``connect_tcp`` for a new one or ``send_request_headers``
+    for a reused one), so the gap between entering the pool and that event
+    is the pool wait time, during which the request counts as queued. After
+    that it holds a connection (is active) until its response is closed.
+    """
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        acquired = False
+        finished = False
+        user_trace = request.extensions.get("trace")
+
+        async def trace(event: str, info: dict):
+            nonlocal acquired
+            if not acquired:
+                acquired = True
+                self.stats.queued -= 1
+                self.stats.record_wait(time.perf_counter() - started)
+            if user_trace is not None:
+                await user_trace(event, info)
+
+        def finish():
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            self.stats.in_flight -= 1
+            if not acquired:  # failed or cancelled while waiting for a connection
+                self.stats.queued -= 1
+
+        request.extensions["trace"] = trace
+        self.stats.requests += 1
+        self.stats.in_flight += 1
+        self.stats.queued += 1
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            self.stats.errors += 1
+            finish()
+            raise
+        except asyncio.CancelledError:
+            finish()
+            raise
+        response.stream = _CountedStream(response.stream, finish)
+        return response
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class UpstreamPool:
+    """A named, lazily started ``httpx.AsyncClient`` with pool statistics."""
+
+    def __init__(self, name: str, timeout: httpx.Timeout):
+        self.name = name
+        self.timeout = timeout
+        self.stats = PoolStats()
+        self._client: httpx.AsyncClient | None = None
+
+    def start(self):
+        if self._client is not None:
+            return
+        http2 = settings.http2
+        if http2 and not _http2_available():
+            logger.warning("HTTP/2 requested but 'h2' is not installed; using HTTP/1.1 for %s", self.name)
+            http2 = False
+        limits = httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry,
+        )
+        transport = _InstrumentedTransport(self.stats, limits=limits, http2=http2)
+        self._client = httpx.AsyncClient(timeout=self.timeout, transport=transport)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Start on first use so scripts and tests work without the lifespan
+        if self._client is None:
+            self.start()
+        return self._client
+
+    def snapshot(self) -> dict:
+        """Current pool occupancy plus cumulative request/wait counters."""
+        s = self.stats
+        return {
+            "active": s.in_flight - s.queued,
+            "queued": s.queued,
+            "in_flight": s.in_flight,
+            "requests": s.requests,
+            "errors": s.errors,
+            "wait_avg_ms": round(s.wait_total / s.waits * 1000, 3) if s.waits else 0.0,
+            "wait_max_ms": round(s.wait_max * 1000, 3),
+        }
+
+
+_pools: dict[str, UpstreamPool] = {}
+
+
+def get_pool(name: str, timeout: httpx.Timeout) -> UpstreamPool:
+    """Return the shared pool for an upstream, registering it on first use."""
+    pool = _pools.get(name)
+    if pool is None:
+        pool = _pools[name] = UpstreamPool(name, timeout)
+    return pool
+
+
+def startup():
+    """Open every registered upstream client."""
+    for pool in _pools.values():
+        pool.start()
+
+
+async def shutdown():
+    """Close every upstream client and release its connections."""
+    for pool in _pools.values():
+        await pool.close()
+
+
+def stats() -> dict:
+    """Per-upstream pool statistics keyed by upstream name."""
+    return {name: pool.snapshot() for name, pool in _pools.items()}
@@ -0,0 +1,302 @@
+"""Opt-in cache of generated lyrics (``lyrics_cache_enabled``).
+
+Requests are keyed on a normalized ``(theme, language, genre, mood, model,
+temperature)``: case, punctuation, spacing and filler words in the theme
+don't matter, so "Summer love!" and "a song about summer love" share a
+key; word order does ("love summer" is another theme). Each
+key keeps up to ``lyrics_cache_variants`` different lyrics; until a key
+has its full set every request generates (and adds) a new one, after that
+a random variant is served, so repeated requests still vary.
+
+Memory is bounded by ``lyrics_cache_max_keys`` with LRU eviction, and
+variants expire after ``lyrics_cache_ttl``. With ``lyrics_cache_persist``
+variants are also stored in the ``lyrics_cache`` table (the newest
+``lyrics_cache_variants`` per key; the leader drops expired rows hourly)
+and reloaded on startup. While no worker is using any Ollama replica, a
+background task fills in missing variants for the most requested keys.
+
+With several workers, new variants are broadcast so every worker's cache
+fills up, and only the leader prefetches (going by the popularity it sees
+itself — its share of the traffic).
+"""
+
+import asyncio
+import hashlib
+import logging
+import random
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
+
+from app.config import settings
+from app.database import async_session
+from app.models import LyricsCacheEntry
+from app.services import coordination, ollama_client, ollama_nodes
+
+logger = logging.getLogger(__name__)
+
+PRUNE_INTERVAL = 3600.0  # how often the leader drops expired rows from the table (s)
+
+# Words that don't change what a theme is about
+_FILLER = {"a", "an", "the", "about", "of", "song", "lyrics", "and", "in", "on", "for", "with"}
+_NON_WORD = re.compile(r"[^\w\s]+")
+
+
+@dataclass
+class LyricsParams:
+    theme: str
+    language: str
+    genre: str
+    mood: str
+
+
+@dataclass
+class _Entry:
+    params: LyricsParams
+    variants: list[tuple[str, float]] = field(default_factory=list)  # (lyrics, created wall time)
+    requests: float = 0.0  # decayed popularity
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.prefetched = 0
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": settings.lyrics_cache_enabled,
+            "keys": len(_entries),
+            "variants": sum(len(e.variants) for e in _entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "prefetched": self.prefetched,
+        }
+
+
+stats = CacheStats()
+_entries: OrderedDict[str, _Entry] = OrderedDict()  # key → entry, least recently used first
+_worker: asyncio.Task | None = None
+_persisting: set[asyncio.Task] = set()
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def cache_key(p: LyricsParams) -> str:
+    words = _normalize(p.theme).split()
+    theme_words = [w for w in words if w not in _FILLER] or words
+    parts = [
+        " ".join(theme_words),
+        _normalize(p.language),
+        _normalize(p.genre),
+        _normalize(p.mood),
+        settings.ollama_model,
+        str(ollama_client.TEMPERATURE),
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+def _live_variants(entry: _Entry) -> list[tuple[str, float]]:
+    cutoff = time.time() - settings.lyrics_cache_ttl
+    entry.variants = [v for v in entry.variants if v[1] >= cutoff]
+    return entry.variants
+
+
+def _touch(key: str) -> _Entry | None:
+    entry = _entries.get(key)
+    if entry is not None:
+        _entries.move_to_end(key)
+    return entry
+
+
+def _entry(key: str, p: LyricsParams) -> _Entry:
+    """The entry for a key, created (evicting the least recently used) if missing."""
+    entry = _touch(key)
+    if entry is None:
+        entry = _entries[key] = _Entry(p)
+        while len(_entries) > settings.lyrics_cache_max_keys:
+            _entries.popitem(last=False)
+            stats.evictions += 1
+    return entry
+
+
+def lookup(p: LyricsParams) -> str | None:
+    """A cached variant once the key has its full set, else None (generate a new one).
+
+    A miss on an unknown key doesn't create an entry; ``store`` does once
+    there are lyrics to keep, so one-off themes can't evict popular keys.
+    """
+    entry = _touch(cache_key(p))
+    if entry is None:
+        stats.misses += 1
+        return None
+    entry.requests += 1
+    variants = _live_variants(entry)
+    if len(variants) >= settings.lyrics_cache_variants:
+        stats.hits += 1
+        return random.choice(variants)[0]
+    stats.misses += 1
+    return None
+
+
+def _add(key: str, p: LyricsParams, lyrics: str, created: float) -> bool:
+    entry = _entry(key, p)
+    variants = _live_variants(entry)
+    if any(text == lyrics for text, _ in variants):
+        return False
+    variants.append((lyrics, created))
+    del variants[:-settings.lyrics_cache_variants]
+    return True
+
+
+def store(p: LyricsParams, lyrics: str):
+    """Add a freshly generated variant (also persisted when enabled) and share it with the other workers."""
+    lyrics = lyrics.strip()
+    if not settings.lyrics_cache_enabled or not lyrics:
+        return
+    key = cache_key(p)
+    created = time.time()
+    if not _add(key, p, lyrics, created):
+        return
+    if settings.lyrics_cache_persist:
+        task = asyncio.create_task(_persist(key, p, lyrics))
+        _persisting.add(task)
+        task.add_done_callback(_persisting.discard)
+    coordination.publish("lyrics", key=key, params=[p.theme, p.language, p.genre, p.mood],
+                         lyrics=lyrics, created=created)
+
+
+def _on_remote_store(message: dict):
+    if settings.lyrics_cache_enabled:
+        _add(message["key"], LyricsParams(*message["params"]), message["lyrics"], message["created"])
+
+
+async def _persist(key: str, p: LyricsParams, lyrics: str):
+    try:
+        async with async_session() as session:
+            session.add(LyricsCacheEntry(
+                key=key, theme=p.theme, language=p.language, genre=p.genre, mood=p.mood,
+                model=settings.ollama_model, lyrics=lyrics,
+            ))
+            await session.flush()
+            newest = (
+                select(LyricsCacheEntry.id)
+                .where(LyricsCacheEntry.key == key)
+                .order_by(LyricsCacheEntry.created_at.desc(), LyricsCacheEntry.id.desc())
+                .limit(settings.lyrics_cache_variants)
+            )
+            await session.execute(
+                delete(LyricsCacheEntry).where(LyricsCacheEntry.key == key, LyricsCacheEntry.id.not_in(newest))
+            )
+            await session.commit()
+    except Exception:
+        logger.exception("Persisting lyrics cache entry failed")
+
+
+def get(p: LyricsParams, fresh: bool = False) -> str | None:
+    """Cached lyrics to serve for a request, or None to generate (and ``store``) new ones."""
+    if not settings.lyrics_cache_enabled:
+        return None
+    if fresh:
+        stats.bypassed += 1
+        return None
+    return lookup(p)
+
+
+async def _prune_expired():
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.lyrics_cache_ttl)
+    async with async_session() as session:
+        await session.execute(delete(LyricsCacheEntry).where(LyricsCacheEntry.created_at < cutoff))
+        await session.commit()
+
+
+async def _load():
+    """Reload unexpired variants from the table, dropping expired rows."""
+    await _prune_expired()
+    async with async_session() as session:
+        rows = await session.execute(
+            select(LyricsCacheEntry)
+            .where(LyricsCacheEntry.model == settings.ollama_model)
+            .order_by(LyricsCacheEntry.created_at)
+        )
+        for row in rows.scalars():
+            p = LyricsParams(row.theme, row.language, row.genre, row.mood)
+            entry = _entry(row.key, p)
+            created = row.created_at if row.created_at.tzinfo else row.created_at.replace(tzinfo=timezone.utc)
+            entry.variants.append((row.lyrics, created.timestamp()))
+            del entry.variants[:-settings.lyrics_cache_variants]
+
+
+async def _prefetch():
+    """While Ollama is idle, add one variant to each popular key that is missing some."""
+    wanted = [
+        e for e in _entries.values()
+        if e.requests >= settings.lyrics_cache_prefetch_min_requests
+        and len(_live_variants(e)) < settings.lyrics_cache_variants
+    ]
+    for entry in sorted(wanted, key=lambda e: e.requests, reverse=True):
+        if not ollama_nodes.idle():
+            return
+        p = entry.params
+        store(p, await ollama_client.generate_lyrics(p.theme, p.language, p.genre, p.mood))
+        stats.prefetched += 1
+
+
+async def _run():
+    interval = settings.lyrics_cache_prefetch_interval
+    pruned = time.monotonic()
+    while True:
+        await asyncio.sleep(interval if interval > 0 else PRUNE_INTERVAL)
+        if interval > 0:
+            try:
+                await _prefetch()
+            except Exception as e:
+                logger.warning("Lyrics prefetch failed: %s", e)
+            for entry in _entries.values():
+                entry.requests *= 0.5  # popularity decays every interval
+        if settings.lyrics_cache_persist and time.monotonic() - pruned >= PRUNE_INTERVAL:
+            pruned = time.monotonic()
+            try:
+                await _prune_expired()
+            except Exception as e:
+                logger.warning("Pruning the lyrics cache table failed: %s", e)
+
+
+async def start():
+    if not settings.lyrics_cache_enabled:
+        return
+    if settings.lyrics_cache_persist:
+        await _load()
+    coordination.subscribe("lyrics", _on_remote_store)
+    if settings.lyrics_cache_prefetch_interval > 0 or settings.lyrics_cache_persist:
+        coordination.add_leader_role("lyrics_cache", _leader_role, stop)
+
+
+async def _leader_role():
+    global _worker
+    _worker = asyncio.create_task(_run())
+
+
+async def stop():
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+    _worker = None
@@ -0,0 +1,204 @@
+"""Prometheus metrics, exposed in the text format at /metrics.
+
+A deliberately small in-process implementation (counters, gauges,
+histograms with fixed buckets) so instrumenting a hot path costs a dict
+lookup and a bisect, cheap enough to leave on in production
+(``metrics_enabled``). Gauges over state other modules already keep
+(task statuses, queue depth, breakers, pools) read it at scrape time
+through a callback instead of being updated on every change.
+
+``MetricsMiddleware`` times every HTTP request by route template up to
+the response headers (so long-lived SSE streams don't skew it) and counts
+response bytes per route, which covers audio served to clients.
+"""
+
+import bisect
+import time
+from collections.abc import Callable, Iterable
+
+from app.config import settings
+
+# Seconds; request and upstream latencies
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Seconds; generation queue and run times
+GENERATION_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+Labels = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Labels = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        _registry.append(self)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Labels = ()):
+        super().__init__(name, help, labels)
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        return self.header() + [
+            f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in self.values.items()
+        ]
+
+
+class Gauge(_Metric):
+    """Gauge read at scrape time from ``collect()`` → {label values: value}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Labels, collect: Callable[[], dict[Labels, float]]):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        return self.header() + [
+            f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in self.collect().items()
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Labels = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.values: dict[Labels, list] = {}  # labels → [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *labels: str):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for key, series in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), series):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+_registry: list[_Metric] = []
+
+http_duration = Histogram(
+    "http_request_duration_seconds", "Time from request to response headers", ("method", "route", "status")
+)
+http_response_bytes = Counter("http_response_bytes_total", "Response body bytes sent", ("route",))
+upstream_duration = Histogram(
+    "upstream_request_duration_seconds", "Latency of one upstream call attempt", ("endpoint", "node")
+)
+upstream_errors = Counter(
+    "upstream_errors_total", "Failed upstream call attempts and breaker rejections", ("endpoint", "node", "error")
+)
+db_session_duration = Histogram("db_session_duration_seconds", "Lifetime of request-scoped DB sessions")
+db_query_duration = Histogram("db_query_duration_seconds", "Time spent executing one SQL statement")
+generation_queue_seconds = Histogram(
+    "generation_queue_seconds", "Wait in the backend queue before dispatch to ACE-Step",
+    buckets=GENERATION_BUCKETS,
+)
+generation_upstream_seconds = Histogram(
+    "generation_upstream_seconds", "Dispatch to ACE-Step until the task finished", ("status",),
+    buckets=GENERATION_BUCKETS,
+)
+generation_run_seconds = Histogram(
+    "generation_run_seconds", "Time a task was seen running on the GPU", ("status",),
+    buckets=GENERATION_BUCKETS,
+)
+status_updates = Counter(
+    "status_updates_total", "Status row changes: buffered, coalesced into a buffered row, flushed", ("outcome",)
+)
+audio_responses = Counter(
+    "audio_responses_total", "Audio responses by rendition served (original or a preview transcode)", ("rendition",)
+)
+audio_fetched_bytes = Counter("audio_fetched_bytes_total", "Audio bytes downloaded from ACE-Step", ("node",))
+retention_deleted = Counter(
+    "retention_deleted_generations_total", "Generations deleted, by policy or through the API", ("reason",)
+)
+retention_reaped = Counter("retention_reaped_tasks_total", "Stale queued/running tasks failed because ACE-Step lost them")
+retention_reclaimed_bytes = Counter(
+    "retention_reclaimed_bytes_total", "Disk space freed by deletes and garbage collection", ("area",)
+)
+
+
+def split_endpoint(name: str) -> tuple[str, str]:
+    """"acestep.query_result@host:port" → ("acestep.query_result", "host:port")."""
+    endpoint, _, node = name.partition("@")
+    return endpoint, node
+
+
+def render() -> str:
+    lines: list[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency and response bytes."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.metrics_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        sent = 0
+
+        def route() -> str:
+            # Route template, not the raw path, to keep label cardinality bounded
+            matched = scope.get("route")
+            return getattr(matched, "path", "unmatched")
+
+        async def send_wrapper(message):
+            nonlocal sent
+            if message["type"] == "http.response.start":
+                http_duration.observe(time.perf_counter() - started, scope["method"], route(), str(message["status"]))
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if sent:
+                http_response_bytes.inc(route(), amount=sent)
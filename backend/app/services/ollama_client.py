@@ -1,10 +1,30 @@
-"""HTTP client for Ollama — used for song lyrics generation."""
+"""HTTP client for Ollama — used for song lyrics generation.
+
+Requests are routed across the Ollama replicas by services/ollama_nodes;
+replicas that lack the model get it pulled (and warmed) in the background.
+"""
+
+import asyncio
+import json
+import logging
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import TypeVar
 
 import httpx
 
 from app.config import settings
+from app.services import coordination, http_pool, ollama_nodes, resilience
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+TIMEOUT = httpx.Timeout(connect=settings.upstream_connect_timeout, read=120.0, write=10.0, pool=10.0)
+
+_pool = http_pool.get_pool("ollama", TIMEOUT)
 
-TIMEOUT = httpx.Timeout(connect=10.0, read=120.0, write=10.0, pool=10.0)
+# Sampling temperature for lyrics (part of the lyrics cache key)
+TEMPERATURE = 0.9
 
 # Language name mapping for the prompt
 _LANG_NAMES = {
@@ -34,64 +54,181 @@ def _build_user_prompt(theme: str, language: str, genre: str, mood: str) -> str:
     return "\n".join(parts)
 
 
-async def generate_lyrics(theme: str, language: str, genre: str, mood: str) -> str:
-    """Generate song lyrics via Ollama chat endpoint.
-
-    Returns the generated lyrics text.
-    """
-    user_prompt = _build_user_prompt(theme, language, genre, mood)
-
-    payload = {
+def _chat_payload(theme: str, language: str, genre: str, mood: str, stream: bool) -> dict:
+    return {
         "model": settings.ollama_model,
         "messages": [
             {"role": "system", "content": _SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt},
+            {"role": "user", "content": _build_user_prompt(theme, language, genre, mood)},
         ],
-        "stream": False,
+        "stream": stream,
+        # Keep the model resident between requests to avoid cold loads
+        "keep_alive": settings.ollama_keep_alive,
         "options": {
-            "temperature": 0.9,
+            "temperature": TEMPERATURE,
             "top_p": 0.95,
         },
     }
 
-    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-        resp = await client.post(f"{settings.ollama_url}/api/chat", json=payload)
+
+async def _on_best_replica(send: Callable[[ollama_nodes.Replica], Awaitable[T]]) -> tuple[T, ollama_nodes.Replica]:
+    """Run a chat request on the best replica, moving on to the next one if
+    a replica can't be reached at all (the request never got there)."""
+    error: Exception | None = None
+    for replica in ollama_nodes.candidates("chat"):
+        try:
+            return await resilience.call(
+                f"ollama.chat@{replica.name}", lambda: send(replica), idempotent=False
+            ), replica
+        except (resilience.CircuitOpen, httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            error = e
+    raise error
+
+
+async def generate_lyrics(theme: str, language: str, genre: str, mood: str) -> str:
+    """Generate song lyrics via Ollama chat endpoint.
+
+    Returns the generated lyrics text.
+    """
+    payload = _chat_payload(theme, language, genre, mood, stream=False)
+
+    async def send(replica: ollama_nodes.Replica) -> httpx.Response:
+        with ollama_nodes.outstanding(replica):
+            resp = await _pool.client.post(f"{replica.url}/api/chat", json=payload)
         resp.raise_for_status()
-        data = resp.json()
-        return data.get("message", {}).get("content", "")
+        return resp
 
+    resp, _ = await _on_best_replica(send)
+    data = resp.json()
+    return data.get("message", {}).get("content", "")
+
+
+class ChatStream:
+    """An open streaming chat response, counted against its replica until closed."""
+
+    def __init__(self, resp: httpx.Response, replica: ollama_nodes.Replica):
+        self.resp = resp
+        self.replica = replica
+        self._closed = False
+        ollama_nodes.acquire(replica)
+
+    async def aclose(self):
+        if self._closed:
+            return
+        self._closed = True
+        ollama_nodes.release(self.replica)
+        await self.resp.aclose()
 
-async def ensure_model_pulled() -> bool:
-    """Pull the lyrics model if it's not already downloaded. Returns True on success."""
-    try:
-        async with httpx.AsyncClient(timeout=httpx.Timeout(connect=10, read=600, write=10, pool=10)) as client:
-            resp = await client.post(
-                f"{settings.ollama_url}/api/pull",
-                json={"name": settings.ollama_model, "stream": False},
-            )
-            return resp.status_code == 200
-    except Exception:
-        return False
 
+async def open_lyrics_stream(theme: str, language: str, genre: str, mood: str) -> ChatStream:
+    """Start a streaming chat request. Caller must close the stream.
 
-async def is_model_ready() -> bool:
-    """Check whether the configured lyrics model is downloaded and available."""
+    Closing it before the final chunk drops the connection, which makes
+    Ollama stop generating.
+    """
+    payload = _chat_payload(theme, language, genre, mood, stream=True)
+
+    async def send(replica: ollama_nodes.Replica) -> httpx.Response:
+        req = _pool.client.build_request("POST", f"{replica.url}/api/chat", json=payload)
+        resp = await _pool.client.send(req, stream=True)
+        if resp.is_error:
+            await resp.aread()
+            await resp.aclose()
+            resp.raise_for_status()
+        return resp
+
+    resp, replica = await _on_best_replica(send)
+    return ChatStream(resp, replica)
+
+
+async def iter_chat_chunks(stream: ChatStream) -> AsyncIterator[dict]:
+    """Parse Ollama's NDJSON chat stream. The last chunk has ``done: true`` and timing stats."""
+    async for line in stream.resp.aiter_lines():
+        if not line.strip():
+            continue
+        chunk = json.loads(line)
+        if "error" in chunk:
+            raise RuntimeError(chunk["error"])
+        yield chunk
+
+
+async def ensure_model_pulled(replica: str | None = None) -> bool:
+    """Pull the lyrics model onto a replica if it's not already downloaded. Returns True on success."""
+    target = ollama_nodes.get(replica)
     try:
-        async with httpx.AsyncClient(timeout=httpx.Timeout(5.0)) as client:
-            resp = await client.get(f"{settings.ollama_url}/api/tags")
-            if resp.status_code != 200:
-                return False
-            models = resp.json().get("models", [])
-            return any(settings.ollama_model in m.get("name", "") for m in models)
+        resp = await _pool.client.post(
+            f"{target.url}/api/pull",
+            json={"name": settings.ollama_model, "stream": False},
+            timeout=httpx.Timeout(connect=10, read=600, write=10, pool=10),
+        )
+        return resp.status_code == 200
     except Exception:
         return False
 
 
-async def health_check() -> bool:
-    """Check if Ollama is reachable."""
+async def warm_model(replica: str | None = None) -> bool:
+    """Load the lyrics model into memory on a replica (empty generate request)."""
+    target = ollama_nodes.get(replica)
     try:
-        async with httpx.AsyncClient(timeout=httpx.Timeout(5.0)) as client:
-            resp = await client.get(f"{settings.ollama_url}/api/tags")
-            return resp.status_code == 200
+        resp = await _pool.client.post(
+            f"{target.url}/api/generate",
+            json={"model": settings.ollama_model, "keep_alive": settings.ollama_keep_alive},
+            timeout=httpx.Timeout(connect=10, read=300, write=10, pool=10),
+        )
+        return resp.status_code == 200
     except Exception:
         return False
+
+
+async def _prepare(replica: ollama_nodes.Replica):
+    if not replica.model_pulled:
+        logger.info("Pulling %s on Ollama replica %s", settings.ollama_model, replica.name)
+        if not await ensure_model_pulled(replica.name):
+            logger.warning("Pull of %s on %s failed", settings.ollama_model, replica.name)
+            return
+        replica.model_pulled = True
+    if settings.ollama_warm and not replica.model_loaded and await warm_model(replica.name):
+        replica.model_loaded = True
+
+
+def maintain(replica: ollama_nodes.Replica):
+    """Pull and/or warm the lyrics model on a replica in the background if it needs it.
+
+    Never blocks the caller; at most one job per replica at a time, and only
+    on the leader worker (services/coordination), so N workers don't pull N times.
+    """
+    if not coordination.is_leader() or replica.maintenance is not None or not replica.healthy:
+        return
+    if replica.model_pulled and (replica.model_loaded or not settings.ollama_warm):
+        return
+    replica.maintenance = asyncio.create_task(_prepare(replica))
+    replica.maintenance.add_done_callback(lambda _: setattr(replica, "maintenance", None))
+
+
+async def stop():
+    """Cancel background pulls/warm-ups."""
+    jobs = [r.maintenance for r in ollama_nodes.replicas() if r.maintenance is not None]
+    for job in jobs:
+        job.cancel()
+    await asyncio.gather(*jobs, return_exceptions=True)
+
+
+async def list_local_models(replica: str | None = None, timeout: float = 5.0) -> list[str]:
+    """Names of the models a replica has downloaded; raises if it is unreachable."""
+    target = ollama_nodes.get(replica)
+    resp = await _pool.client.get(f"{target.url}/api/tags", timeout=httpx.Timeout(timeout))
+    resp.raise_for_status()
+    return [m.get("name", "") for m in resp.json().get("models", [])]
+
+
+async def list_loaded_models(replica: str | None = None, timeout: float = 5.0) -> list[str]:
+    """Names of the models a replica currently holds in memory (/api/ps)."""
+    target = ollama_nodes.get(replica)
+    resp = await _pool.client.get(f"{target.url}/api/ps", timeout=httpx.Timeout(timeout))
+    resp.raise_for_status()
+    return [m.get("name", "") for m in resp.json().get("models", [])]
+
+
+def has_model(names: list[str]) -> bool:
+    """Whether the configured lyrics model is among ``names``."""
+    return any(settings.ollama_model in name for name in names)
@@ -0,0 +1,135 @@
+"""Pool of Ollama replicas with model-aware, least-outstanding routing.
+
+``settings.ollama_urls`` (comma-separated) lists the replicas; without it
+``ollama_url`` is the only one. The background probes (services/health)
+record per replica whether ``ollama_model`` is downloaded (/api/tags) and
+resident in memory (/api/ps).
+
+Requests go to the usable replica with the lowest score: requests we have
+outstanding there, plus ``ollama_cold_load_penalty`` if the model would
+have to be loaded first. Replicas without the model are a last resort.
+
+Every worker broadcasts its outstanding counts when they change, so
+``idle`` can tell whether any worker is using Ollama.
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+from app.config import settings
+from app.services import coordination, resilience
+
+# Forget another worker's load after this long without an update (it may have died mid-request)
+REMOTE_LOAD_TTL = 300.0
+
+
+@dataclass
+class Replica:
+    name: str
+    url: str
+    healthy: bool = True  # until a probe says otherwise
+    model_pulled: bool = True  # assumed until the first probe
+    model_loaded: bool = False
+    outstanding: int = 0
+    served: int = 0
+    maintenance: asyncio.Task | None = None  # background pull / warm-up
+
+    @property
+    def score(self) -> int:
+        return self.outstanding + (0 if self.model_loaded else settings.ollama_cold_load_penalty)
+
+    def breaker(self, endpoint: str) -> resilience.CircuitBreaker:
+        return resilience.breaker(f"ollama.{endpoint}@{self.name}")
+
+
+_replicas: dict[str, Replica] = {}
+_remote: dict[str, float] = {}  # worker with requests outstanding → when it said so (monotonic)
+
+
+def replicas() -> list[Replica]:
+    if not _replicas:
+        urls = [u.strip().rstrip("/") for u in settings.ollama_urls.split(",") if u.strip()]
+        for url in urls or [settings.ollama_url.rstrip("/")]:
+            name = urlparse(url).netloc or url
+            _replicas.setdefault(name, Replica(name, url))
+    return list(_replicas.values())
+
+
+def get(name: str | None) -> Replica:
+    """Replica by name; the first one for unknown names."""
+    all_replicas = replicas()
+    return _replicas.get(name or "", all_replicas[0])
+
+
+def candidates(endpoint: str = "chat") -> list[Replica]:
+    """Replicas to try for a request, best first."""
+    def rank(r: Replica):
+        usable = r.healthy and r.breaker(endpoint).available()
+        return (not usable, not r.model_pulled, r.score, r.served)
+    return sorted(replicas(), key=rank)
+
+
+def acquire(replica: Replica):
+    """Count a request against the replica until ``release``."""
+    replica.outstanding += 1
+    replica.served += 1
+    _announce()
+
+
+def release(replica: Replica):
+    replica.outstanding -= 1
+    _announce()
+
+
+@contextmanager
+def outstanding(replica: Replica):
+    """Count a request against the replica while it runs."""
+    acquire(replica)
+    try:
+        yield replica
+    finally:
+        release(replica)
+
+
+def _announce():
+    coordination.publish("ollama_load", outstanding=sum(r.outstanding for r in replicas()))
+
+
+def _on_remote_load(message: dict):
+    if message["outstanding"]:
+        _remote[message["from"]] = time.monotonic()
+    else:
+        _remote.pop(message["from"], None)
+
+
+def idle() -> bool:
+    """No worker has a request outstanding on any replica."""
+    if any(r.outstanding for r in replicas()):
+        return False
+    cutoff = time.monotonic() - REMOTE_LOAD_TTL
+    for node, since in list(_remote.items()):
+        if since < cutoff:
+            del _remote[node]
+    return not _remote
+
+
+coordination.subscribe("ollama_load", _on_remote_load)
+coordination.add_reconnect_hook(_remote.clear)  # updates may have been missed; busy workers announce again
+
+
+def snapshot() -> dict:
+    return {
+        r.name: {
+            "url": r.url,
+            "healthy": r.healthy,
+            "model_pulled": r.model_pulled,
+            "model_loaded": r.model_loaded,
+            "outstanding": r.outstanding,
+            "served": r.served,
+            "maintenance": r.maintenance is not None,
+        }
+        for r in replicas()
+    }
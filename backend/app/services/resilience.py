@@ -0,0 +1,259 @@
+"""Shared resilience layer for upstream calls: circuit breakers, retries,
+deadlines and hedged requests.
+
+Every upstream endpoint gets its own circuit breaker. After
+``breaker_failure_threshold`` consecutive transient failures it opens and
+calls fail fast with CircuitOpen for ``breaker_reset_timeout`` seconds;
+then one trial call is let through (half-open) and its outcome closes or
+re-opens the breaker. This keeps requests from piling up behind connect
+timeouts while a GPU node restarts.
+
+Transient failures (transport errors, 429/5xx) are retried with jittered
+exponential backoff — any of them for idempotent calls, only "never
+reached the server" connect errors otherwise. A deadline set with
+``deadline()`` bounds every attempt and backoff sleep below it, so a
+handler's time budget carries through to the upstream call.
+"""
+
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from collections.abc import Awaitable, Callable
+from contextlib import contextmanager
+from typing import TypeVar
+
+import httpx
+
+from app.config import settings
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Absolute time.monotonic() deadline for upstream work in the current request
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("upstream_deadline", default=None)
+
+
+class CircuitOpen(Exception):
+    """The upstream endpoint's breaker is open; ``retry_after`` is when it will next try."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable (circuit open)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_inflight = False
+        self.total_failures = 0
+        self.rejected = 0
+
+    def available(self) -> bool:
+        """Whether a call would be let through now (without claiming the half-open trial)."""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= settings.breaker_reset_timeout
+        return not self.trial_inflight
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go through now."""
+        if self.state == "closed":
+            return
+        elapsed = time.monotonic() - self.opened_at
+        if self.state == "open" and elapsed >= settings.breaker_reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open" and not self.trial_inflight:
+            self.trial_inflight = True
+            return
+        self.rejected += 1
+        raise CircuitOpen(self.name, max(settings.breaker_reset_timeout - elapsed, 1.0))
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info("Circuit %s closed", self.name)
+        self.state = "closed"
+        self.failures = 0
+        self.trial_inflight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.total_failures += 1
+        self.trial_inflight = False
+        if self.state == "half_open" or self.failures >= settings.breaker_failure_threshold:
+            if self.state != "open":
+                logger.warning("Circuit %s opened after %d failures", self.name, self.failures)
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """The call ended without a verdict (cancelled); let another trial through."""
+        self.trial_inflight = False
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "total_failures": self.total_failures,
+            "rejected": self.rejected,
+            "open_for_s": round(time.monotonic() - self.opened_at, 1) if self.state != "closed" else None,
+        }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+stats = {"retries": 0, "hedged": 0, "hedge_wins": 0, "deadline_exceeded": 0}
+
+
+def breaker(name: str) -> CircuitBreaker:
+    """The breaker for one upstream endpoint, e.g. "acestep.query_result"."""
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name)
+    return _breakers[name]
+
+
+def breakers_snapshot() -> dict:
+    return {name: b.snapshot() for name, b in sorted(_breakers.items())}
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Bound upstream work in this block to ``seconds`` (never loosens an outer deadline)."""
+    at = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(at if outer is None else min(at, outer))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """Seconds left before the current deadline, or None if there is none."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Failures worth retrying and counting against the breaker."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return isinstance(exc, (httpx.TransportError, TimeoutError))
+
+
+def _never_sent(exc: BaseException) -> bool:
+    # Safe to retry even non-idempotent calls: the request never reached the server
+    return isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+def _backoff(attempt: int) -> float:
+    # "Full jitter": uniform over [0, capped exponential]
+    return random.uniform(0, min(settings.upstream_retry_max_delay, settings.upstream_retry_base_delay * 2**attempt))
+
+
+async def hedge(op: Callable[[], Awaitable[T]], delay: float, discard: Callable[[T], Awaitable] | None = None) -> T:
+    """Run ``op``; if it hasn't finished after ``delay`` seconds, race a second copy.
+
+    The first success wins and the other copy is cancelled; ``discard``
+    releases a losing result that completed anyway (e.g. closes a response).
+    """
+    tasks = [asyncio.create_task(op())]
+    winner: asyncio.Task | None = None
+
+    def release_loser(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is None and discard:
+            asyncio.create_task(discard(task.result()))
+
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            stats["hedged"] += 1
+            tasks.append(asyncio.create_task(op()))
+        pending = set(tasks)
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                elif winner is None:
+                    winner = task
+            if winner is not None:
+                if winner is not tasks[0]:
+                    stats["hedge_wins"] += 1
+                return winner.result()
+        raise error
+    finally:
+        for task in tasks:
+            if task is not winner:
+                task.cancel()
+                task.add_done_callback(release_loser)
+
+
+async def call(
+    name: str,
+    op: Callable[[], Awaitable[T]],
+    *,
+    idempotent: bool,
+    hedge_after: float | None = None,
+    discard: Callable[[T], Awaitable] | None = None,
+) -> T:
+    """Call an upstream endpoint through its breaker, with retries and the current deadline.
+
+    ``op`` should raise for HTTP error statuses (``raise_for_status``) so
+    5xx responses count as failures.
+    """
+    cb = breaker(name)
+    endpoint, node = metrics.split_endpoint(name)
+    attempt = 0
+    while True:
+        left = remaining()
+        if left is not None and left <= 0:
+            stats["deadline_exceeded"] += 1
+            raise TimeoutError(f"{name}: deadline exceeded")
+        try:
+            cb.before_call()
+        except CircuitOpen:
+            metrics.upstream_errors.inc(endpoint, node, "CircuitOpen")
+            raise
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(left):
+                if hedge_after:
+                    result = await hedge(op, hedge_after, discard)
+                else:
+                    result = await op()
+        except asyncio.CancelledError:
+            cb.release()
+            raise
+        except Exception as e:
+            metrics.upstream_duration.observe(time.perf_counter() - started, endpoint, node)
+            metrics.upstream_errors.inc(endpoint, node, type(e).__name__)
+            if not is_transient(e):
+                cb.record_success()  # it answered; the request itself was bad
+                raise
+            cb.record_failure()
+            if isinstance(e, TimeoutError) and remaining() is not None and remaining() <= 0:
+                stats["deadline_exceeded"] += 1
+                raise
+            if attempt >= settings.upstream_retries or not (idempotent or _never_sent(e)):
+                raise
+            delay = _backoff(attempt)
+            left = remaining()
+            if left is not None and delay >= left:
+                raise
+            attempt += 1
+            stats["retries"] += 1
+            logger.info("Retrying %s in %.2fs after %s (attempt %d)", name, delay, type(e).__name__, attempt)
+            await asyncio.sleep(delay)
+        else:
+            metrics.upstream_duration.observe(time.perf_counter() - started, endpoint, node)
+            cb.record_success()
+            return result
@@ -0,0 +1,374 @@
+"""Retention policies and garbage collection of generations and audio.
+
+Every ``retention_interval`` the leader (services/coordination) runs a pass:
+
+1. Reap stale tasks: generations still queued/running on ACE-Step
+   ``retention_stale_after`` after dispatch are looked up on their node;
+   those it no longer knows (restarted, lost) are failed, so they stop
+   being polled and release their queue slot.
+2. Mark: one streaming read of every ``audio_paths`` counts the
+   references to each local audio file and collects the ACE-Step paths
+   not yet ingested.
+3. Retention: finished generations older than ``retention_max_age_days``
+   (``retention_failed_max_age_days`` for failed ones) are deleted, then
+   the oldest ones while the library is larger than ``retention_max_bytes``
+   (sparing those younger than the sweep grace period).
+   A deleted generation's files go with it once no other generation
+   references them (seeded duplicates share audio) and they are older
+   than the sweep grace period; younger ones are left to a later sweep.
+4. Sweep: library files nothing references, peaks and renditions of audio
+   that is gone, dangling refs and scratch files are removed, and so are
+   ACE-Step's own output files when its output directory is mounted at
+   ``acestep_cache_dir``. Nothing modified within ``retention_sweep_grace``
+   is swept, which covers ingestion in progress.
+
+Rows are deleted in batches of ``retention_batch_size``, each its own short
+transaction, so a large purge never holds locks for long. The delete
+endpoints go through ``delete_generations`` too.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path, PurePosixPath
+
+from sqlalchemy import delete, func, select, true
+
+from app.config import settings
+from app.database import async_session
+from app.models import Generation
+from app.services import (
+    acestep_client, audio_ingest, audio_store, coordination, metrics, resilience, status_poller, status_writer,
+)
+
+logger = logging.getLogger(__name__)
+
+# Only these are ever swept from ACE-Step's output directory, whatever else is mounted there
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".flac", ".ogg", ".opus", ".m4a", ".aac"}
+# Audio files looked up per reference query
+REFERENCE_CHECK_CHUNK = 500
+
+
+class RetentionStats:
+    def __init__(self):
+        self.runs = 0
+        self.last_run_at: datetime | None = None
+        self.last_run_seconds = 0.0
+        self.reaped = 0
+        self.deleted: dict[str, int] = {}  # reason → generations
+        self.reclaimed_bytes: dict[str, int] = {}  # area → bytes
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": settings.retention_interval > 0,
+            "running": _worker is not None,
+            "runs": self.runs,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_run_seconds": round(self.last_run_seconds, 3),
+            "reaped_tasks": self.reaped,
+            "deleted": dict(self.deleted),
+            "reclaimed_bytes": dict(self.reclaimed_bytes),
+        }
+
+
+stats = RetentionStats()
+_worker: asyncio.Task | None = None
+
+
+def _key(audio_id: str) -> int:
+    # 64 bits of the digest: a collision only keeps a file that could have gone
+    return int(audio_id[:16], 16)
+
+
+def _local_ids(audio_paths) -> list[str]:
+    return [url.rsplit("/", 1)[-1] for url in audio_paths or () if audio_ingest.source_path(url) is None]
+
+
+def _reclaimed(freed: dict[str, int]):
+    for area, size in freed.items():
+        if size:
+            stats.reclaimed_bytes[area] = stats.reclaimed_bytes.get(area, 0) + size
+            metrics.retention_reclaimed_bytes.inc(area, amount=size)
+
+
+class _Marks:
+    """Result of a mark pass: references to each local audio file, ACE-Step paths in use."""
+
+    def __init__(self):
+        self.refs: Counter = Counter()
+        self.sources: set[str] = set()
+        self.last_id = 0  # generations up to this id are counted
+
+    def referenced(self, audio_id: str) -> bool:
+        return self.refs[_key(audio_id)] > 0
+
+
+async def _mark(marks: _Marks | None = None) -> _Marks:
+    """Count the references of every generation, or with ``marks``, of those created since."""
+    marks = marks or _Marks()
+    async with async_session() as session:
+        result = await session.stream(
+            select(Generation.id, Generation.audio_paths)
+            .where(Generation.id > marks.last_id, Generation.audio_paths.is_not(None))
+            .execution_options(yield_per=1000)
+        )
+        async for gen_id, audio_paths in result:
+            marks.last_id = max(marks.last_id, gen_id)
+            for url in audio_paths or ():
+                source = audio_ingest.source_path(url)
+                if source is None:
+                    marks.refs[_key(url.rsplit("/", 1)[-1])] += 1
+                else:
+                    marks.sources.add(source)
+    return marks
+
+
+def _buffered_ids() -> set[str]:
+    """Local audio ids in ``audio_paths`` changes not yet flushed to the table (ingestion)."""
+    return {a for paths in status_writer.buffered("audio_paths") for a in _local_ids(paths)}
+
+
+async def _unreferenced(audio_ids: set[str]) -> list[str]:
+    """Those of ``audio_ids`` no generation references any more, in the table or in
+    changes still waiting in the status writer."""
+    candidates = {audio_ingest.local_url(a): a for a in audio_ids - _buffered_ids()}
+    urls = list(candidates)
+    used: set[str] = set()
+    async with async_session() as session:
+        # One pass over the audio_paths elements per chunk, matching whole URLs
+        elements = _audio_path_elements(session.bind.dialect.name)
+        for i in range(0, len(urls), REFERENCE_CHECK_CHUNK):
+            chunk = urls[i:i + REFERENCE_CHECK_CHUNK]
+            rows = await session.execute(
+                select(elements.c.value)
+                .select_from(Generation)
+                .join(elements, true())  # a table function may refer to the rows before it
+                .where(elements.c.value.in_(chunk))
+                .distinct()
+            )
+            used.update(rows.scalars())
+    return [audio_id for url, audio_id in candidates.items() if url not in used]
+
+
+def _audio_path_elements(dialect: str):
+    """The elements of every generation's ``audio_paths`` array, as a table with a ``value`` column."""
+    if dialect == "postgresql":
+        elements = func.json_array_elements_text(Generation.audio_paths)
+    else:
+        elements = func.json_each(Generation.audio_paths)
+    return elements.table_valued("value")
+
+
+def _remove_files(audio_ids: list[str]) -> dict[str, int]:
+    freed: dict[str, int] = {}
+    for audio_id in audio_ids:
+        for area, size in audio_store.remove(audio_id, settings.retention_sweep_grace).items():
+            freed[area] = freed.get(area, 0) + size
+    return freed
+
+
+async def delete_generations(*criteria, reason: str, marks: _Marks | None = None,
+                             max_rows: int | None = None) -> tuple[int, dict[str, int]]:
+    """Delete the generations matching ``criteria``, oldest first, in batches, with their audio
+    files unless other generations still reference them.
+
+    ``marks`` (from a mark pass) is kept up to date and saves looking the
+    files up again. Stops after ``max_rows`` rows if given. Returns the
+    number of rows deleted and bytes freed per area.
+    """
+    deleted = 0
+    audio_ids: list[str] = []
+    freed: dict[str, int] = {}
+    while max_rows is None or deleted < max_rows:
+        limit = settings.retention_batch_size
+        if max_rows is not None:
+            limit = min(limit, max_rows - deleted)
+        async with async_session() as session:
+            rows = (await session.execute(
+                select(Generation.id, Generation.audio_paths)
+                .where(*criteria)
+                .order_by(Generation.created_at, Generation.id)
+                .limit(limit)
+            )).all()
+            if not rows:
+                break
+            await session.execute(delete(Generation).where(Generation.id.in_([r.id for r in rows])))
+            await session.commit()
+        deleted += len(rows)
+        metrics.retention_deleted.inc(reason, amount=len(rows))
+        stats.deleted[reason] = stats.deleted.get(reason, 0) + len(rows)
+        for r in rows:
+            audio_ids.extend(_local_ids(r.audio_paths))
+        if marks is not None:
+            # Release files as we go, so a long purge frees space early
+            await _mark(marks)  # generations created since may share the files
+            for audio_id in audio_ids:
+                marks.refs[_key(audio_id)] -= 1
+            # The marks miss older rows whose audio_paths ingestion has rewritten since, flushed
+            # or not; remove() spares files ingested within the grace period for those
+            orphans = [a for a in set(audio_ids) - _buffered_ids() if not marks.referenced(a)]
+            audio_ids.clear()
+            for area, size in (await asyncio.to_thread(_remove_files, orphans)).items():
+                freed[area] = freed.get(area, 0) + size
+        if len(rows) < limit:
+            break
+
+    if audio_ids:
+        orphans = await _unreferenced(set(audio_ids))
+        for area, size in (await asyncio.to_thread(_remove_files, orphans)).items():
+            freed[area] = freed.get(area, 0) + size
+    if deleted:
+        _reclaimed(freed)
+        coordination.publish("history_changed")
+        logger.info("Deleted %d generations (%s), freed %d bytes", deleted, reason, sum(freed.values()))
+    return deleted, freed
+
+
+async def reap_stale() -> int:
+    """Fail queued/running tasks that have been on ACE-Step too long and that it no longer knows."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.retention_stale_after)
+    async with async_session() as session:
+        rows = (await session.execute(
+            select(Generation.task_id, Generation.upstream_task_id, Generation.node, Generation.status)
+            .where(
+                Generation.status.in_(("queued", "running")),
+                func.coalesce(Generation.dispatched_at, Generation.created_at) < cutoff,
+            )
+        )).all()
+
+    by_node: dict[str, dict[str, str]] = {}  # node → upstream id → task id
+    for r in rows:
+        r = status_writer.apply(r)
+        state = status_poller.lookup(r.task_id)
+        if r.status in status_poller.TERMINAL or (state is not None and state.status in status_poller.TERMINAL):
+            continue
+        by_node.setdefault(r.node or "", {})[r.upstream_task_id or r.task_id] = r.task_id
+
+    reaped = 0
+    size = settings.status_poll_batch_size
+    for node, tasks in by_node.items():
+        upstream_ids = list(tasks)
+        for i in range(0, len(upstream_ids), size):
+            chunk = upstream_ids[i:i + size]
+            try:
+                with resilience.deadline(settings.upstream_deadline):
+                    results = await acestep_client.query_task(chunk, node)
+            except Exception as e:
+                logger.warning("Stale task check on node %s failed: %s", node or "default", e)
+                break
+            if all(t.get("task_id") for t in results):
+                known = {t["task_id"] for t in results}
+            elif len(results) >= len(chunk):
+                known = set(chunk)  # no ids echoed, but nothing is missing
+            else:
+                continue  # can't tell which ones are missing
+            for upstream_id in chunk:
+                if upstream_id not in known:
+                    status_poller.fail(tasks[upstream_id], "Task lost by ACE-Step")
+                    reaped += 1
+    if reaped:
+        stats.reaped += reaped
+        metrics.retention_reaped.inc(amount=reaped)
+        logger.warning("Failed %d stale tasks unknown to ACE-Step", reaped)
+    return reaped
+
+
+def _sweep_acestep_cache(sources: set[str], grace: float) -> dict[str, int]:
+    """Delete ACE-Step output files no generation references (blocking)."""
+    root = Path(settings.acestep_cache_dir)
+    upstream_root = PurePosixPath(settings.acestep_cache_path)  # the same directory in ACE-Step's paths
+    cutoff = time.time() - grace
+    freed = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = Path(dirpath) / name
+            if path.suffix.lower() not in AUDIO_EXTENSIONS:
+                continue
+            if str(upstream_root / path.relative_to(root).as_posix()) in sources:
+                continue
+            try:
+                st = path.stat()
+                if st.st_mtime >= cutoff:
+                    continue
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            freed += st.st_size
+    return {"acestep_cache": freed}
+
+
+async def collect():
+    """One full pass: reap stale tasks, apply the retention policies, mark and sweep."""
+    started = time.monotonic()
+    await reap_stale()
+
+    marks = await _mark()
+    terminal = Generation.status.in_(status_poller.TERMINAL)
+    now = datetime.now(timezone.utc)
+    if settings.retention_max_age_days > 0:
+        cutoff = now - timedelta(days=settings.retention_max_age_days)
+        await delete_generations(terminal, Generation.created_at < cutoff, reason="age", marks=marks)
+    if settings.retention_failed_max_age_days > 0:
+        cutoff = now - timedelta(days=settings.retention_failed_max_age_days)
+        await delete_generations(
+            Generation.status == "failed", Generation.created_at < cutoff, reason="failed_age", marks=marks,
+        )
+    if settings.retention_max_bytes > 0:
+        # Spare the newest, still being ingested, analyzed and transcoded
+        settled = Generation.created_at < now - timedelta(seconds=settings.retention_sweep_grace)
+        excess = await asyncio.to_thread(audio_store.library_bytes) - settings.retention_max_bytes
+        while excess > 0:
+            deleted, freed = await delete_generations(
+                terminal, settled, reason="size", marks=marks, max_rows=settings.retention_batch_size,
+            )
+            if not deleted:
+                break
+            excess -= freed.get("library", 0)
+
+    await _mark(marks)
+    grace = settings.retention_sweep_grace
+    freed = await asyncio.to_thread(audio_store.sweep, marks.referenced, grace)
+    if settings.acestep_cache_dir:
+        freed.update(await asyncio.to_thread(_sweep_acestep_cache, marks.sources, grace))
+    _reclaimed(freed)
+
+    stats.runs += 1
+    stats.last_run_at = datetime.now(timezone.utc)
+    stats.last_run_seconds = time.monotonic() - started
+    logger.info("Garbage collection took %.1fs, swept %d bytes", stats.last_run_seconds, sum(freed.values()))
+
+
+async def _run():
+    while True:
+        await asyncio.sleep(settings.retention_interval)
+        try:
+            await collect()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Garbage collection failed")
+
+
+async def _lead():
+    global _worker
+    _worker = asyncio.create_task(_run())
+
+
+async def start():
+    """Run garbage collection on the leader."""
+    if settings.retention_interval > 0:
+        coordination.add_leader_role("retention", _lead, stop)
+
+
+async def stop():
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+    _worker = None
@@ -0,0 +1,631 @@
+"""Backend job queue with admission control in front of ACE-Step.
+
+Generation requests are stored as ``pending`` rows in the ``generations``
+table and handed to ACE-Step by a single dispatcher, which keeps at most
+``scheduler_max_inflight`` tasks (and ``scheduler_max_inflight_cost`` cost
+units) per ACE-Step node on the GPUs at once. It claims a row (``pending``
+→ ``dispatching``) before submitting it, so a job whose row was deleted is
+dropped instead of sent to the GPU.
+
+Fairness: each client has a virtual clock advanced by the cost of every
+job it gets dispatched; the next job always comes from the client with the
+lowest clock (start-time fair queuing), so a client flooding the queue
+only delays itself.
+
+Batch jobs (``enqueue_many``) get their own lane per client, ``batch:<client>``,
+so a catalog batch competes as one more client instead of crowding out the
+interactive requests of its owner or anyone else. They are admitted against
+``batch_max_pending`` instead of the interactive queue limits.
+
+Cost: ``duration × batch_size × inference_steps``, normalized
+so a 60 s, single-variant, 8-step render is 1.0 unit. Throughput in units/s is
+learned from finished tasks and used for queue ETAs and Retry-After.
+
+With several workers, the queue lives on the leader (services/coordination).
+Followers insert the ``pending`` row and announce it ("enqueued"); the
+leader picks it up from the table. A new leader counts rows still
+``dispatching`` as in flight on the node they were claimed for, since the
+deposed leader may be submitting them, and queues them again if that
+leader never finishes; a single worker restarting queues them again at
+once. Followers admit requests against the queue summary the leader
+broadcasts after every change.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import httpx
+from sqlalchemy import insert, select, update
+
+from app.config import settings
+from app.database import async_session
+from app.models import Generation
+from app.services import (
+    acestep_client, acestep_nodes, coordination, metrics, resilience, status_poller, status_writer,
+)
+
+logger = logging.getLogger(__name__)
+
+# Duration assumed when the request leaves it to ACE-Step
+DEFAULT_DURATION = 60.0
+_UNIT = DEFAULT_DURATION * 1 * 8
+
+
+class QueueFull(Exception):
+    """Admission refused; ``retry_after`` is the suggested wait in seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class Job:
+    task_id: str
+    client_id: str
+    cost: float
+    payload: dict
+    enqueued: float
+    batch_id: str | None = None
+
+
+_queues: dict[str, deque[Job]] = {}  # client id → pending jobs, oldest first
+_clock: dict[str, float] = {}  # client id → virtual time
+_now = 0.0  # virtual time of the last dispatch
+_inflight: dict[str, tuple[float, float, str]] = {}  # task id → (cost, dispatched monotonic, node)
+_throughput = 0.0  # learned cost units per second (EWMA); 0 until the first completion
+_wakeup = asyncio.Event()
+_worker: asyncio.Task | None = None
+_remote: dict = {}  # followers: the leader's last queue summary
+_adopting: set[asyncio.Task] = set()
+_settling: set[asyncio.Task] = set()  # rows a previous leader was dispatching
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(dt: datetime) -> datetime:
+    # SQLite hands back naive datetimes
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def estimate_cost(payload: dict) -> float:
+    duration = payload.get("audio_duration") or DEFAULT_DURATION
+    return duration * payload.get("batch_size", 1) * payload.get("inference_steps", 8) / _UNIT
+
+
+def _rate() -> float:
+    return _throughput or settings.scheduler_default_throughput
+
+
+def _pending_jobs() -> int:
+    return sum(len(q) for q in _queues.values())
+
+
+def _pending_cost() -> float:
+    return sum(job.cost for q in _queues.values() for job in q)
+
+
+def _interactive_cost() -> float:
+    return sum(job.cost for q in _queues.values() for job in q if job.batch_id is None)
+
+
+def _pending_batch_jobs() -> int:
+    return sum(1 for q in _queues.values() for job in q if job.batch_id is not None)
+
+
+def batch_lane(client_id: str) -> str:
+    """Queue lane (stored as ``client_id``) for a client's batch jobs."""
+    return f"batch:{client_id}"[:64]
+
+
+def _inflight_cost() -> float:
+    return sum(cost for cost, _, _ in _inflight.values())
+
+
+def _node_inflight() -> dict[str, tuple[int, float]]:
+    """Node name → (tasks, cost units) we have in flight there."""
+    per_node: dict[str, tuple[int, float]] = {}
+    for cost, _, node in _inflight.values():
+        tasks, total = per_node.get(node, (0, 0.0))
+        per_node[node] = (tasks + 1, total + cost)
+    return per_node
+
+
+def _push(job: Job):
+    queue = _queues.get(job.client_id)
+    if not queue:
+        queue = _queues[job.client_id] = deque()
+        # A client (re)joining starts at the current virtual time: no banking credit while idle
+        _clock[job.client_id] = max(_clock.get(job.client_id, 0.0), _now)
+    queue.append(job)
+
+
+def _next_job() -> Job:
+    client = min(_queues, key=lambda c: (_clock[c], _queues[c][0].enqueued))
+    return _queues[client][0]
+
+
+def _dispatch_order() -> list[Job]:
+    """Simulate the fair scheduler over the current queue to get the dispatch order."""
+    clocks = {c: _clock[c] for c in _queues}
+    heads = {c: 0 for c in _queues}
+    order = []
+    total = _pending_jobs()
+    while len(order) < total:
+        client = min(
+            (c for c in _queues if heads[c] < len(_queues[c])),
+            key=lambda c: (clocks[c], _queues[c][heads[c]].enqueued),
+        )
+        job = _queues[client][heads[client]]
+        heads[client] += 1
+        clocks[client] += job.cost
+        order.append(job)
+    return order
+
+
+def _summary() -> dict:
+    """What admission control needs to know about the queue."""
+    limit = settings.scheduler_max_pending_per_client
+    return {
+        "interactive_cost": _interactive_cost(),
+        "inflight_cost": _inflight_cost(),
+        "pending_batch": _pending_batch_jobs(),
+        "rate": _rate(),
+        # Only clients at their limit, to keep the broadcast small: (pending jobs, cost of the oldest)
+        "full_clients": {c: [len(q), q[0].cost] for c, q in _queues.items() if len(q) >= limit},
+        "stats": _local_stats(),
+    }
+
+
+def _view() -> dict:
+    # Followers hold no queue and go by the leader's last summary
+    return _remote if _remote and not coordination.is_leader() else _summary()
+
+
+def _publish_positions():
+    """Push queue position and ETA to every pending task's listeners, and the queue summary to followers."""
+    ahead = _inflight_cost()
+    for position, job in enumerate(_dispatch_order(), start=1):
+        ahead += job.cost
+        status_poller.set_state(job.task_id, queue_position=position, eta_seconds=round(ahead / _rate(), 1))
+    _broadcast_summary()
+
+
+def _broadcast_summary():
+    if coordination.clustered():
+        summary = _summary()
+        if not coordination.publish("queue", **summary):
+            coordination.publish("queue", **{**summary, "full_clients": {}})
+
+
+def _on_summary(message: dict):
+    global _remote
+    if not coordination.is_leader():
+        _remote = message
+
+
+def _check_admission(client_id: str, cost: float):
+    view = _view()
+    interactive, rate = view["interactive_cost"], view["rate"]
+    backlog = interactive + view["inflight_cost"]
+    # An empty queue always takes a job, however expensive, so no valid request waits forever
+    if interactive and interactive + cost > settings.scheduler_max_queue_cost:
+        # Roughly when enough of the backlog has drained to fit this job (all of it, for a job over the limit)
+        wait = min(backlog, backlog - settings.scheduler_max_queue_cost + cost) / rate
+        raise QueueFull("Generation queue is full", retry_after=max(1.0, wait))
+    full = view["full_clients"].get(client_id)
+    if full and full[0] >= settings.scheduler_max_pending_per_client:
+        raise QueueFull("Too many queued generations for this client", retry_after=max(1.0, full[1] / rate))
+
+
+async def enqueue(payload: dict, client_id: str, **fields) -> Generation:
+    """Admit a job into the backend queue and persist it as a ``pending`` row.
+
+    ``fields`` are extra Generation columns (prompt, lyrics, ...). Raises
+    QueueFull when the GPU backlog is over budget.
+    """
+    cost = estimate_cost(payload)
+    _check_admission(client_id, cost)
+
+    gen = Generation(
+        task_id=str(uuid.uuid4()),
+        status="pending",
+        request_params=payload,
+        client_id=client_id,
+        cost=cost,
+        **fields,
+    )
+    async with async_session() as session:
+        session.add(gen)
+        await session.commit()
+        await session.refresh(gen)
+
+    status_poller.track(gen.task_id, "pending")
+    if not coordination.is_leader():
+        coordination.publish("enqueued", task_id=gen.task_id)
+        return gen
+    _push(Job(gen.task_id, client_id, cost, payload, time.monotonic()))
+    _publish_positions()
+    _wakeup.set()
+    return gen
+
+
+async def enqueue_many(items: list[tuple[dict, dict]], client_id: str, batch_id: str) -> list[str]:
+    """Admit a batch of ``(payload, fields)`` jobs with one bulk insert; returns their task ids.
+
+    Raises QueueFull when the batch backlog has no room for all of them.
+    """
+    view = _view()
+    pending = view["pending_batch"]
+    if pending + len(items) > settings.batch_max_pending:
+        # Roughly when enough batch jobs have drained to fit this batch
+        excess = pending + len(items) - settings.batch_max_pending
+        per_job = sum(estimate_cost(payload) for payload, _ in items) / len(items)
+        raise QueueFull(f"Batch queue is full ({pending} jobs waiting)", retry_after=max(1.0, excess * per_job / view["rate"]))
+
+    lane = batch_lane(client_id)
+    now = _utcnow()
+    rows = [
+        {
+            "task_id": str(uuid.uuid4()),
+            "status": "pending",
+            "request_params": payload,
+            "client_id": lane,
+            "cost": estimate_cost(payload),
+            "batch_id": batch_id,
+            "created_at": now,
+            **fields,
+        }
+        for payload, fields in items
+    ]
+    async with async_session() as session:
+        await session.execute(insert(Generation), rows)
+        await session.commit()
+
+    for row in rows:
+        status_poller.track(row["task_id"], "pending")
+    if not coordination.is_leader():
+        coordination.publish("enqueued", batch_id=batch_id)
+        return [row["task_id"] for row in rows]
+    enqueued = time.monotonic()
+    for row in rows:
+        _push(Job(row["task_id"], lane, row["cost"], row["request_params"], enqueued, batch_id))
+    _publish_positions()
+    _wakeup.set()
+    return [row["task_id"] for row in rows]
+
+
+def _nodes_with_room(job: Job) -> list[acestep_nodes.Node]:
+    """Nodes that can take ``job`` under their in-flight caps, best first (empty: wait)."""
+    per_node = _node_inflight()
+
+    def has_room(node: acestep_nodes.Node) -> bool:
+        tasks, cost = per_node.get(node.name, (0, 0.0))
+        if not tasks:
+            return True  # always let one job through, however expensive
+        return (
+            tasks < settings.scheduler_max_inflight
+            and cost + job.cost <= settings.scheduler_max_inflight_cost
+        )
+
+    candidates = acestep_nodes.candidates()
+    usable = [n for n in candidates if n.usable]
+    # A node that is down doesn't make room; only fall back to those when none is up
+    return [n for n in usable or candidates if has_room(n)]
+
+
+async def _claim(job: Job, node: str) -> bool:
+    """Mark the job's row as being dispatched, to ``node`` first. False if the row is gone or no
+    longer pending (deleted, or taken by another leader)."""
+    async with async_session() as session:
+        result = await session.execute(
+            update(Generation)
+            .where(Generation.task_id == job.task_id, Generation.status == "pending")
+            .values(status="dispatching", node=node)
+        )
+        await session.commit()
+    return result.rowcount == 1
+
+
+async def _unclaim(job: Job):
+    """Put a claimed job's row back to pending after a failed dispatch."""
+    async with async_session() as session:
+        await session.execute(
+            update(Generation)
+            .where(Generation.task_id == job.task_id, Generation.status == "dispatching")
+            .values(status="pending", node="")
+        )
+        await session.commit()
+
+
+async def _dispatched(job: Job, result: dict):
+    """Record a task ACE-Step has accepted. It is running the job from here on, so the claim
+    is never given back: if the row can't be updated now, the write goes through the
+    status writer, which retries it on every flush."""
+    upstream_id = result.get("task_id", "")
+    columns = {"status": "queued", "upstream_task_id": upstream_id, "node": result["node"], "dispatched_at": _utcnow()}
+    try:
+        async with async_session() as session:
+            updated = await session.execute(
+                update(Generation)
+                .where(Generation.task_id == job.task_id, Generation.status == "dispatching")
+                .values(**columns)
+            )
+            await session.commit()
+    except Exception as e:
+        logger.warning("Recording the dispatch of %s failed (%s); writing it behind", job.task_id, e)
+        status_writer.write(job.task_id, **columns)
+    else:
+        if updated.rowcount != 1:
+            logger.warning("Generation %s was deleted or taken back while being dispatched (ACE-Step task %s)",
+                           job.task_id, upstream_id)
+            return
+    _inflight[job.task_id] = (job.cost, time.monotonic(), result["node"])
+    metrics.generation_queue_seconds.observe(time.monotonic() - job.enqueued)
+    status_poller.dispatched(job.task_id, upstream_id, result.get("queue_position"), result["node"])
+
+
+async def _reject(job: Job, reason: str):
+    """Fail a job ACE-Step will never accept, so it doesn't block the queue."""
+    logger.warning("ACE-Step rejected %s: %s", job.task_id, reason)
+    now = _utcnow()
+    async with async_session() as session:
+        await session.execute(
+            update(Generation)
+            .where(Generation.task_id == job.task_id)
+            .values(status="failed", completed_at=now, generation_meta={"error": reason})
+        )
+        await session.commit()
+    status_poller.set_state(job.task_id, status="failed", completed_at=now, queue_position=None, eta_seconds=None)
+
+
+def _pop(job: Job):
+    queue = _queues[job.client_id]
+    queue.popleft()
+    if not queue:
+        del _queues[job.client_id]
+
+
+async def _dispatch_ready() -> bool:
+    """Dispatch as many jobs as the in-flight budget allows. Returns False if ACE-Step is unavailable."""
+    global _now
+    # A deposed leader stops dispatching at once, before its role is torn down
+    while _queues and coordination.is_leader():
+        job = _next_job()
+        nodes = _nodes_with_room(job)
+        if not nodes:
+            break
+        if not await _claim(job, nodes[0].name):
+            logger.info("Dropped %s from the queue: its row is gone or no longer pending", job.task_id)
+            _pop(job)
+            status_poller.forget(job.task_id)
+            _publish_positions()
+            continue
+        # Only the submit is bounded and retried: once ACE-Step has accepted the job, it stays dispatched
+        try:
+            with resilience.deadline(settings.upstream_deadline):
+                result = await acestep_client.submit_task(job.payload, nodes)
+        except httpx.HTTPStatusError as e:
+            if resilience.is_transient(e):
+                logger.warning("Dispatch of %s to ACE-Step failed (%s); will retry", job.task_id, e)
+                await _unclaim(job)
+                return False
+            await _reject(job, f"ACE-Step returned {e.response.status_code}: {e.response.text[:200]}")
+        except Exception as e:
+            logger.warning("Dispatch of %s to ACE-Step failed (%s); will retry", job.task_id, e)
+            await _unclaim(job)
+            return False
+        else:
+            await _dispatched(job, result)
+        _pop(job)
+        _now = _clock[job.client_id]
+        _clock[job.client_id] += job.cost
+        _publish_positions()
+    return True
+
+
+def _on_transition(state: status_poller.TaskState):
+    global _throughput
+    entry = _inflight.pop(state.task_id, None) if state.status in status_poller.TERMINAL else None
+    if entry is None:
+        return
+    cost, dispatched, _ = entry
+    metrics.generation_upstream_seconds.observe(time.monotonic() - dispatched, state.status)
+    if state.status == "succeeded":
+        sample = cost / max(time.monotonic() - dispatched, 1e-3)
+        _throughput = sample if not _throughput else 0.8 * _throughput + 0.2 * sample
+    _broadcast_summary()
+    _wakeup.set()
+
+
+_QUEUE_COLUMNS = (Generation.task_id, Generation.status, Generation.client_id, Generation.cost,
+                  Generation.request_params, Generation.dispatched_at, Generation.batch_id, Generation.node,
+                  Generation.upstream_task_id)
+
+
+def _job(row) -> Job:
+    cost = row.cost if row.cost is not None else estimate_cost(row.request_params or {})
+    return Job(row.task_id, row.client_id or "", cost, row.request_params or {}, time.monotonic(), row.batch_id)
+
+
+async def _load():
+    """Rebuild the queue and in-flight set from the table (after a restart or on becoming leader)."""
+    interrupted: list[Job] = []  # claimed rows no other worker can be dispatching
+    async with async_session() as session:
+        rows = await session.execute(
+            select(*_QUEUE_COLUMNS)
+            .where(Generation.status.in_(("pending", "dispatching", "queued", "running")))
+            .order_by(Generation.created_at, Generation.id)
+        )
+        for r in rows:
+            job = _job(r)
+            if r.status == "pending":
+                _push(job)
+            elif r.status == "dispatching" and r.upstream_task_id:
+                # Accepted by ACE-Step; the rest of the dispatch write never landed
+                _inflight[r.task_id] = (job.cost, time.monotonic(), acestep_nodes.get(r.node).name)
+                status_writer.write(r.task_id, status="queued")
+                status_poller.dispatched(r.task_id, r.upstream_task_id, node=r.node or "")
+            elif r.status == "dispatching" and coordination.clustered():
+                # Claimed by the previous leader, which may still be submitting it to the node it
+                # claimed it for: count it there until that is decided
+                _inflight[r.task_id] = (job.cost, time.monotonic(), acestep_nodes.get(r.node).name)
+                task = asyncio.create_task(_settle(job))
+                _settling.add(task)
+                task.add_done_callback(_settling.discard)
+            elif r.status == "dispatching":
+                interrupted.append(job)
+            else:
+                # Translate the wall-clock dispatch time onto the monotonic clock
+                age = (_utcnow() - _aware(r.dispatched_at)).total_seconds() if r.dispatched_at else 0.0
+                _inflight[r.task_id] = (job.cost, time.monotonic() - age, acestep_nodes.get(r.node).name)
+    # A single worker restarting mid-dispatch: whether ACE-Step got the job is unknown, queue it again
+    for job in interrupted:
+        await _unclaim(job)
+        _push(job)
+    _publish_positions()
+
+
+async def _settle(job: Job):
+    """Follow a row claimed by a previous leader until its dispatch is decided.
+
+    That dispatch is bounded by ``upstream_deadline``; a row still claimed
+    after that is taken back into the queue.
+    """
+    give_up = time.monotonic() + settings.upstream_deadline + 2 * settings.coordination_interval
+    while True:
+        async with async_session() as session:
+            row = (await session.execute(
+                select(Generation.status, Generation.upstream_task_id, Generation.node)
+                .where(Generation.task_id == job.task_id)
+            )).first()
+            if row is not None and row.status == "dispatching" and time.monotonic() >= give_up:
+                await session.execute(
+                    update(Generation)
+                    .where(Generation.task_id == job.task_id, Generation.status == "dispatching")
+                    .values(status="pending")
+                )
+                await session.commit()
+                continue
+        if row is None or row.status != "dispatching":
+            break
+        await asyncio.sleep(settings.coordination_interval)
+
+    if row is not None and row.status in ("queued", "running"):
+        _inflight[job.task_id] = (job.cost, time.monotonic(), acestep_nodes.get(row.node).name)
+        status_poller.dispatched(job.task_id, row.upstream_task_id, node=row.node or "")
+        return
+    _inflight.pop(job.task_id, None)
+    if row is None:
+        status_poller.forget(job.task_id)
+    elif row.status == "pending":
+        _push(job)
+    _publish_positions()
+    _wakeup.set()
+
+
+async def _run():
+    while True:
+        _wakeup.clear()
+        ok = await _dispatch_ready()
+        if not ok:
+            await asyncio.sleep(settings.scheduler_retry_interval)
+            continue
+        await _wakeup.wait()
+
+
+async def _adopt(task_id: str | None, batch_id: str | None):
+    """Queue the pending rows another worker inserted."""
+    query = select(*_QUEUE_COLUMNS).where(Generation.status == "pending")
+    if batch_id:
+        query = query.where(Generation.batch_id == batch_id).order_by(Generation.id)
+    else:
+        query = query.where(Generation.task_id == task_id)
+    async with async_session() as session:
+        rows = (await session.execute(query)).all()
+    # Already queued (or just dispatched) if our own load raced the announcement
+    queued = {job.task_id for q in _queues.values() for job in q}
+    for r in rows:
+        if r.task_id not in queued and r.task_id not in _inflight:
+            _push(_job(r))
+            status_poller.track(r.task_id, "pending")
+    _publish_positions()
+    _wakeup.set()
+
+
+def _on_enqueued(message: dict):
+    if not coordination.is_leader():
+        return
+    task = asyncio.create_task(_adopt(message.get("task_id"), message.get("batch_id")))
+    _adopting.add(task)
+    task.add_done_callback(_adopting.discard)
+
+
+def _reset():
+    global _now
+    _queues.clear()
+    _clock.clear()
+    _inflight.clear()
+    _now = 0.0
+
+
+async def _lead():
+    """Take over the queue from the table and start the dispatcher."""
+    global _worker
+    _reset()
+    await _load()
+    _worker = asyncio.create_task(_run())
+
+
+async def _resign():
+    tasks = [*_adopting, *_settling]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await stop()
+    _reset()
+
+
+async def start():
+    """Dispatch as the leader; follow the leader's queue summary otherwise. Call after status_poller.start()."""
+    status_poller.add_transition_hook(_on_transition)
+    coordination.add_leader_role("scheduler", _lead, _resign)
+    coordination.subscribe("enqueued", _on_enqueued)
+    coordination.subscribe("queue", _on_summary)
+
+
+async def stop():
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+    _worker = None
+
+
+def stats() -> dict:
+    return _view()["stats"]
+
+
+def _local_stats() -> dict:
+    return {
+        "pending": _pending_jobs(),
+        "pending_cost": round(_pending_cost(), 2),
+        "pending_batch": _pending_batch_jobs(),
+        "inflight": len(_inflight),
+        "inflight_cost": round(_inflight_cost(), 2),
+        "inflight_by_node": {
+            node: {"tasks": tasks, "cost": round(cost, 2)} for node, (tasks, cost) in _node_inflight().items()
+        },
+        "clients": len(_queues),
+        "throughput_units_per_s": round(_rate(), 4),
+    }
@@ -0,0 +1,476 @@
+"""Background worker that tracks in-flight ACE-Step tasks.
+
+A single loop polls /query_result for every non-terminal task — batched
+per owning ACE-Step node, all nodes concurrently — keeps the latest state
+in memory and writes only actual status changes back to the
+``generations`` table. The status endpoint reads from this state, so
+upstream load no longer scales with open browser tabs. Writes go through
+the write-behind buffer in services/status_writer.
+
+With several workers, only the leader (services/coordination) polls. It
+broadcasts every status change, and the position/ETA changes of tasks
+some follower has listeners for ("watch"); followers mirror those into
+their own state, so SSE and WebSocket clients can connect to any worker.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+from urllib.parse import urlparse, parse_qs
+
+from sqlalchemy import or_, select
+
+from app.config import settings
+from app.database import async_session
+from app.models import Generation
+from app.services import acestep_client, acestep_nodes, coordination, metrics, resilience, status_writer
+
+logger = logging.getLogger(__name__)
+
+TERMINAL = ("succeeded", "failed")
+
+# ACE-Step status codes → our status strings
+_STATUS_MAP = {0: "running", 1: "succeeded", 2: "failed"}
+
+
+@dataclass
+class TaskState:
+    task_id: str
+    status: str
+    audio_urls: list[str] = field(default_factory=list)
+    meta: dict | None = None
+    completed_at: datetime | None = None
+    queue_position: int | None = None
+    eta_seconds: float | None = None
+    # ACE-Step's id for the task; None while it waits in the backend queue
+    upstream_id: str | None = None
+    node: str = ""  # owning ACE-Step node
+    updated: float = field(default_factory=time.monotonic)
+    running_since: float | None = None  # monotonic; first poll that saw it running
+
+
+_tasks: dict[str, TaskState] = {}
+_subscribers: dict[str, set[asyncio.Queue]] = {}
+_transition_hooks: list[Callable[[TaskState], None]] = []
+_watched: dict[str, set[str]] = {}  # leader: task id → followers with listeners for it
+_resync: asyncio.Task | None = None
+_wakeup = asyncio.Event()
+_worker: asyncio.Task | None = None
+
+
+def parse_task(task: dict, node: str = "") -> tuple[str, list[str], dict | None]:
+    """Turn one ACE-Step query_result item into (status, audio_urls, meta).
+
+    Audio URLs carry the owning node so the proxy fetches from it.
+    """
+    status = _STATUS_MAP.get(task.get("status", 0), "running")
+    audio_urls: list[str] = []
+    meta = None
+
+    # Parse the result JSON string when task succeeded
+    if status == "succeeded" and task.get("result"):
+        try:
+            result_list = json.loads(task["result"]) if isinstance(task["result"], str) else task["result"]
+            for item in result_list:
+                file_path = item.get("file", "")
+                if file_path:
+                    # ACE-Step returns a relative URL like "/v1/audio?path=/app/.cache/.../x.mp3".
+                    # Extract just the real filesystem path so our proxy can fetch it cleanly.
+                    parsed = urlparse(file_path)
+                    actual_path = parse_qs(parsed.query).get("path", [file_path])[0]
+                    # No "/api" prefix — frontend audioUrl() adds it
+                    audio_urls.append(f"/music/audio?path={actual_path}&node={node}" if node
+                                      else f"/music/audio?path={actual_path}")
+                meta = item.get("metas")
+        except (json.JSONDecodeError, TypeError):
+            pass
+
+    return status, audio_urls, meta
+
+
+def _upstream_id(row) -> str | None:
+    # Rows created before the backend queue used ACE-Step's id as task_id
+    if row.upstream_task_id:
+        return row.upstream_task_id
+    return None if row.status in ("pending", "dispatching") else row.task_id
+
+
+def _live_status(row) -> str:
+    # "dispatching" is the scheduler's claim on a pending row; clients see it as pending
+    return "pending" if row.status == "dispatching" else row.status
+
+
+def track(task_id: str, status: str = "queued", audio_urls: list[str] | None = None,
+          meta: dict | None = None, queue_position: int | None = None,
+          upstream_id: str | None = None, node: str = "") -> TaskState:
+    """Start following a task; wakes the poller so it picks the task up promptly.
+
+    Tasks without an ``upstream_id`` are held in the backend queue and are
+    not polled until ``dispatched`` is called.
+    """
+    state = _tasks.get(task_id)
+    if state is None:
+        state = _tasks[task_id] = TaskState(
+            task_id, status, audio_urls or [], meta, queue_position=queue_position,
+            upstream_id=upstream_id, node=node,
+        )
+    if status not in TERMINAL and state.upstream_id:
+        _wakeup.set()
+    return state
+
+
+def set_state(task_id: str, **changes):
+    """Apply non-persisted changes (queue position, ETA, ...) and push them to listeners."""
+    state = _tasks.get(task_id)
+    if state is None:
+        return
+    if all(getattr(state, k) == v for k, v in changes.items()):
+        return
+    for key, value in changes.items():
+        setattr(state, key, value)
+    state.updated = time.monotonic()
+    _publish(state, position_only=changes.keys() <= _POSITION_FIELDS)
+
+
+def dispatched(task_id: str, upstream_id: str, queue_position: int | None = None, node: str = ""):
+    """Record that a backend-queued task was handed to an ACE-Step node and start polling it."""
+    state = _tasks.get(task_id) or track(task_id, "pending")
+    state.upstream_id = upstream_id
+    state.node = node
+    set_state(task_id, status="queued", queue_position=queue_position, eta_seconds=None)
+    _wakeup.set()
+
+
+def fail(task_id: str, reason: str):
+    """Mark a task failed without word from ACE-Step (it lost the task), as a poll would."""
+    state = _tasks.get(task_id) or track(task_id)
+    if state.status in TERMINAL:
+        return
+    state.status = "failed"
+    state.meta = {"error": reason}
+    state.completed_at = datetime.now(timezone.utc)
+    state.queue_position = None
+    state.eta_seconds = None
+    state.updated = time.monotonic()
+    _persist([state])
+    for hook in _transition_hooks:
+        hook(state)
+    _publish(state)
+
+
+def forget(task_id: str):
+    """Stop following a task whose row is gone."""
+    _tasks.pop(task_id, None)
+    _watched.pop(task_id, None)
+
+
+def subscribe(task_id: str, queue: asyncio.Queue | None = None) -> asyncio.Queue:
+    """Register a queue that receives a TaskState snapshot on every change of the task."""
+    queue = queue if queue is not None else asyncio.Queue()
+    queues = _subscribers.setdefault(task_id, set())
+    if not queues and not coordination.is_leader():
+        coordination.publish("watch", task_id=task_id)
+    queues.add(queue)
+    return queue
+
+
+def unsubscribe(task_id: str, queue: asyncio.Queue):
+    queues = _subscribers.get(task_id)
+    if queues is None:
+        return
+    queues.discard(queue)
+    if not queues:
+        del _subscribers[task_id]
+        if not coordination.is_leader():
+            coordination.publish("unwatch", task_id=task_id)
+
+
+def add_transition_hook(hook: Callable[[TaskState], None]):
+    """Call ``hook`` with the live state after each persisted status transition."""
+    _transition_hooks.append(hook)
+
+
+# Changes that are pushed to listeners but never persisted
+_POSITION_FIELDS = {"queue_position", "eta_seconds"}
+# TaskState fields sent to followers
+_WIRE_FIELDS = ("status", "audio_urls", "meta", "completed_at", "queue_position", "eta_seconds", "upstream_id", "node")
+
+
+def _publish(state: TaskState, position_only: bool = False):
+    # Snapshot so listeners never see a later mutation of the live state
+    snapshot = replace(state)
+    for queue in _subscribers.get(state.task_id, ()):
+        queue.put_nowait(snapshot)
+    # Position updates of a long queue would flood the channel; only send those someone listens to
+    if coordination.is_leader() and (not position_only or state.task_id in _watched):
+        _broadcast(snapshot)
+
+
+def _broadcast(state: TaskState):
+    wire = {k: getattr(state, k) for k in _WIRE_FIELDS}
+    if not coordination.publish("task", task_id=state.task_id, **wire):
+        # Too large for NOTIFY; followers fall back to the table for the metadata
+        coordination.publish("task", task_id=state.task_id, **{**wire, "meta": None})
+
+
+def _apply_remote(message: dict):
+    """Mirror a state change broadcast by the leader and push it to local listeners."""
+    if coordination.is_leader():
+        return  # a stale message from the previous leader
+    task_id = message["task_id"]
+    state = _tasks.get(task_id)
+    if state is None:
+        state = _tasks[task_id] = TaskState(task_id, message["status"])
+    for key in _WIRE_FIELDS:
+        setattr(state, key, message.get(key))
+    state.audio_urls = state.audio_urls or []
+    state.node = state.node or ""
+    if state.completed_at is not None:
+        state.completed_at = datetime.fromisoformat(state.completed_at)
+    state.updated = time.monotonic()
+    _publish(state)
+    _evict_finished()
+
+
+def _on_watch(message: dict):
+    if not coordination.is_leader():
+        return
+    _watched.setdefault(message["task_id"], set()).add(message["from"])
+    state = _tasks.get(message["task_id"])
+    if state is not None:
+        _broadcast(state)  # the follower may have missed the latest position
+
+
+def _on_unwatch(message: dict):
+    followers = _watched.get(message["task_id"])
+    if followers is not None:
+        followers.discard(message["from"])
+        if not followers:
+            del _watched[message["task_id"]]
+
+
+def _on_new_leader(message: dict):
+    # The new leader starts without our watches
+    for task_id in _subscribers:
+        coordination.publish("watch", task_id=task_id)
+
+
+def _on_reconnect():
+    # Broadcasts may have been missed while disconnected: re-read the tasks we mirror
+    global _resync
+    if not coordination.is_leader() and (_resync is None or _resync.done()):
+        _resync = asyncio.create_task(_load_in_flight())
+
+
+def lookup(task_id: str) -> TaskState | None:
+    """In-memory state for a task, or None if the poller doesn't know it."""
+    return _tasks.get(task_id)
+
+
+async def get_status(task_id: str) -> TaskState | None:
+    """Current state of a task: memory first, then a read-only DB lookup.
+
+    Non-terminal rows found in the DB (e.g. after a restart or eviction) are
+    re-tracked so the next poll cycle refreshes them.
+    """
+    state = _tasks.get(task_id)
+    if state is not None:
+        return state
+
+    async with async_session() as session:
+        row = (await session.execute(
+            select(Generation.task_id, Generation.upstream_task_id, Generation.node, Generation.status,
+                   Generation.audio_paths, Generation.generation_meta, Generation.completed_at)
+            .where(Generation.task_id == task_id)
+        )).first()
+    if row is None:
+        return None
+    row = status_writer.apply(row)
+    if row.status in TERMINAL:
+        return TaskState(task_id, row.status, row.audio_paths or [], row.generation_meta, row.completed_at)
+    return track(task_id, _live_status(row), row.audio_paths, row.generation_meta,
+                 upstream_id=_upstream_id(row), node=row.node or "")
+
+
+async def _load_in_flight():
+    """Seed the tracked set from non-terminal rows (left by a previous run or leader)
+    and refresh the non-terminal tasks already in memory."""
+    known = [tid for tid, s in _tasks.items() if s.status not in TERMINAL]
+    async with async_session() as session:
+        rows = await session.execute(
+            select(Generation.task_id, Generation.upstream_task_id, Generation.node, Generation.status,
+                   Generation.audio_paths, Generation.generation_meta, Generation.completed_at)
+            .where(or_(Generation.status.not_in(TERMINAL), Generation.task_id.in_(known)))
+        )
+        for r in rows:
+            r = status_writer.apply(r)
+            state = _tasks.get(r.task_id)
+            if state is None:
+                track(r.task_id, _live_status(r), r.audio_paths, r.generation_meta,
+                      upstream_id=_upstream_id(r), node=r.node or "")
+            elif state.status not in TERMINAL:
+                set_state(r.task_id, status=_live_status(r), audio_urls=r.audio_paths or [], meta=r.generation_meta,
+                          completed_at=r.completed_at, upstream_id=_upstream_id(r), node=r.node or "")
+
+
+def _persist(changed: list[TaskState]):
+    """Queue the status transitions from one poll cycle for the write-behind buffer."""
+    for s in changed:
+        status_writer.write(
+            s.task_id, status=s.status, audio_paths=s.audio_urls or None, generation_meta=s.meta,
+            completed_at=s.completed_at,
+        )
+
+
+async def _query_node(node: str, upstream_ids: list[str]) -> list[tuple[str, dict]]:
+    """(upstream id, result) pairs for one node's tasks, in batches."""
+    pairs = []
+    size = settings.status_poll_batch_size
+    for i in range(0, len(upstream_ids), size):
+        chunk = upstream_ids[i:i + size]
+        with resilience.deadline(settings.upstream_deadline):
+            results = await acestep_client.query_task(chunk, node)
+        # Prefer the id echoed by ACE-Step; fall back to request order
+        pairs.extend((task.get("task_id") or upstream_id, task) for upstream_id, task in zip(chunk, results))
+    return pairs
+
+
+async def poll_once() -> list[TaskState]:
+    """Query ACE-Step for every in-flight task and apply the changes. Returns changed states."""
+    by_node: dict[str, dict[str, TaskState]] = {}
+    for s in _tasks.values():
+        if s.upstream_id and s.status not in TERMINAL:
+            by_node.setdefault(acestep_nodes.get(s.node).name, {})[s.upstream_id] = s
+    acestep_nodes.set_inflight({node: len(tasks) for node, tasks in by_node.items()})
+
+    nodes = list(by_node)
+    replies = await asyncio.gather(*(_query_node(n, list(by_node[n])) for n in nodes), return_exceptions=True)
+    if replies and all(isinstance(r, BaseException) for r in replies):
+        raise replies[0]
+
+    changed: list[TaskState] = []
+    # Queue-position-only changes are pushed to listeners but not written to the DB
+    transitions: list[TaskState] = []
+
+    for node, reply in zip(nodes, replies):
+        if isinstance(reply, BaseException):
+            # One node down shouldn't hold up the others
+            logger.warning("Status poll of node %s failed: %s", node, reply)
+            continue
+        for upstream_id, task in reply:
+            state = by_node[node].get(upstream_id)
+            if state is None:
+                continue
+            status, audio_urls, meta = parse_task(task, state.node)
+            queue_position = task.get("queue_position", state.queue_position)
+            if status in TERMINAL:
+                queue_position = None
+            transition = status != state.status or (audio_urls and audio_urls != state.audio_urls)
+            if not transition and queue_position == state.queue_position:
+                continue
+            state.status = status
+            state.queue_position = queue_position
+            if audio_urls:
+                state.audio_urls = audio_urls
+            if meta:
+                state.meta = meta
+            if status == "running" and state.running_since is None:
+                state.running_since = time.monotonic()
+            if status in TERMINAL:
+                state.completed_at = datetime.now(timezone.utc)
+                if state.running_since is not None:
+                    metrics.generation_run_seconds.observe(time.monotonic() - state.running_since, status)
+            state.updated = time.monotonic()
+            changed.append(state)
+            if transition:
+                transitions.append(state)
+
+    if transitions:
+        _persist(transitions)
+        for state in transitions:
+            for hook in _transition_hooks:
+                hook(state)
+    moved = {s.task_id for s in transitions}
+    for state in changed:
+        _publish(state, position_only=state.task_id not in moved)
+    _evict_finished()
+    return changed
+
+
+def status_counts() -> dict[str, int]:
+    """Number of non-terminal tasks per status."""
+    counts: dict[str, int] = {}
+    for s in _tasks.values():
+        if s.status not in TERMINAL:
+            counts[s.status] = counts.get(s.status, 0) + 1
+    return counts
+
+
+def _evict_finished():
+    """Drop terminal tasks that have been kept around long enough for late pollers."""
+    cutoff = time.monotonic() - settings.status_terminal_ttl
+    for task_id in [tid for tid, s in _tasks.items() if s.status in TERMINAL and s.updated < cutoff]:
+        del _tasks[task_id]
+        _watched.pop(task_id, None)
+
+
+async def _run():
+    interval = settings.status_poll_min_interval
+    while True:
+        _wakeup.clear()
+        try:
+            changed = await poll_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if isinstance(e, resilience.CircuitOpen) or resilience.is_transient(e):
+                logger.warning("Status poll failed: %s", e)
+            else:
+                logger.exception("Status poll failed")
+            changed = []
+
+        # Adaptive interval: poll fast while tasks are moving, back off while they sit
+        if changed:
+            interval = settings.status_poll_min_interval
+        else:
+            interval = min(interval * 2, settings.status_poll_max_interval)
+
+        has_pending = any(s.upstream_id and s.status not in TERMINAL for s in _tasks.values())
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=interval if has_pending else None)
+            interval = settings.status_poll_min_interval
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _lead():
+    """Load in-flight tasks and launch the polling loop."""
+    global _worker
+    await _load_in_flight()
+    _worker = asyncio.create_task(_run())
+
+
+async def start():
+    """Poll as the leader; mirror the leader's broadcasts otherwise."""
+    coordination.add_leader_role("status_poller", _lead, stop)
+    coordination.subscribe("task", _apply_remote)
+    coordination.subscribe("watch", _on_watch)
+    coordination.subscribe("unwatch", _on_unwatch)
+    coordination.subscribe("leader", _on_new_leader)
+    coordination.add_reconnect_hook(_on_reconnect)
+
+
+async def stop():
+    """Cancel the polling loop."""
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+    _worker = None
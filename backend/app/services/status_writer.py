@@ -0,0 +1,160 @@
+"""Write-behind buffer for generation status columns.
+
+The status poller and audio ingestion don't write to ``generations``
+themselves; they hand changed columns to ``write()``. Changes are
+coalesced per task (the latest value of each column wins) and flushed
+every ``status_flush_interval`` seconds — sooner once
+``status_flush_max_rows`` tasks are waiting — and on shutdown. On Postgres
+each flush is one ``UPDATE generations SET ... FROM (VALUES ...)`` per set
+of changed columns; SQLite gets an executemany UPDATE.
+
+Until a change is flushed, readers that go to the table (history, status
+of untracked tasks) apply ``overlay()`` so they never see a row older
+than the in-memory state. If the process dies, at most one interval of
+transitions is lost; the rows stay non-terminal and the poller re-learns
+them from ACE-Step after the restart.
+"""
+
+import asyncio
+import logging
+from types import SimpleNamespace
+
+from sqlalchemy import bindparam, cast, column, update, values
+
+from app.config import settings
+from app.database import async_session, engine
+from app.models import Generation
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+_buffer: dict[str, dict] = {}  # task id → column → latest value
+_flushing: dict[str, dict] = {}  # the batch being written right now
+_flush_now = asyncio.Event()
+_flush_lock = asyncio.Lock()
+_worker: asyncio.Task | None = None
+
+
+def write(task_id: str, **columns):
+    """Queue column updates for a task's row, merging with any not yet flushed."""
+    pending = _buffer.get(task_id)
+    if pending is None:
+        _buffer[task_id] = dict(columns)
+        metrics.status_updates.inc("buffered")
+    else:
+        pending.update(columns)
+        metrics.status_updates.inc("coalesced")
+    if len(_buffer) >= settings.status_flush_max_rows:
+        _flush_now.set()
+
+
+def overlay(task_id: str) -> dict:
+    """Unflushed column values for a task (empty when the table is current)."""
+    if task_id in _flushing:
+        return {**_flushing[task_id], **_buffer.get(task_id, {})}
+    return _buffer.get(task_id, {})
+
+
+def buffered(column: str) -> list:
+    """Unflushed values of one column, across every task that has one pending."""
+    return [c[column] for pending in (_flushing, _buffer) for c in pending.values() if column in c]
+
+
+def apply(row):
+    """A result row (with a ``task_id`` column) as it will read once buffered changes land.
+
+    Rows are immutable, so a row with pending changes comes back as a
+    namespace with the same attributes.
+    """
+    pending = overlay(row.task_id)
+    if not pending:
+        return row
+    return SimpleNamespace(**{**row._asdict(), **{k: v for k, v in pending.items() if k in row._fields}})
+
+
+def _update_many(table, names: tuple[str, ...], rows: list[dict]):
+    if engine.dialect.name == "postgresql":
+        source = values(
+            column("task_id", table.c.task_id.type),
+            *(column(n, table.c[n].type) for n in names),
+            name="v",
+        ).data([(row["task_id"], *(row[n] for n in names)) for row in rows])
+        # Casts because a VALUES column that is NULL in every row comes out as text
+        return update(table).where(table.c.task_id == source.c.task_id).values(
+            {n: cast(source.c[n], table.c[n].type) for n in names}
+        ), None
+    stmt = (
+        update(table)
+        .where(table.c.task_id == bindparam("b_task_id"))
+        .values({n: bindparam(f"b_{n}") for n in names})
+    )
+    return stmt, [{"b_task_id": row["task_id"], **{f"b_{n}": row[n] for n in names}} for row in rows]
+
+
+async def flush():
+    """Write everything buffered so far. On failure the changes go back into the buffer."""
+    async with _flush_lock:
+        if not _buffer:
+            return
+        batch = dict(_buffer)
+        _buffer.clear()
+        _flushing.update(batch)
+
+        # One statement per distinct set of changed columns
+        groups: dict[tuple[str, ...], list[dict]] = {}
+        for task_id, columns in batch.items():
+            groups.setdefault(tuple(sorted(columns)), []).append({"task_id": task_id, **columns})
+
+        table = Generation.__table__
+        try:
+            async with async_session() as session:
+                for names, rows in groups.items():
+                    stmt, params = _update_many(table, names, rows)
+                    if params is None:
+                        await session.execute(stmt)
+                    else:
+                        await session.execute(stmt, params)
+                await session.commit()
+        except Exception:
+            # Newer changes that arrived meanwhile win over the failed batch
+            for task_id, columns in batch.items():
+                _buffer[task_id] = {**columns, **_buffer.get(task_id, {})}
+            raise
+        finally:
+            _flushing.clear()
+        metrics.status_updates.inc("flushed", amount=len(batch))
+
+
+async def _run():
+    while True:
+        try:
+            await asyncio.wait_for(_flush_now.wait(), timeout=settings.status_flush_interval)
+        except asyncio.TimeoutError:
+            pass
+        _flush_now.clear()
+        try:
+            await flush()
+        except Exception as e:
+            logger.warning("Status flush failed (%d rows kept for retry): %s", len(_buffer), e)
+
+
+def start():
+    global _worker
+    _worker = asyncio.create_task(_run())
+
+
+async def stop():
+    """Stop the flush loop and write out whatever is left."""
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+    _worker = None
+    await flush()
+
+
+def stats() -> dict:
+    return {"buffered": len(_buffer)}
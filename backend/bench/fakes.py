@@ -0,0 +1,203 @@
+"""Stand-in ACE-Step and Ollama servers for benchmarking without a GPU.
+
+Both mimic the endpoints the backend uses, with configurable response
+latency (mean ± jitter) and a failure rate (HTTP 503). ACE-Step tasks
+succeed ``--gen-seconds`` after submission and return ``--outputs`` audio
+files of ``--audio-bytes`` random bytes each; Ollama streams
+``--tokens`` tokens spaced ``--token-ms`` apart.
+
+Usage (from backend/):
+    python -m bench.fakes acestep --port 18001 --latency-ms 20 --failure-rate 0.01
+    python -m bench.fakes ollama --port 18002 --tokens 200 --token-ms 5
+
+GET /stats on either server returns per-endpoint call counts.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+MODEL = "qwen2.5:7b"
+
+
+@dataclass
+class FakeConfig:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    failure_rate: float = 0.0
+    gen_seconds: float = 2.0
+    outputs: int = 2
+    audio_bytes: int = 500_000
+    tokens: int = 200
+    token_ms: float = 5.0
+    model: str = MODEL
+
+
+class _Fake:
+    """Shared latency / failure injection and call counting."""
+
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self.calls: dict[str, int] = {}
+        self.failures = 0
+
+    async def delay(self, endpoint: str) -> Response | None:
+        """Sleep the configured latency; returns a 503 response if this call should fail."""
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        c = self.config
+        if c.latency_ms or c.jitter_ms:
+            await asyncio.sleep(max(0.0, random.gauss(c.latency_ms, c.jitter_ms)) / 1000)
+        if c.failure_rate and random.random() < c.failure_rate:
+            self.failures += 1
+            return JSONResponse({"error": "injected failure"}, status_code=503)
+        return None
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "failures": self.failures}
+
+
+def acestep_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI()
+    fake = _Fake(config)
+    tasks: dict[str, float] = {}  # task id → submitted at
+    audio = os.urandom(config.audio_bytes)
+
+    @app.get("/health")
+    async def health():
+        return await fake.delay("health") or {"status": "ok"}
+
+    @app.post("/release_task")
+    async def release_task(req: Request):
+        await req.body()
+        if failed := await fake.delay("release_task"):
+            return failed
+        task_id = str(uuid.uuid4())
+        tasks[task_id] = time.monotonic()
+        pending = sum(1 for t in tasks.values() if time.monotonic() - t < config.gen_seconds)
+        return {"data": {"task_id": task_id, "status": "queued", "queue_position": pending}}
+
+    @app.post("/query_result")
+    async def query_result(req: Request):
+        ids = (await req.json()).get("task_id_list", [])
+        if failed := await fake.delay("query_result"):
+            return failed
+        out = []
+        for task_id in ids:
+            if task_id not in tasks:
+                continue
+            done = time.monotonic() - tasks[task_id] >= config.gen_seconds
+            result = None
+            if done:
+                result = json.dumps([
+                    {"file": f"/v1/audio?path=/app/.cache/{task_id}_{i}.mp3", "metas": {"bpm": 120}}
+                    for i in range(config.outputs)
+                ])
+            out.append({"task_id": task_id, "status": 1 if done else 0, "result": result})
+        return {"data": out}
+
+    @app.get("/v1/audio")
+    async def get_audio(path: str):
+        if failed := await fake.delay("audio"):
+            return failed
+        # Unique bytes per path so the backend's content-addressed store keeps them apart
+        return Response(audio + path.encode(), media_type="audio/mpeg")
+
+    @app.get("/v1/models")
+    async def models():
+        return await fake.delay("models") or {"data": {"models": [{"name": "acestep-v15-turbo"}]}}
+
+    @app.get("/stats")
+    async def stats():
+        return {**fake.stats(), "tasks": len(tasks)}
+
+    return app
+
+
+def ollama_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI()
+    fake = _Fake(config)
+    words = ["[Verse 1]\n", "city ", "lights ", "are ", "calling ", "me ", "home\n", "[Chorus]\n"]
+
+    def token(i: int) -> str:
+        return words[i % len(words)]
+
+    @app.get("/api/tags")
+    async def tags():
+        return await fake.delay("tags") or {"models": [{"name": config.model}]}
+
+    @app.get("/api/ps")
+    async def ps():
+        return await fake.delay("ps") or {"models": [{"name": config.model}]}
+
+    @app.post("/api/pull")
+    async def pull():
+        return await fake.delay("pull") or {"status": "success"}
+
+    @app.post("/api/generate")
+    async def generate():
+        return await fake.delay("generate") or {"done": True}
+
+    @app.post("/api/chat")
+    async def chat(req: Request):
+        body = await req.json()
+        if failed := await fake.delay("chat"):
+            return failed
+        n = config.tokens
+        if not body.get("stream"):
+            await asyncio.sleep(n * config.token_ms / 1000)
+            return {"message": {"role": "assistant", "content": "".join(token(i) for i in range(n))}, "done": True}
+
+        async def stream():
+            for i in range(n):
+                await asyncio.sleep(config.token_ms / 1000)
+                yield json.dumps({"message": {"role": "assistant", "content": token(i)}, "done": False}) + "\n"
+            yield json.dumps({
+                "message": {"role": "assistant", "content": ""}, "done": True,
+                "eval_count": n, "eval_duration": int(n * config.token_ms * 1e6),
+            }) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    @app.get("/stats")
+    async def stats():
+        return fake.stats()
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("service", choices=("acestep", "ollama"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--gen-seconds", type=float, default=2.0)
+    parser.add_argument("--outputs", type=int, default=2)
+    parser.add_argument("--audio-bytes", type=int, default=500_000)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--token-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    config = FakeConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, failure_rate=args.failure_rate,
+        gen_seconds=args.gen_seconds, outputs=args.outputs, audio_bytes=args.audio_bytes,
+        tokens=args.tokens, token_ms=args.token_ms,
+    )
+    app = acestep_app(config) if args.service == "acestep" else ollama_app(config)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
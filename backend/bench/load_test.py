@@ -0,0 +1,444 @@
+"""Load test the backend against local ACE-Step and Ollama stand-ins.
+
+Starts the fake upstreams (bench.fakes) and the real backend as separate
+processes on free ports, runs scripted scenarios with N concurrent
+clients, and reports requests/s, p50/p99 latency and the backend's CPU
+and peak memory. Every run is appended to a JSON-lines results file
+together with the git commit, and compared against the latest earlier
+run of the same scenario, so regressions between commits stand out
+(bench/results/ is git-ignored; pass --results to keep it elsewhere).
+
+Scenarios:
+    status       clients each submit a generation, then poll its status
+    audio-seek   clients fire random Range requests at one generated file
+    history      clients page through a seeded history table
+    lyrics       burst of non-streaming lyrics requests
+    lyrics-stream  streaming lyrics requests; latency is time to first token
+
+Usage (from backend/, after ``pip install -r requirements-dev.txt``):
+    python -m bench.load_test --scenario all --clients 50 --duration 20
+    python -m bench.load_test --scenario status --latency-ms 50 --failure-rate 0.02
+
+Without --database-url a throwaway SQLite database is used; point it at a
+scratch Postgres database to measure the production setup.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_RESULTS = Path(__file__).resolve().parent / "results" / "load_test.jsonl"
+SEED_BATCH = 5_000
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _commit() -> str:
+    try:
+        sha = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no", "."], cwd=BACKEND_DIR,
+            capture_output=True, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{sha}-dirty" if dirty else sha
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] if ordered else 0.0
+
+
+class ProcessSampler:
+    """Samples a process's CPU% and RSS from /proc (Linux); no-op elsewhere."""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.cpu: list[float] = []
+        self.rss_peak = 0
+        self._task: asyncio.Task | None = None
+
+    def _read(self) -> tuple[float, int] | None:
+        try:
+            stat = Path(f"/proc/{self.pid}/stat").read_text().rsplit(")", 1)[1].split()
+            status = Path(f"/proc/{self.pid}/status").read_text()
+        except OSError:
+            return None
+        cpu_seconds = (int(stat[11]) + int(stat[12])) / os.sysconf("SC_CLK_TCK")
+        rss_kb = next((int(line.split()[1]) for line in status.splitlines() if line.startswith("VmRSS:")), 0)
+        return cpu_seconds, rss_kb * 1024
+
+    async def _run(self):
+        last = self._read()
+        last_at = time.monotonic()
+        while last is not None:
+            await asyncio.sleep(self.interval)
+            now = self._read()
+            if now is None:
+                return
+            at = time.monotonic()
+            self.cpu.append(100 * (now[0] - last[0]) / (at - last_at))
+            self.rss_peak = max(self.rss_peak, now[1])
+            last, last_at = now, at
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> dict:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        return {
+            "cpu_pct": round(sum(self.cpu) / len(self.cpu), 1) if self.cpu else None,
+            "rss_mb": round(self.rss_peak / 2**20, 1) if self.rss_peak else None,
+        }
+
+
+def _spawn(args: list[str], log: Path, env: dict | None = None) -> subprocess.Popen:
+    with log.open("wb") as out:
+        return subprocess.Popen(
+            [sys.executable, *args], cwd=BACKEND_DIR, env={**os.environ, **(env or {})},
+            stdout=out, stderr=subprocess.STDOUT,
+        )
+
+
+async def _wait_ready(client: httpx.AsyncClient, proc: subprocess.Popen, log: Path, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"backend exited:\n{log.read_text()[-2000:]}")
+        try:
+            health = (await client.get("/api/health")).json()
+            if health.get("acestep") and health.get("lyrics_model"):
+                return
+        except (httpx.HTTPError, ValueError):
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("backend did not become ready")
+
+
+async def seed_history(database_url: str, rows: int):
+    """Insert ``rows`` succeeded generations (task_id 'bench-<n>') unless already present."""
+    os.environ["DATABASE_URL"] = database_url  # app modules read it at import time
+    from sqlalchemy import func, insert, select
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from app.database import Base
+    from app.models import Generation
+
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        existing = (await conn.execute(
+            select(func.count()).select_from(Generation).where(Generation.task_id.like("bench-%"))
+        )).scalar()
+    now = datetime.now(timezone.utc)
+    words = ["summer", "night", "city", "rain", "dream", "ocean", "fire", "heart", "road", "star"]
+    for start in range(existing, rows, SEED_BATCH):
+        batch = [
+            {
+                "task_id": f"bench-{n}",
+                "status": "succeeded",
+                "prompt": " ".join(random.choices(words, k=6)),
+                "lyrics": " ".join(random.choices(words, k=60)),
+                "duration": 60.0,
+                "bpm": random.randint(60, 180),
+                "audio_paths": [f"/music/audio?path=/bench/{n}.mp3"],
+                "created_at": now - timedelta(seconds=n),
+            }
+            for n in range(start, min(start + SEED_BATCH, rows))
+        ]
+        async with engine.begin() as conn:
+            await conn.execute(insert(Generation), batch)
+    await engine.dispose()
+
+
+@asynccontextmanager
+async def stack(args):
+    """Fake upstreams + backend; yields (client for the backend, backend process)."""
+    workdir = Path(tempfile.mkdtemp(prefix="bench-"))
+    database_url = args.database_url or f"sqlite+aiosqlite:///{workdir / 'bench.db'}"
+    if args.history_rows and "history" in args.scenarios:
+        print(f"seeding {args.history_rows} history rows ...")
+        await seed_history(database_url, args.history_rows)
+
+    ace_port, ollama_port, backend_port = _free_port(), _free_port(), _free_port()
+    fault = ["--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.latency_ms / 4),
+             "--failure-rate", str(args.failure_rate)]
+    procs = [
+        _spawn(["-m", "bench.fakes", "acestep", "--port", str(ace_port), "--gen-seconds", str(args.gen_seconds),
+                *fault], workdir / "acestep.log"),
+        _spawn(["-m", "bench.fakes", "ollama", "--port", str(ollama_port), "--tokens", str(args.tokens),
+                "--token-ms", str(args.token_ms), *fault], workdir / "ollama.log"),
+    ]
+    backend_log = workdir / "backend.log"
+    backend = _spawn(
+        ["-m", "uvicorn", "app.main:app", "--port", str(backend_port), "--log-level", "warning"],
+        backend_log,
+        env={
+            "DATABASE_URL": database_url,
+            "ACESTEP_URL": f"http://127.0.0.1:{ace_port}",
+            "OLLAMA_URL": f"http://127.0.0.1:{ollama_port}",
+            "AUDIO_DIR": str(workdir / "audio"),
+        },
+    )
+    procs.append(backend)
+    limits = httpx.Limits(max_connections=args.clients * 2, max_keepalive_connections=args.clients * 2)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{backend_port}", timeout=60.0, limits=limits
+        ) as client:
+            await _wait_ready(client, backend, backend_log)
+            yield client, backend
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+async def _drive(clients: list, duration: float) -> tuple[list[float], int]:
+    """Run each client's ``step()`` in a loop for ``duration`` seconds.
+
+    ``step`` returns True on success; latencies (ms) are kept for successes.
+    """
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def loop(step):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = await step()
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                errors += 1
+
+    await asyncio.gather(*(loop(step) for step in clients))
+    return latencies, errors
+
+
+async def _submit(client: httpx.AsyncClient, n: int) -> str:
+    resp = await client.post(
+        "/api/music/generate",
+        json={"prompt": f"bench track {n} {random.random()}", "duration": 10, "batch_size": 1},
+        headers={"X-Client-Id": f"bench-{n}"},
+    )
+    resp.raise_for_status()
+    return resp.json()["task_id"]
+
+
+async def scenario_status(client: httpx.AsyncClient, args) -> tuple[list[float], int]:
+    task_ids = await asyncio.gather(*(_submit(client, n) for n in range(args.clients)))
+
+    def poller(task_id: str):
+        async def step() -> bool:
+            return (await client.get(f"/api/music/status/{task_id}")).status_code == 200
+        return step
+
+    return await _drive([poller(t) for t in task_ids], args.duration)
+
+
+async def scenario_audio_seek(client: httpx.AsyncClient, args) -> tuple[list[float], int]:
+    task_id = await _submit(client, 0)
+    while True:
+        status = (await client.get(f"/api/music/status/{task_id}")).json()
+        if status["status"] == "succeeded":
+            break
+        if status["status"] == "failed":
+            raise RuntimeError("bench generation failed")
+        await asyncio.sleep(0.5)
+    url = "/api" + status["audio_urls"][0]
+    size = int((await client.head(url)).headers["content-length"])
+
+    async def step() -> bool:
+        start = random.randrange(0, max(1, size - 65536))
+        resp = await client.get(url, headers={"Range": f"bytes={start}-{start + 65535}"})
+        return resp.status_code == 206
+
+    return await _drive([step] * args.clients, args.duration)
+
+
+async def scenario_history(client: httpx.AsyncClient, args) -> tuple[list[float], int]:
+    def pager():
+        cursor = None
+        pages = 0
+
+        async def step() -> bool:
+            nonlocal cursor, pages
+            resp = await client.get("/api/history", params={"page_size": 20, **({"cursor": cursor} if cursor else {})})
+            if resp.status_code != 200:
+                return False
+            cursor = resp.json().get("next_cursor")
+            pages += 1
+            if cursor is None or pages >= args.max_pages:
+                cursor, pages = None, 0
+            return True
+        return step
+
+    return await _drive([pager() for _ in range(args.clients)], args.duration)
+
+
+async def scenario_lyrics(client: httpx.AsyncClient, args) -> tuple[list[float], int]:
+    async def step() -> bool:
+        resp = await client.post("/api/lyrics/generate", json={"theme": f"bench {random.random()}"})
+        return resp.status_code == 200
+
+    return await _drive([step] * args.clients, args.duration)
+
+
+async def scenario_lyrics_stream(client: httpx.AsyncClient, args) -> tuple[list[float], int]:
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.monotonic() + args.duration
+
+    async def loop():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            first = None
+            ok = False
+            try:
+                async with client.stream("POST", "/api/lyrics/generate/stream",
+                                         json={"theme": f"bench {random.random()}"}) as resp:
+                    async for line in resp.aiter_lines():
+                        if line == "event: token" and first is None:
+                            first = time.perf_counter()
+                        elif line == "event: done":
+                            ok = True
+            except httpx.HTTPError:
+                pass
+            if ok and first is not None:
+                latencies.append((first - started) * 1000)
+            else:
+                errors += 1
+
+    await asyncio.gather(*(loop() for _ in range(args.clients)))
+    return latencies, errors
+
+
+SCENARIOS = {
+    "status": scenario_status,
+    "audio-seek": scenario_audio_seek,
+    "history": scenario_history,
+    "lyrics": scenario_lyrics,
+    "lyrics-stream": scenario_lyrics_stream,
+}
+
+
+def _previous(results: Path, record: dict) -> dict | None:
+    if not results.exists():
+        return None
+    match = None
+    for line in results.read_text().splitlines():
+        try:
+            old = json.loads(line)
+        except ValueError:
+            continue
+        if old.get("scenario") == record["scenario"] and old.get("clients") == record["clients"]:
+            match = old
+    return match
+
+
+def _delta(new: float | None, old: float | None) -> str:
+    if new is None or not old:
+        return ""
+    return f" ({(new - old) / old * 100:+.0f}%)"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", default="all", choices=("all", *SCENARIOS))
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per scenario")
+    parser.add_argument("--database-url", default=os.environ.get("BENCH_DATABASE_URL"))
+    parser.add_argument("--history-rows", type=int, default=20_000)
+    parser.add_argument("--max-pages", type=int, default=50, help="history pages per client walk")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="fake upstream latency (both fakes)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fake upstream 503 rate (both fakes)")
+    parser.add_argument("--gen-seconds", type=float, default=2.0)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--token-ms", type=float, default=2.0)
+    parser.add_argument("--results", type=Path, default=DEFAULT_RESULTS)
+    parser.add_argument("--label", default="", help="free-form note stored with the results")
+    args = parser.parse_args()
+    args.scenarios = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+
+    commit = _commit()
+    args.results.parent.mkdir(parents=True, exist_ok=True)
+    print(f"{'scenario':<14} {'rps':>8} {'p50':>8} {'p99':>8} {'errors':>7} {'cpu%':>6} {'rss MB':>7}")
+    async with stack(args) as (client, backend):
+        for name in args.scenarios:
+            sampler = ProcessSampler(backend.pid)
+            sampler.start()
+            started = time.monotonic()
+            latencies, errors = await SCENARIOS[name](client, args)
+            elapsed = time.monotonic() - started
+            usage = await sampler.stop()
+            record = {
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "commit": commit,
+                "label": args.label,
+                "scenario": name,
+                "clients": args.clients,
+                "duration_s": round(elapsed, 1),
+                "requests": len(latencies),
+                "errors": errors,
+                "rps": round(len(latencies) / elapsed, 1),
+                "p50_ms": round(percentile(latencies, 0.5), 2),
+                "p99_ms": round(percentile(latencies, 0.99), 2),
+                **usage,
+                "config": {
+                    "latency_ms": args.latency_ms, "failure_rate": args.failure_rate,
+                    "database": "postgresql" if args.database_url and "postgres" in args.database_url else "sqlite",
+                },
+            }
+            previous = _previous(args.results, record)
+            with args.results.open("a") as f:
+                f.write(json.dumps(record) + "\n")
+            print(
+                f"{name:<14} {record['rps']:8.1f} {record['p50_ms']:8.1f} {record['p99_ms']:8.1f} "
+                f"{errors:7d} {usage['cpu_pct'] or 0:6.1f} {usage['rss_mb'] or 0:7.1f}"
+            )
+            if previous:
+                print(
+                    f"{'':<14} vs {previous['commit']}: rps {previous['rps']}{_delta(record['rps'], previous['rps'])}, "
+                    f"p99 {previous['p99_ms']}ms{_delta(record['p99_ms'], previous['p99_ms'])}"
+                )
+    print(f"results appended to {args.results}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+"""Benchmark /api/history/search queries on a large generations table.
+
+Seeds a Postgres database with synthetic generations (server-side, via
+generate_series) up to --rows, then times each search scenario through the
+real endpoint code and reports p50/p95/p99 against the latency budget.
+
+Usage (from backend/):
+    python -m bench.search_bench --database-url postgresql+asyncpg://... --rows 1000000
+
+Use a scratch database — rows are inserted with task_id 'bench-<n>'.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+WORDS = [
+    "summer", "love", "rain", "night", "city", "dance", "fire", "ocean", "dream", "heart",
+    "road", "winter", "light", "shadow", "river", "storm", "gold", "wild", "home", "star",
+    "guitar", "piano", "synth", "drums", "bass", "vocals", "female", "male", "upbeat", "slow",
+]
+KEYS = ["C Major", "C Minor", "D Major", "E Minor", "F Major", "G Major", "A Minor", "B Minor"]
+LANGS = ["en", "ru", "by", "zh", "ja", "es"]
+STATUSES = ["succeeded", "succeeded", "succeeded", "failed", "queued", "running"]
+
+SEED_BATCH = 100_000
+
+
+def _pick(values: list[str]) -> str:
+    array = ",".join("'{}'".format(v.replace("'", "''")) for v in values)
+    return f"(ARRAY[{array}])[1 + floor(random() * {len(values)})::int]"
+
+
+def _phrase(n: int) -> str:
+    return " || ' ' || ".join(_pick(WORDS) for _ in range(n))
+
+
+SEED_SQL = f"""
+INSERT INTO generations
+    (task_id, status, prompt, lyrics, duration, bpm, key_scale, vocal_language, batch_size, created_at)
+SELECT
+    'bench-' || g,
+    {_pick(STATUSES)},
+    {_phrase(6)},
+    {_phrase(40)},
+    30 + floor(random() * 270),
+    60 + floor(random() * 140)::int,
+    {_pick(KEYS)},
+    {_pick(LANGS)},
+    2,
+    now() - (g || ' seconds')::interval
+FROM generate_series(:start, :stop) AS g
+"""
+
+SCENARIOS = {
+    "text": {"q": "summer love"},
+    "text+facets": {"q": "ocean", "vocal_language": "en", "bpm_min": 100, "bpm_max": 140},
+    "rare text": {"q": "guitar storm shadow"},
+    "phrase": {"q": '"night city"'},
+    "text+status+key": {"q": "dream", "status": "succeeded", "key_scale": "A Minor"},
+}
+
+
+async def seed(engine, rows: int):
+    async with engine.begin() as conn:
+        existing = (await conn.execute(
+            text("SELECT count(*) FROM generations WHERE task_id LIKE 'bench-%'")
+        )).scalar()
+    if existing >= rows:
+        print(f"{existing} bench rows present, skipping seed")
+        return
+    print(f"seeding {rows - existing} rows ...")
+    for start in range(existing + 1, rows + 1, SEED_BATCH):
+        stop = min(start + SEED_BATCH - 1, rows)
+        async with engine.begin() as conn:
+            await conn.execute(text(SEED_SQL), {"start": start, "stop": stop})
+        print(f"  {stop}/{rows}")
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE generations"))
+
+
+async def run_scenario(sessions, params: dict, iterations: int) -> list[float]:
+    from app.routers.history import search_history
+
+    args = {
+        "q": "", "vocal_language": None, "key_scale": None, "status": None,
+        "bpm_min": None, "bpm_max": None, "created_from": None, "created_to": None,
+        "page_size": 20, "offset": 0,
+    }
+    args.update(params)
+    timings = []
+    async with sessions() as db:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            await search_history(**args, db=db)
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.environ.get("BENCH_DATABASE_URL"))
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--budget-ms", type=float, default=50.0)
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("--database-url (or BENCH_DATABASE_URL) is required")
+
+    # The app reads DATABASE_URL at import time
+    os.environ["DATABASE_URL"] = args.database_url
+    from app.database import Base
+
+    engine = create_async_engine(args.database_url)
+    if engine.dialect.name != "postgresql":
+        parser.error("the search benchmark targets Postgres")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await seed(engine, args.rows)
+
+    sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    failed = False
+    print(f"{'scenario':<18} {'p50':>8} {'p95':>8} {'p99':>8}  (ms, {args.iterations} runs)")
+    for name, params in SCENARIOS.items():
+        await run_scenario(sessions, params, 3)  # warm caches
+        timings = await run_scenario(sessions, params, args.iterations)
+        p50, p95, p99 = (percentile(timings, p) for p in (0.5, 0.95, 0.99))
+        ok = p95 <= args.budget_ms
+        failed |= not ok
+        print(f"{name:<18} {p50:8.1f} {p95:8.1f} {p99:8.1f}  {'ok' if ok else 'OVER BUDGET'}")
+    await engine.dispose()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
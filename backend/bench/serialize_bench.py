@@ -0,0 +1,204 @@
+"""Per-request CPU of the hot read endpoints: pydantic models vs raw JSON.
+
+Seeds a throwaway database with --rows analyzed generations (bench.load_test's
+seeder), then calls each endpoint in-process as a bare ASGI app, with no
+sockets, server loop or HTTP client, so the process CPU time is the
+request's own work. Each endpoint runs in two variants:
+
+    baseline  the previous implementation: pydantic items built field by
+              field (the full ORM object for the detail view), validated
+              again against response_model and serialized by FastAPI
+    fast      the current endpoints: row projections → dicts →
+              RawJSONResponse (app/responses)
+
+The two bodies are compared once per endpoint, so a dict drifting from
+its schema shows up here. Reports CPU µs per request and the speed-up.
+
+Usage (from backend/, after ``pip install -r requirements-dev.txt``):
+    python -m bench.serialize_bench --rows 2000 --iterations 500
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench.load_test import seed_history
+
+
+def _baseline_app():
+    """The endpoints as they were before the raw JSON path, on the same services."""
+    from fastapi import Depends, FastAPI, HTTPException, Query
+    from sqlalchemy import desc, select
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    from app.database import get_read_db
+    from app.models import Generation
+    from app.routers import history
+    from app.schemas import GenerationItem, GenerationListItem, HistoryResponse, TaskStatusResponse
+    from app.services import status_poller, status_writer
+
+    app = FastAPI()
+
+    def list_item(r) -> GenerationListItem:
+        r = status_writer.apply(r)
+        return GenerationListItem(
+            id=r.id, task_id=r.task_id, status=r.status, prompt=r.prompt or "", duration=r.duration,
+            bpm=r.bpm, key_scale=r.key_scale, vocal_language=r.vocal_language, audio_urls=r.audio_paths or [],
+            audio_analysis=r.audio_analysis, created_at=r.created_at, completed_at=r.completed_at,
+        )
+
+    @app.get("/api/history", response_model=HistoryResponse)
+    async def list_history(page_size: int = Query(20), db: AsyncSession = Depends(get_read_db)):
+        stmt = (
+            select(*history._LIST_COLUMNS)
+            .order_by(desc(Generation.created_at), desc(Generation.id))
+            .limit(page_size + 1)
+        )
+        rows = (await db.execute(stmt)).all()
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        next_cursor = history._encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+        return HistoryResponse(items=[list_item(r) for r in rows], next_cursor=next_cursor, total=None)
+
+    @app.get("/api/history/{gen_id}", response_model=GenerationItem)
+    async def get_generation(gen_id: int, db: AsyncSession = Depends(get_read_db)):
+        gen = (await db.execute(select(Generation).where(Generation.id == gen_id))).scalar_one_or_none()
+        if not gen:
+            raise HTTPException(status_code=404)
+        pending = status_writer.overlay(gen.task_id)
+        return GenerationItem(
+            id=gen.id, task_id=gen.task_id, status=pending.get("status", gen.status), prompt=gen.prompt,
+            lyrics=gen.lyrics, duration=gen.duration, bpm=gen.bpm, key_scale=gen.key_scale,
+            vocal_language=gen.vocal_language, audio_urls=pending.get("audio_paths", gen.audio_paths) or [],
+            audio_analysis=pending.get("audio_analysis", gen.audio_analysis), created_at=gen.created_at,
+            completed_at=pending.get("completed_at", gen.completed_at),
+        )
+
+    @app.get("/api/music/status/{task_id}", response_model=TaskStatusResponse)
+    async def get_task_status(task_id: str):
+        state = await status_poller.get_status(task_id)
+        if state is None:
+            raise HTTPException(status_code=404)
+        return TaskStatusResponse(
+            task_id=state.task_id, status=state.status, audio_urls=state.audio_urls, generation_meta=state.meta,
+            queue_position=state.queue_position, eta_seconds=state.eta_seconds,
+        )
+
+    return app
+
+
+def _fast_app():
+    """The current endpoints, alone so routing costs the same as in the baseline app."""
+    from fastapi import FastAPI
+
+    from app.routers import history, music
+
+    app = FastAPI()
+    endpoints = (history.list_history, history.get_generation, music.get_task_status)
+    for route in history.router.routes + music.router.routes:
+        if getattr(route, "endpoint", None) in endpoints:
+            app.router.routes.append(route)
+    return app
+
+
+async def _get(app, url: str) -> bytes:
+    """GET through the ASGI interface directly; returns the body (raises unless 200)."""
+    path, _, query = url.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    chunks = []
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    if status != 200:
+        raise RuntimeError(f"GET {url} returned {status}")
+    return b"".join(chunks)
+
+
+async def _cpu_per_request(app, url: str, iterations: int) -> float:
+    """Mean process CPU µs per request."""
+    for _ in range(min(20, iterations)):
+        await _get(app, url)
+    started = time.process_time()
+    for _ in range(iterations):
+        await _get(app, url)
+    return (time.process_time() - started) / iterations * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.environ.get("BENCH_DATABASE_URL"))
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench-"))
+    database_url = args.database_url or f"sqlite+aiosqlite:///{workdir / 'bench.db'}"
+    os.environ.setdefault("METRICS_ENABLED", "false")
+    await seed_history(database_url, args.rows)  # also sets DATABASE_URL for the app modules
+
+    from sqlalchemy import select, update
+
+    from app.database import async_session, engine
+    from app.models import Generation
+    from app.services import status_poller
+
+    async with async_session() as session:
+        # Two analyzed outputs per generation, like ingested ones
+        analysis = [
+            {"audio_id": f"{'ab' * 32}.mp3", "duration": 61.234, "lufs": -14.2, "peaks_url": f"/music/peaks/{'ab' * 32}.mp3"},
+            {"audio_id": f"{'cd' * 32}.mp3", "duration": 60.871, "lufs": -13.8, "peaks_url": f"/music/peaks/{'cd' * 32}.mp3"},
+        ]
+        await session.execute(update(Generation).values(audio_analysis=analysis))
+        await session.commit()
+        gen_id = (await session.execute(select(Generation.id).limit(1))).scalar_one()
+    # A task mid-flight, as a status poll sees it
+    status_poller.track(
+        "bench-status", "running", ["/music/audio?path=/bench/a.mp3", "/music/audio?path=/bench/b.mp3"],
+        {"bpm": 120, "keyscale": "C Major", "duration": 60, "prompt": "bench " * 20},
+        queue_position=3, upstream_id="bench-upstream",
+    )
+    status_poller.set_state("bench-status", eta_seconds=42.5)
+
+    cases = {
+        "history page (20)": "/api/history?page_size=20",
+        "history page (100)": "/api/history?page_size=100",
+        "generation detail": f"/api/history/{gen_id}",
+        "status poll": "/api/music/status/bench-status",
+    }
+    apps = {"baseline": _baseline_app(), "fast": _fast_app()}
+
+    mismatched = False
+    print(f"{'endpoint':<20} {'baseline':>10} {'fast':>10} {'speed-up':>9}  (CPU µs/request, {args.iterations} runs)")
+    for case, url in cases.items():
+        bodies = [json.loads(await _get(app, url)) for app in apps.values()]
+        if bodies[0] != bodies[1]:
+            mismatched = True
+            print(f"{case}: response bodies differ", file=sys.stderr)
+        cpu = {name: await _cpu_per_request(app, url, args.iterations) for name, app in apps.items()}
+        print(f"{case:<20} {cpu['baseline']:10.0f} {cpu['fast']:10.0f} {cpu['baseline'] / cpu['fast']:8.2f}x")
+
+    await engine.dispose()
+    sys.exit(1 if mismatched else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,45 @@
+"""Initial schema: the generations table as first shipped.
+
+Databases created by the app's old ``create_all`` startup already have the
+table; this revision then only records them as being at 0001.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not context.is_offline_mode() and sa.inspect(op.get_bind()).has_table("generations"):
+        return
+    op.create_table(
+        "generations",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("task_id", sa.String(64), nullable=False),
+        sa.Column("status", sa.String(20), nullable=False),
+        sa.Column("prompt", sa.Text(), nullable=False),
+        sa.Column("lyrics", sa.Text(), nullable=False),
+        sa.Column("duration", sa.Float(), nullable=True),
+        sa.Column("bpm", sa.Integer(), nullable=True),
+        sa.Column("key_scale", sa.String(32), nullable=False),
+        sa.Column("vocal_language", sa.String(10), nullable=False),
+        sa.Column("batch_size", sa.Integer(), nullable=False),
+        sa.Column("audio_paths", sa.JSON(), nullable=True),
+        sa.Column("generation_meta", sa.JSON(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("completed_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_generations_task_id", "generations", ["task_id"], unique=True)
+
+
+def downgrade():
+    op.drop_index("ix_generations_task_id", table_name="generations")
+    op.drop_table("generations")
@@ -0,0 +1,108 @@
+"""Backend queue, node routing, dedup, batch and search columns; lyrics cache table.
+
+Tolerates databases where ``create_all`` already created some of these
+(new installs between the initial schema and the switch to migrations):
+only missing columns, indexes and tables are added.
+
+The app versions that introduced these columns and indexes relied on
+``create_all``, which never alters an existing table, and shipped no
+migration of their own. An existing database therefore gets none of them
+until this revision runs: upgrade such a deployment straight to a release
+that includes it (``alembic upgrade head``), not to one of those versions.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# Keep in sync with models.Generation / models.SEARCH_DOCUMENT
+SEARCH_EXPRESSION = "to_tsvector('simple'::regconfig, coalesce(prompt, '') || ' ' || coalesce(lyrics, ''))"
+
+_COLUMNS = [
+    # Backend queue: ACE-Step's id once dispatched, the payload, who asked, estimated cost
+    sa.Column("upstream_task_id", sa.String(64), nullable=True),
+    sa.Column("request_params", sa.JSON(), nullable=True),
+    sa.Column("client_id", sa.String(64), nullable=False, server_default=""),
+    sa.Column("cost", sa.Float(), nullable=True),
+    sa.Column("dispatched_at", sa.DateTime(timezone=True), nullable=True),
+    # ACE-Step node that owns the task (several-node routing)
+    sa.Column("node", sa.String(255), nullable=False, server_default=""),
+    # Deduplication of identical requests
+    sa.Column("params_hash", sa.String(64), nullable=True),
+    sa.Column("batch_id", sa.String(64), nullable=True),
+]
+
+_INDEXES = [
+    # Deduplication lookups
+    ("ix_generations_params_hash", ["params_hash"]),
+    ("ix_generations_batch_id", ["batch_id"]),
+    # Keyset pagination of history, newest first
+    ("ix_generations_created_at_id", ["created_at", "id"]),
+]
+
+
+def _existing() -> tuple[set[str], set[str], bool]:
+    """(generations columns, generations indexes, lyrics_cache exists); all empty offline."""
+    if context.is_offline_mode():
+        return set(), set(), False
+    inspector = sa.inspect(op.get_bind())
+    return (
+        {c["name"] for c in inspector.get_columns("generations")},
+        {i["name"] for i in inspector.get_indexes("generations")},
+        inspector.has_table("lyrics_cache"),
+    )
+
+
+def upgrade():
+    columns, indexes, has_lyrics_cache = _existing()
+
+    for col in _COLUMNS:
+        if col.name not in columns:
+            op.add_column("generations", col)
+    for name, cols in _INDEXES:
+        if name not in indexes:
+            op.create_index(name, "generations", cols)
+
+    if op.get_context().dialect.name == "postgresql" and "ix_generations_search" not in indexes:
+        # Built concurrently so a large history table stays writable meanwhile
+        with op.get_context().autocommit_block():
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_generations_search "
+                f"ON generations USING gin ({SEARCH_EXPRESSION})"
+            )
+
+    if not has_lyrics_cache:
+        op.create_table(
+            "lyrics_cache",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("key", sa.String(64), nullable=False),
+            sa.Column("theme", sa.Text(), nullable=False),
+            sa.Column("language", sa.String(10), nullable=False),
+            sa.Column("genre", sa.Text(), nullable=False),
+            sa.Column("mood", sa.Text(), nullable=False),
+            sa.Column("model", sa.String(128), nullable=False),
+            sa.Column("lyrics", sa.Text(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        )
+        op.create_index("ix_lyrics_cache_key", "lyrics_cache", ["key"])
+        op.create_index("ix_lyrics_cache_created_at", "lyrics_cache", ["created_at"])
+
+
+def downgrade():
+    op.drop_index("ix_lyrics_cache_created_at", table_name="lyrics_cache")
+    op.drop_index("ix_lyrics_cache_key", table_name="lyrics_cache")
+    op.drop_table("lyrics_cache")
+    if op.get_context().dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_generations_search")
+    for name, _ in reversed(_INDEXES):
+        op.drop_index(name, table_name="generations")
+    for col in reversed(_COLUMNS):
+        op.drop_column("generations", col.name)
@@ -0,0 +1,22 @@
+"""Per-output waveform analysis summary on generations.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("generations", sa.Column("audio_analysis", sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("generations", "audio_analysis")
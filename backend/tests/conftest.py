@@ -0,0 +1,60 @@
+"""Test setup: a throwaway SQLite database (app modules read settings at import time)."""
+
+import asyncio
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+_workdir = Path(tempfile.mkdtemp(prefix="music-tests-"))
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_workdir / 'test.db'}")
+os.environ.setdefault("AUDIO_DIR", str(_workdir / "audio"))
+os.environ.setdefault("METRICS_ENABLED", "false")
+
+from sqlalchemy import delete  # noqa: E402
+
+from app.database import async_session, engine, init_db  # noqa: E402
+from app.models import Generation  # noqa: E402
+from app.services import (  # noqa: E402
+    acestep_nodes, coordination, http_pool, scheduler, status_poller, status_writer,
+)
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine in a fresh event loop against an empty ``generations`` table."""
+
+    def run(coro):
+        async def main():
+            await init_db()
+            http_pool.startup()
+            async with async_session() as session:
+                await session.execute(delete(Generation))
+                await session.commit()
+            try:
+                return await coro
+            finally:
+                # Pooled connections belong to this event loop
+                await http_pool.shutdown()
+                await engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
+
+
+@pytest.fixture
+def leader(monkeypatch):
+    """This process leads, with empty scheduler, poller and write-behind state."""
+    monkeypatch.setattr(coordination, "_leader", True)
+
+    def reset():
+        acestep_nodes._nodes.clear()
+        scheduler._reset()
+        status_poller._tasks.clear()
+        status_writer._buffer.clear()
+
+    reset()
+    yield
+    reset()
@@ -0,0 +1,84 @@
+"""Pinning downloaded audio into the library, and cache eviction."""
+
+import asyncio
+import shutil
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.services import acestep_client, audio_store
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """An empty store whose downloads serve ``files`` (source → bytes), one chunk per event loop turn."""
+    files: dict[str, bytes] = {}
+
+    async def get_audio_stream(source, node):
+        data = files[source]
+
+        async def chunks():
+            for i in range(0, len(data), 4):
+                await asyncio.sleep(0)
+                yield data[i:i + 4]
+
+        return httpx.Response(200, headers={"content-length": str(len(data))}, content=chunks())
+
+    monkeypatch.setattr(acestep_client, "get_audio_stream", get_audio_stream)
+    shutil.rmtree(settings.audio_dir, ignore_errors=True)
+    asyncio.run(audio_store.init())
+    yield files
+    audio_store._held.clear()
+
+
+def _cached() -> list[str]:
+    return sorted(p.name for p in audio_store._objects)
+
+
+def test_concurrent_ingestions_of_identical_audio_share_one_library_file(store):
+    store["/app/.cache/a.mp3"] = store["/app/.cache/b.mp3"] = b"same bytes, two tasks"
+
+    async def scenario():
+        return await asyncio.gather(
+            audio_store.fetch("/app/.cache/a.mp3", keep=True),
+            audio_store.fetch("/app/.cache/b.mp3", keep=True),
+            audio_store.fetch("/app/.cache/a.mp3", keep=True),
+        )
+
+    results = asyncio.run(scenario())
+    assert len({r.path for r in results}) == 1
+    assert results[0].path.parent.parent.name == "library" and results[0].path.exists()
+    assert _cached() == [] and audio_store.stats()["bytes"] == 0
+
+
+def test_pin_tolerates_the_cached_copy_being_gone(store):
+    store["/app/.cache/a.mp3"] = b"pinned elsewhere"
+    cached = asyncio.run(audio_store.fetch("/app/.cache/a.mp3"))
+    pinned = audio_store.pin(cached)
+    # Pinning the same object again: the cache file has already been moved
+    assert audio_store.pin(cached).path == pinned.path
+
+    store["/app/.cache/b.mp3"] = b"evicted"
+    gone = asyncio.run(audio_store.fetch("/app/.cache/b.mp3"))
+    gone.path.unlink()
+    with pytest.raises(FileNotFoundError):
+        audio_store.pin(gone)
+
+
+def test_eviction_skips_objects_waiting_to_be_pinned(store, monkeypatch):
+    monkeypatch.setattr(settings, "audio_cache_max_bytes", 20)
+    for name in ("a", "b", "c"):
+        store[f"/app/.cache/{name}.mp3"] = name.encode() * 10
+
+    async def scenario():
+        first = await audio_store.fetch("/app/.cache/a.mp3")
+        audio_store._held["/app/.cache/a.mp3"] = first.path  # as during fetch(..., keep=True)
+        await audio_store.fetch("/app/.cache/b.mp3")
+        await audio_store.fetch("/app/.cache/c.mp3")
+        return first
+
+    first = asyncio.run(scenario())
+    # Over budget: "b" goes although "a" is older
+    assert first.path.exists() and first.path in audio_store._objects
+    assert len(audio_store._objects) == 2
@@ -0,0 +1,35 @@
+"""Which earlier generations an identical request may join or reuse."""
+
+import pytest
+from sqlalchemy import insert
+
+from app.database import async_session
+from app.models import Generation
+from app.services import dedup, status_writer
+
+DIGEST = "d" * 64
+
+
+async def _find(status: str, deterministic: bool, buffered: str | None = None):
+    async with async_session() as session:
+        await session.execute(insert(Generation), [{"task_id": "t1", "status": status, "params_hash": DIGEST}])
+        await session.commit()
+    if buffered is not None:
+        status_writer.write("t1", status=buffered)
+    async with async_session() as session:
+        return await dedup.find_existing(session, DIGEST, deterministic)
+
+
+@pytest.mark.parametrize("status, buffered, deterministic, joined", [
+    ("running", None, False, "running"),
+    ("dispatching", None, False, "pending"),  # clients see a claimed row as still queued
+    ("succeeded", None, False, None),  # unseeded output differs every time
+    ("succeeded", None, True, "succeeded"),
+    ("failed", None, True, None),
+    ("running", "succeeded", False, None),  # finished, just not flushed yet
+    ("running", "succeeded", True, "succeeded"),
+    ("running", "failed", True, None),
+])
+def test_find_existing(run, leader, status, buffered, deterministic, joined):
+    found = run(_find(status, deterministic, buffered))
+    assert (found[2] if found else None) == joined
@@ -0,0 +1,23 @@
+"""Migrations build the schema the models describe (the app only runs ``create_all`` on SQLite)."""
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect
+
+from app.database import Base
+
+
+def test_upgrade_head_matches_models(tmp_path):
+    url = f"sqlite:///{tmp_path / 'migrated.db'}"
+    config = Config("alembic.ini")
+    config.set_main_option("sqlalchemy.url", url.replace("sqlite://", "sqlite+aiosqlite://"))
+    command.upgrade(config, "head")
+
+    engine = create_engine(url)
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        assert {c["name"] for c in inspector.get_columns(table.name)} == {c.name for c in table.columns}
+        # The full-text search index is Postgres-only
+        expected = {i.name for i in table.indexes if i.name != "ix_generations_search"}
+        assert expected <= {i["name"] for i in inspector.get_indexes(table.name)}
+    engine.dispose()
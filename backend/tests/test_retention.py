@@ -0,0 +1,133 @@
+"""Deleting generations and the audio files only they reference."""
+
+import asyncio
+import hashlib
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import insert
+
+from app.config import settings
+from app.database import async_session
+from app.models import Generation
+from app.routers import history
+from app.services import audio_ingest, audio_store, retention, status_writer
+
+
+def _library_file(name: str) -> str:
+    """Create a library file; returns its audio id."""
+    digest = hashlib.sha256(name.encode()).hexdigest()
+    path = audio_store._object_path(digest, ".mp3", "library")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(name.encode())
+    return path.name
+
+
+def _exists(audio_id: str) -> bool:
+    return audio_store._object_path(audio_id[:64], audio_id[64:], "library").exists()
+
+
+async def _insert(*rows: tuple[str, str, list[str]]):
+    """(task id, status, audio paths) rows."""
+    async with async_session() as session:
+        await session.execute(insert(Generation), [
+            {"task_id": task_id, "status": status, "audio_paths": paths} for task_id, status, paths in rows
+        ])
+        await session.commit()
+
+
+@pytest.fixture
+def store(leader, monkeypatch):
+    monkeypatch.setattr(settings, "retention_sweep_grace", 0.0)
+
+
+@pytest.mark.parametrize("with_marks", [False, True])
+def test_files_go_with_their_last_reference(store, run, with_marks):
+    async def scenario():
+        await audio_store.init()
+        shared, own = _library_file("shared"), _library_file("own")
+        await _insert(
+            ("first", "succeeded", [audio_ingest.local_url(shared), audio_ingest.local_url(own)]),
+            ("second", "succeeded", [audio_ingest.local_url(shared)]),
+        )
+        if not with_marks:
+            # Contains the shared id, but isn't a reference to it (the marks may keep a file for
+            # a lookalike: they compare 64 bits of the digest)
+            await _insert(("lookalike", "failed", [audio_ingest.local_url(shared) + ".bak"]))
+
+        async def delete(task_id: str):
+            marks = await retention._mark() if with_marks else None
+            return await retention.delete_generations(Generation.task_id == task_id, reason="test", marks=marks)
+
+        deleted, freed = await delete("first")
+        after_first = (deleted, _exists(shared), _exists(own), freed.get("library", 0))
+        await delete("second")
+        return after_first, _exists(shared)
+
+    (deleted, shared_kept, own_kept, freed), shared_after_second = run(scenario())
+    assert deleted == 1 and shared_kept and not own_kept and freed == len("own")
+    assert not shared_after_second
+
+
+def test_concurrent_deletes_of_a_files_last_references_remove_it(store, run):
+    async def scenario():
+        await audio_store.init()
+        shared = _library_file("shared")
+        await _insert(*[(f"gen{i}", "succeeded", [audio_ingest.local_url(shared)]) for i in range(4)])
+        results = await asyncio.gather(*[
+            retention.delete_generations(Generation.task_id == f"gen{i}", reason="test") for i in range(4)
+        ])
+        return sum(deleted for deleted, _ in results), _exists(shared)
+
+    # Whichever delete commits last sees no reference left; a file removed twice is no error
+    assert run(scenario()) == (4, False)
+
+
+def test_buffered_and_recent_references_keep_files(store, monkeypatch, run):
+    async def scenario():
+        await audio_store.init()
+        buffered, recent = _library_file("buffered"), _library_file("recent")
+        await _insert(
+            ("old", "succeeded", [audio_ingest.local_url(buffered), audio_ingest.local_url(recent)]),
+            ("ingesting", "running", None),
+        )
+        # An ingestion pointed this generation at the file; the write hasn't been flushed yet
+        status_writer.write("ingesting", audio_paths=[audio_ingest.local_url(buffered)])
+        await retention.delete_generations(Generation.task_id == "old", reason="test")
+        return _exists(buffered), _exists(recent)
+
+    assert run(scenario()) == (True, False)
+
+    monkeypatch.setattr(settings, "retention_sweep_grace", 3600.0)
+
+    async def within_grace():
+        await audio_store.init()
+        fresh = _library_file("fresh")
+        await _insert(("old", "succeeded", [audio_ingest.local_url(fresh)]))
+        await retention.delete_generations(Generation.task_id == "old", reason="test")
+        return _exists(fresh)
+
+    # Unreferenced, but modified within the grace period: left to a later sweep
+    assert run(within_grace())
+
+
+def test_delete_endpoint_refuses_unfinished_generations(store, run):
+    app = FastAPI()
+    app.include_router(history.router)
+
+    async def scenario():
+        await _insert(("running", "running", None), ("finishing", "running", None))
+        status_writer.write("finishing", status="succeeded")  # not flushed yet, but listed as finished
+        async with async_session() as session:
+            ids = dict((await session.execute(
+                Generation.__table__.select().with_only_columns(Generation.task_id, Generation.id)
+            )).all())
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [
+                (await client.delete(f"/api/history/{gen_id}")).status_code
+                for gen_id in (ids["running"], ids["finishing"], ids["finishing"])
+            ]
+
+    assert run(scenario()) == [409, 200, 404]
@@ -0,0 +1,112 @@
+"""Admission control and dispatch bookkeeping of the backend queue."""
+
+import pytest
+from sqlalchemy import insert, select
+
+from app.config import settings
+from app.database import async_session
+from app.models import Generation
+from app.services import acestep_client, acestep_nodes, scheduler, status_writer
+
+# 60 s, 1 variant, 8 steps: 1.0 cost unit
+SMALL = {"audio_duration": 60, "batch_size": 1, "inference_steps": 8}
+# The largest request the schema accepts: 250 units, over the default queue limit
+LARGEST = {"audio_duration": 300, "batch_size": 8, "inference_steps": 50}
+
+
+@pytest.fixture
+def queue_limit(monkeypatch):
+    monkeypatch.setattr(settings, "scheduler_max_queue_cost", 100.0)
+    monkeypatch.setattr(settings, "scheduler_default_throughput", 1.0)
+
+
+async def _row(task_id: str):
+    async with async_session() as session:
+        return (await session.execute(
+            select(Generation.status, Generation.upstream_task_id, Generation.node)
+            .where(Generation.task_id == task_id)
+        )).one()
+
+
+def test_job_over_the_queue_limit_is_admitted_when_queue_is_empty(leader, queue_limit, run):
+    assert scheduler.estimate_cost(LARGEST) > settings.scheduler_max_queue_cost
+
+    async def scenario():
+        gen = await scheduler.enqueue(LARGEST, "alice")
+        return gen.status, scheduler._local_stats()
+
+    status, stats = run(scenario())
+    assert status == "pending"
+    assert stats["pending"] == 1
+
+
+def test_full_queue_rejects_with_retry_after_until_it_drains(leader, queue_limit, run):
+    async def scenario():
+        await scheduler.enqueue(LARGEST, "alice")
+        with pytest.raises(scheduler.QueueFull) as small:
+            await scheduler.enqueue(SMALL, "bob")
+        with pytest.raises(scheduler.QueueFull) as large:
+            await scheduler.enqueue(LARGEST, "bob")
+        return small.value.retry_after, large.value.retry_after
+
+    small_wait, large_wait = run(scenario())
+    # At 1 unit/s: 151 units must drain before 1 more fits; the large job waits for an empty queue
+    assert small_wait == pytest.approx(151.0)
+    assert large_wait == pytest.approx(250.0)
+
+
+def test_accepted_dispatch_is_kept_when_recording_it_fails(leader, monkeypatch, run):
+    node = acestep_nodes.candidates()[0].name
+    submitted = []
+
+    async def submit_task(payload, nodes):
+        submitted.append(payload)
+        return {"task_id": "upstream-1", "status": 0, "queue_position": 1, "node": node}
+
+    session_factory = scheduler.async_session
+
+    def failing_after_submit():
+        if submitted and not failures:
+            failures.append(True)
+            raise RuntimeError("database unavailable")
+        return session_factory()
+
+    failures: list[bool] = []
+    monkeypatch.setattr(acestep_client, "submit_task", submit_task)
+    monkeypatch.setattr(scheduler, "async_session", failing_after_submit)
+
+    async def scenario():
+        gen = await scheduler.enqueue(SMALL, "alice")
+        assert await scheduler._dispatch_ready()
+        stats = scheduler._local_stats()
+        await status_writer.flush()
+        return gen.task_id, stats, await _row(gen.task_id)
+
+    task_id, stats, row = run(scenario())
+    assert failures and len(submitted) == 1
+    # Not put back into the queue: ACE-Step runs it, and the write landed through the status writer
+    assert stats["pending"] == 0 and stats["inflight_by_node"] == {node: {"tasks": 1, "cost": 1.0}}
+    assert tuple(row) == ("queued", "upstream-1", node)
+
+
+def test_load_reconciles_claimed_rows_after_a_restart(leader, run):
+    node = acestep_nodes.nodes()[0].name
+
+    async def scenario():
+        async with async_session() as session:
+            await session.execute(insert(Generation), [
+                # Claimed, then the worker died before ACE-Step answered
+                {"task_id": "interrupted", "status": "dispatching", "node": node, "cost": 1.0, "request_params": SMALL},
+                # Accepted by ACE-Step, but only part of the dispatch write landed
+                {"task_id": "accepted", "status": "dispatching", "node": node, "upstream_task_id": "upstream-2",
+                 "cost": 2.0, "request_params": SMALL},
+            ])
+            await session.commit()
+        await scheduler._load()
+        await status_writer.flush()
+        return scheduler._local_stats(), await _row("interrupted"), await _row("accepted")
+
+    stats, interrupted, accepted = run(scenario())
+    assert stats["pending"] == 1 and interrupted.status == "pending"
+    assert stats["inflight_by_node"] == {node: {"tasks": 1, "cost": 2.0}}
+    assert accepted.status == "queued"
@@ -0,0 +1,161 @@
+"""Dispatch across several ACE-Step nodes, against local bench.fakes servers.
+
+Checks that new tasks go to the least-loaded healthy nodes, that the
+in-flight caps hold per node (a node that is down doesn't lend its share
+to the others), and that each task is polled on, and its audio fetched
+from, the node that owns it.
+"""
+
+import asyncio
+import subprocess
+import sys
+import time
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import pytest
+from sqlalchemy import select
+
+from app.config import settings
+from app.database import async_session
+from app.models import Generation
+from app.services import acestep_nodes, scheduler, status_poller
+from bench.load_test import BACKEND_DIR, _free_port
+
+GEN_SECONDS = 1.5
+# One job with these parameters costs exactly 1.0 unit
+PAYLOAD = {"audio_duration": 60, "batch_size": 1, "inference_steps": 8}
+
+
+def _wait_up(url: str, proc: subprocess.Popen, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"fake ACE-Step on {url} exited")
+        try:
+            if httpx.get(f"{url}/health").status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"fake ACE-Step on {url} did not start")
+
+
+@pytest.fixture(scope="module")
+def fakes():
+    """Three fake ACE-Step nodes; yields their base URLs."""
+    procs, urls = [], []
+    for _ in range(3):
+        port = _free_port()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "bench.fakes", "acestep", "--port", str(port),
+             "--gen-seconds", str(GEN_SECONDS), "--audio-bytes", "1000"],
+            cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        procs.append(proc)
+        urls.append(f"http://127.0.0.1:{port}")
+    try:
+        for url, proc in zip(urls, procs):
+            _wait_up(url, proc)
+        yield urls
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+
+@pytest.fixture
+def cluster(fakes, leader, monkeypatch):
+    """The fakes as ACE-Step nodes; yields their node names."""
+    monkeypatch.setattr(settings, "acestep_urls", ",".join(fakes))
+    monkeypatch.setattr(settings, "scheduler_max_inflight", 2)
+    monkeypatch.setattr(settings, "scheduler_max_inflight_cost", 8.0)
+    if scheduler._on_transition not in status_poller._transition_hooks:
+        status_poller.add_transition_hook(scheduler._on_transition)
+    yield [acestep_nodes.node_name(url) for url in fakes]
+
+
+async def _enqueue(n: int, client: str = "test") -> list[str]:
+    return [(await scheduler.enqueue(PAYLOAD, client)).task_id for _ in range(n)]
+
+
+async def _nodes_by_task() -> dict[str, str]:
+    async with async_session() as session:
+        rows = await session.execute(
+            select(Generation.task_id, Generation.node).where(Generation.status == "queued")
+        )
+        return {task_id: node for task_id, node in rows}
+
+
+def _tasks_on(url: str) -> int:
+    return httpx.get(f"{url}/stats").json()["tasks"]
+
+
+def test_routing_spreads_tasks_across_nodes(cluster, fakes, run):
+    async def scenario():
+        await _enqueue(6)
+        assert await scheduler._dispatch_ready()
+        return await _nodes_by_task()
+
+    before = [_tasks_on(url) for url in fakes]
+    placed = run(scenario())
+    assert len(placed) == 6
+    # Least-loaded first: two tasks per node, each on the node that accepted it
+    assert sorted(placed.values()) == sorted(cluster * 2)
+    assert [_tasks_on(url) - n for url, n in zip(fakes, before)] == [2, 2, 2]
+
+
+def test_inflight_cap_is_per_node_when_nodes_are_down(cluster, fakes, run):
+    async def scenario():
+        for name in cluster[1:]:
+            acestep_nodes.get(name).healthy = False  # as the health probes would mark them
+        await _enqueue(6)
+        assert await scheduler._dispatch_ready()
+        return await _nodes_by_task(), scheduler._local_stats()
+
+    placed, stats = run(scenario())
+    # The healthy node takes its own cap only, not the share of the two that are down
+    assert list(placed.values()) == [cluster[0]] * 2
+    assert stats["pending"] == 4
+    assert stats["inflight_by_node"] == {cluster[0]: {"tasks": 2, "cost": 2.0}}
+
+
+def test_inflight_cost_cap_is_per_node(cluster, fakes, monkeypatch, run):
+    monkeypatch.setattr(settings, "scheduler_max_inflight", 10)
+    monkeypatch.setattr(settings, "scheduler_max_inflight_cost", 1.5)
+
+    async def scenario():
+        await _enqueue(6)
+        assert await scheduler._dispatch_ready()
+        return scheduler._local_stats()
+
+    stats = run(scenario())
+    # 1.0 unit each: a second job would take a node to 2.0 > 1.5
+    assert stats["inflight"] == 3
+    assert {node: s["tasks"] for node, s in stats["inflight_by_node"].items()} == dict.fromkeys(cluster, 1)
+
+
+def test_tasks_are_polled_on_their_own_node(cluster, fakes, run):
+    async def scenario():
+        await _enqueue(4)
+        assert await scheduler._dispatch_ready()
+        placed = await _nodes_by_task()
+        deadline = time.monotonic() + GEN_SECONDS + 5
+        while time.monotonic() < deadline:
+            await status_poller.poll_once()
+            if all(status_poller.lookup(t).status == "succeeded" for t in placed):
+                break
+            await asyncio.sleep(0.3)
+        # Finished tasks free their node's slots for the rest of the queue
+        await _enqueue(2)
+        assert await scheduler._dispatch_ready()
+        return placed, {t: status_poller.lookup(t) for t in placed}, scheduler._local_stats()
+
+    placed, states, stats = run(scenario())
+    for task_id, node in placed.items():
+        state = states[task_id]
+        assert state.status == "succeeded"
+        assert state.node == node
+        # Audio is fetched from the node that produced it
+        assert {parse_qs(urlparse(url).query)["node"][0] for url in state.audio_urls} == {node}
+    assert stats["inflight"] == 2
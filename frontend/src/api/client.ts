@@ -12,9 +12,19 @@ const API_HOST =
 
 const BASE = `${API_HOST}/api`;
 
+/** Stable per-browser id — the backend queue shares GPU time fairly between clients */
+function clientId(): string {
+  let id = localStorage.getItem("client_id");
+  if (!id) {
+    id = crypto.randomUUID();
+    localStorage.setItem("client_id", id);
+  }
+  return id;
+}
+
 async function request<T>(path: string, options?: RequestInit): Promise<T> {
   const res = await fetch(`${BASE}${path}`, {
-    headers: { "Content-Type": "application/json" },
+    headers: { "Content-Type": "application/json", "X-Client-Id": clientId() },
     ...options,
   });
   if (!res.ok) {
@@ -37,12 +47,16 @@ export interface GenerateParams {
   thinking: boolean;
   batch_size: number;
   inference_steps: number;
+  /** Fixed seed — identical seeded requests reuse an earlier result */
+  seed?: number | null;
 }
 
 export interface GenerateResult {
   id: number;
   task_id: string;
   status: string;
+  /** Answered by an identical in-flight or finished generation */
+  deduplicated: boolean;
 }
 
 export interface TaskStatus {
@@ -50,6 +64,9 @@ export interface TaskStatus {
   status: string;
   audio_urls: string[];
   generation_meta: Record<string, unknown> | null;
+  queue_position: number | null;
+  /** Estimated seconds until a pending task finishes waiting in the backend queue */
+  eta_seconds: number | null;
 }
 
 export function generateMusic(params: GenerateParams) {
@@ -63,11 +80,125 @@ export function getTaskStatus(taskId: string) {
   return request<TaskStatus>(`/music/status/${taskId}`);
 }
 
+const isTerminal = (status: string) => status === "succeeded" || status === "failed";
+
+/**
+ * Follow a task's status until it succeeds or fails.
+ * Uses the server-sent event stream; falls back to polling every 2s if
+ * EventSource is unavailable or the stream errors out.
+ * Returns a function that stops watching.
+ */
+export function watchTask(taskId: string, onUpdate: (status: TaskStatus) => void): () => void {
+  let stopped = false;
+  let source: EventSource | null = null;
+  let timer: ReturnType<typeof setInterval> | undefined;
+
+  const stop = () => {
+    stopped = true;
+    source?.close();
+    clearInterval(timer);
+  };
+
+  const startPolling = () => {
+    const poll = async () => {
+      try {
+        const res = await getTaskStatus(taskId);
+        if (stopped) return;
+        onUpdate(res);
+        if (isTerminal(res.status)) stop();
+      } catch {
+        // Keep polling on network errors
+      }
+    };
+    timer = setInterval(poll, 2000);
+    poll(); // Immediate first check
+  };
+
+  if (typeof EventSource === "undefined") {
+    startPolling();
+    return stop;
+  }
+
+  source = new EventSource(`${BASE}/music/events/${taskId}`);
+  source.addEventListener("status", (e) => {
+    const res: TaskStatus = JSON.parse((e as MessageEvent<string>).data);
+    onUpdate(res);
+    if (isTerminal(res.status)) stop();
+  });
+  source.onerror = () => {
+    source?.close();
+    if (!stopped) startPolling();
+  };
+
+  return stop;
+}
+
 /** Build full audio URL for an audio path returned by the status endpoint */
 export function audioUrl(path: string): string {
   return `${BASE}${path}`;
 }
 
+/** Preview renditions: smaller files for browsing; the backend picks Opus or AAC from Accept */
+export type AudioQuality = "low" | "medium" | "original";
+
+/** Audio URL for a rendition of the same track */
+export function withQuality(url: string, quality: AudioQuality): string {
+  if (quality === "original") return url;
+  return `${url}${url.includes("?") ? "&" : "?"}quality=${quality}`;
+}
+
+/** Measured properties of one generated track */
+export interface AudioAnalysis {
+  audio_id: string;
+  duration: number;
+  lufs: number | null;
+  peaks_url: string;
+}
+
+/** Precomputed waveform: min/max pairs in -1..1 and the exact duration */
+export interface Waveform {
+  peaks: Float32Array;
+  duration: number;
+  lufs: number | null;
+}
+
+/** Parse the backend's binary peaks file (layout in backend services/audio_analysis) */
+function parseWaveform(buf: ArrayBuffer, maxBuckets: number): Waveform | null {
+  const view = new DataView(buf);
+  if (buf.byteLength < 24 || new TextDecoder().decode(buf.slice(0, 4)) !== "PEAK" || view.getUint16(4, true) !== 1) {
+    return null;
+  }
+  const levels = view.getUint16(6, true);
+  const sampleRate = view.getUint32(8, true);
+  const samples = Number(view.getBigUint64(12, true));
+  const lufs = view.getFloat32(20, true);
+
+  // Levels are coarsest first; keep the finest one that fits
+  let offset = 24;
+  let best: Int8Array | null = null;
+  for (let i = 0; i < levels; i++) {
+    const buckets = view.getUint32(offset, true);
+    const level = new Int8Array(buf, offset + 4, buckets * 2);
+    offset += 4 + buckets * 2;
+    if (!best || buckets <= maxBuckets) best = level;
+  }
+  if (!best) return null;
+  return {
+    peaks: Float32Array.from(best, (v) => v / 128),
+    duration: samples / sampleRate,
+    lufs: Number.isNaN(lufs) ? null : lufs,
+  };
+}
+
+/** Waveform of an ingested track, or null if it has none (ACE-Step URLs, analysis off) */
+export async function fetchWaveform(audioUrl: string, maxBuckets = 2048, signal?: AbortSignal): Promise<Waveform | null> {
+  const match = audioUrl.match(/\/music\/audio\/([0-9a-f]{64}\.\w+)(?:\?|$)/);
+  if (!match) return null;
+  const res = await fetch(`${BASE}/music/peaks/${match[1]}`, { signal });
+  if (!res.ok) return null;
+  return parseWaveform(await res.arrayBuffer(), maxBuckets);
+}
+
 // ---------- Lyrics ----------
 
 export interface LyricsParams {
@@ -75,11 +206,13 @@ export interface LyricsParams {
   language: string;
   genre: string;
   mood: string;
+  fresh?: boolean; // skip the server-side lyrics cache
 }
 
 export interface LyricsResult {
   lyrics: string;
   language: string;
+  cached: boolean;
 }
 
 export function generateLyrics(params: LyricsParams) {
@@ -89,30 +222,94 @@ export function generateLyrics(params: LyricsParams) {
   });
 }
 
+export interface LyricsStreamSummary extends LyricsResult {
+  ttft_ms: number | null;
+  tokens: number;
+  tokens_per_s: number | null;
+}
+
+/**
+ * Generate lyrics token by token. Calls onToken for every chunk and
+ * resolves with the final summary. Aborting the signal closes the
+ * connection, which stops generation on the server.
+ */
+export async function streamLyrics(
+  params: LyricsParams,
+  onToken: (text: string) => void,
+  signal?: AbortSignal
+): Promise<LyricsStreamSummary> {
+  const res = await fetch(`${BASE}/lyrics/generate/stream`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json", "X-Client-Id": clientId() },
+    body: JSON.stringify(params),
+    signal,
+  });
+  if (!res.ok || !res.body) {
+    const err = await res.json().catch(() => ({ detail: res.statusText }));
+    throw new Error(err.detail || "Request failed");
+  }
+
+  // EventSource can't POST, so parse the SSE frames by hand
+  const reader = res.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += value;
+    let sep: number;
+    while ((sep = buffer.indexOf("\n\n")) >= 0) {
+      const frame = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      const event = frame.match(/^event: (.*)$/m)?.[1];
+      const data = frame.match(/^data: (.*)$/m)?.[1];
+      if (!event || data === undefined) continue;
+      const payload = JSON.parse(data);
+      if (event === "token") onToken(payload.text);
+      else if (event === "done") return payload as LyricsStreamSummary;
+      else if (event === "error") throw new Error(payload.detail || "Lyrics generation failed");
+    }
+  }
+  throw new Error("Lyrics stream ended unexpectedly");
+}
+
 // ---------- History ----------
 
-export interface GenerationItem {
+/** History list row — lyrics are only in the full GenerationItem */
+export interface GenerationListItem {
   id: number;
   task_id: string;
   status: string;
   prompt: string;
-  lyrics: string;
   duration: number | null;
   bpm: number | null;
   key_scale: string;
   vocal_language: string;
   audio_urls: string[];
+  /** Aligned with audio_urls; null until the backend has analyzed the tracks */
+  audio_analysis: (AudioAnalysis | null)[] | null;
   created_at: string;
   completed_at: string | null;
 }
 
+export interface GenerationItem extends GenerationListItem {
+  lyrics: string;
+}
+
 export interface HistoryResult {
-  items: GenerationItem[];
-  total: number;
+  items: GenerationListItem[];
+  next_cursor: string | null;
+  total: number | null;
+}
+
+export function getHistory(cursor: string | null = null, pageSize = 20, includeTotal = false) {
+  const params = new URLSearchParams({ page_size: String(pageSize) });
+  if (cursor) params.set("cursor", cursor);
+  if (includeTotal) params.set("include_total", "true");
+  return request<HistoryResult>(`/history?${params}`);
 }
 
-export function getHistory(page = 1, pageSize = 20) {
-  return request<HistoryResult>(`/history?page=${page}&page_size=${pageSize}`);
+export function getGeneration(id: number) {
+  return request<GenerationItem>(`/history/${id}`);
 }
 
 export function deleteGeneration(id: number) {
@@ -121,12 +318,50 @@ export function deleteGeneration(id: number) {
 
 // ---------- Health ----------
 
-export interface HealthResult {
-  status: string;
+export interface Readiness {
   acestep: boolean;
   ollama: boolean;
+  /** Ollama is up and the lyrics model has been pulled */
+  lyrics_model: boolean;
+}
+
+export interface HealthResult extends Readiness {
+  status: string;
+  upstreams: Record<string, Record<string, unknown>>;
 }
 
 export function getHealth() {
   return request<HealthResult>("/health");
 }
+
+// One shared readiness stream for every listener on the page
+const readinessListeners = new Set<(r: Readiness) => void>();
+let readinessSource: EventSource | null = null;
+let lastReadiness: Readiness | null = null;
+
+/**
+ * Subscribe to upstream readiness, pushed by the backend when it changes.
+ * Calls onChange with the latest known state right away if there is one.
+ * Returns a function that unsubscribes.
+ */
+export function watchReadiness(onChange: (r: Readiness) => void): () => void {
+  readinessListeners.add(onChange);
+  if (lastReadiness) onChange(lastReadiness);
+
+  if (!readinessSource && typeof EventSource !== "undefined") {
+    // EventSource reconnects on its own after errors
+    readinessSource = new EventSource(`${BASE}/health/events`);
+    readinessSource.addEventListener("readiness", (e) => {
+      lastReadiness = JSON.parse((e as MessageEvent<string>).data);
+      readinessListeners.forEach((listener) => listener(lastReadiness!));
+    });
+  }
+
+  return () => {
+    readinessListeners.delete(onChange);
+    if (readinessListeners.size === 0) {
+      readinessSource?.close();
+      readinessSource = null;
+    }
+  };
+}
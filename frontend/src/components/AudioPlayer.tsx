@@ -2,6 +2,7 @@ import { useRef, useEffect, useState } from "react";
 import WaveSurfer from "wavesurfer.js";
 import { Play, Pause, SkipBack, SkipForward, Download, Volume2 } from "lucide-react";
 import { cn } from "@/lib/utils";
+import { fetchWaveform, withQuality, type AudioQuality } from "@/api/client";
 
 // Global event so only one player is active at a time.
 // When any player starts, it fires "audioplayer:play" with its id.
@@ -12,10 +13,12 @@ let playerIdCounter = 0;
 interface Props {
   /** List of audio URLs to play */
   urls: string[];
+  /** Rendition to stream; the download link always gets the original */
+  quality?: AudioQuality;
   className?: string;
 }
 
-export default function AudioPlayer({ urls, className }: Props) {
+export default function AudioPlayer({ urls, quality = "original", className }: Props) {
   const containerRef = useRef<HTMLDivElement>(null);
   const wsRef = useRef<WaveSurfer | null>(null);
   const playerIdRef = useRef(++playerIdCounter);
@@ -81,14 +84,31 @@ export default function AudioPlayer({ urls, className }: Props) {
     });
     ws.on("pause", () => setPlaying(false));
 
-    ws.load(currentUrl);
     wsRef.current = ws;
 
+    // Draw from precomputed peaks when the backend has them — no need to
+    // download and decode the whole file before showing the waveform
+    const abort = new AbortController();
+    const width = containerRef.current.clientWidth || 2048;
+    fetchWaveform(currentUrl, width, abort.signal)
+      .catch(() => null)
+      .then((waveform) => {
+        if (abort.signal.aborted) return;
+        const src = withQuality(currentUrl, quality);
+        if (waveform) {
+          setDuration(waveform.duration);
+          ws.load(src, [waveform.peaks], waveform.duration);
+        } else {
+          ws.load(src);
+        }
+      });
+
     return () => {
+      abort.abort();
       killWs(ws);
       if (wsRef.current === ws) wsRef.current = null;
     };
-  }, [currentUrl]);
+  }, [currentUrl, quality]);
 
   const toggle = () => wsRef.current?.playPause();
   const prev = () => currentIndex > 0 && setCurrentIndex((i) => i - 1);
@@ -1,7 +1,8 @@
 import { NavLink } from "react-router-dom";
 import { Music, PenLine, Clock, Disc3 } from "lucide-react";
 import { cn } from "@/lib/utils";
-import type { ReactNode } from "react";
+import { useEffect, useState, type ReactNode } from "react";
+import { watchReadiness, type Readiness } from "@/api/client";
 
 const NAV_ITEMS = [
   { to: "/", icon: Music, label: "Generate" },
@@ -28,7 +29,24 @@ function SidebarLink({ to, icon: Icon, label }: (typeof NAV_ITEMS)[number]) {
   );
 }
 
+function StatusDot({ label, ok }: { label: string; ok: boolean | undefined }) {
+  return (
+    <p className="flex items-center gap-2">
+      <span
+        className={cn(
+          "w-1.5 h-1.5 rounded-full",
+          ok === undefined ? "bg-gray-600" : ok ? "bg-green-400" : "bg-red-400"
+        )}
+      />
+      {label}
+    </p>
+  );
+}
+
 export default function Layout({ children }: { children: ReactNode }) {
+  const [ready, setReady] = useState<Readiness | null>(null);
+  useEffect(() => watchReadiness(setReady), []);
+
   return (
     <div className="flex h-screen overflow-hidden">
       {/* Sidebar */}
@@ -60,6 +78,10 @@ export default function Layout({ children }: { children: ReactNode }) {
             <p className="font-medium text-gray-400 mb-1">Model</p>
             <p>ACE-Step v1.5 Turbo</p>
             <p>LM 1.7B + DiT</p>
+            <div className="mt-2 pt-2 border-t border-surface-200/50 space-y-1">
+              <StatusDot label="ACE-Step" ok={ready?.acestep} />
+              <StatusDot label="Lyrics model" ok={ready?.lyrics_model} />
+            </div>
           </div>
         </div>
       </aside>
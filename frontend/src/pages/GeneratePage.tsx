@@ -1,4 +1,4 @@
-import { useState, useEffect, useRef } from "react";
+import { useState, useEffect } from "react";
 import {
   Sparkles,
   Loader2,
@@ -13,7 +13,7 @@ import {
   ChevronDown,
 } from "lucide-react";
 import { cn } from "@/lib/utils";
-import { generateMusic, getTaskStatus, audioUrl } from "@/api/client";
+import { generateMusic, watchTask, audioUrl } from "@/api/client";
 import AudioPlayer from "@/components/AudioPlayer";
 
 const LANGUAGES = [
@@ -73,42 +73,35 @@ export default function GeneratePage() {
   const [status, setStatus] = useState("");
   const [audioUrls, setAudioUrls] = useState<string[]>([]);
   const [error, setError] = useState("");
-  const pollRef = useRef<ReturnType<typeof setInterval>>();
+  const [queuePosition, setQueuePosition] = useState<number | null>(null);
+  const [eta, setEta] = useState<number | null>(null);
 
-  // Poll for task completion
+  // Follow task progress (pushed over SSE, polling fallback)
   useEffect(() => {
     if (!taskId) return;
 
-    const poll = async () => {
-      try {
-        const res = await getTaskStatus(taskId);
-        setStatus(res.status);
+    return watchTask(taskId, (res) => {
+      setStatus(res.status);
+      setQueuePosition(res.queue_position);
+      setEta(res.eta_seconds);
 
-        if (res.status === "succeeded" && res.audio_urls.length > 0) {
-          setAudioUrls(res.audio_urls.map(audioUrl));
-          setGenerating(false);
-          clearInterval(pollRef.current);
-        } else if (res.status === "failed") {
-          setError("Generation failed. Try again.");
-          setGenerating(false);
-          clearInterval(pollRef.current);
-        }
-      } catch {
-        // Keep polling on network errors
+      if (res.status === "succeeded" && res.audio_urls.length > 0) {
+        setAudioUrls(res.audio_urls.map(audioUrl));
+        setGenerating(false);
+      } else if (res.status === "failed") {
+        setError("Generation failed. Try again.");
+        setGenerating(false);
       }
-    };
-
-    pollRef.current = setInterval(poll, 2000);
-    poll(); // Immediate first check
-
-    return () => clearInterval(pollRef.current);
+    });
   }, [taskId]);
 
   const handleGenerate = async () => {
     setError("");
     setAudioUrls([]);
     setGenerating(true);
-    setStatus("queued");
+    setStatus("pending");
+    setQueuePosition(null);
+    setEta(null);
 
     try {
       const res = await generateMusic({
@@ -356,7 +349,11 @@ export default function GeneratePage() {
         {generating ? (
           <>
             <Loader2 size={20} className="animate-spin" />
-            {status === "queued" ? "Waiting in queue..." : "Generating..."}
+            {status === "pending" || status === "queued"
+              ? `Waiting in queue${queuePosition ? ` (#${queuePosition})` : ""}${
+                  eta ? ` ~${Math.ceil(eta / 60)} min` : ""
+                }...`
+              : "Generating..."}
           </>
         ) : (
           <>
@@ -2,7 +2,13 @@ import { useState } from "react";
 import { useQuery, useMutation, useQueryClient } from "@tanstack/react-query";
 import { Clock, Music2, Trash2, Loader2, ChevronLeft, ChevronRight } from "lucide-react";
 import { cn } from "@/lib/utils";
-import { getHistory, deleteGeneration, audioUrl, type GenerationItem } from "@/api/client";
+import {
+  getHistory,
+  getGeneration,
+  deleteGeneration,
+  audioUrl,
+  type GenerationListItem,
+} from "@/api/client";
 import AudioPlayer from "@/components/AudioPlayer";
 
 function StatusBadge({ status }: { status: string }) {
@@ -19,19 +25,33 @@ function StatusBadge({ status }: { status: string }) {
   );
 }
 
+/** Measured length of the first variant once analyzed, else the requested duration */
+function formatDuration(item: GenerationListItem): string {
+  const measured = item.audio_analysis?.[0]?.duration;
+  if (measured) return `${Math.floor(measured / 60)}:${Math.floor(measured % 60).toString().padStart(2, "0")}`;
+  return item.duration ? `${item.duration}s` : "";
+}
+
 function GenerationCard({
   item,
   expanded,
   onToggle,
   onDelete,
 }: {
-  item: GenerationItem;
+  item: GenerationListItem;
   expanded: boolean;
   onToggle: () => void;
   onDelete: () => void;
 }) {
   const date = new Date(item.created_at).toLocaleString();
 
+  // Lyrics aren't in the list projection — fetch the full record on expand
+  const { data: detail } = useQuery({
+    queryKey: ["generation", item.id],
+    queryFn: () => getGeneration(item.id),
+    enabled: expanded,
+  });
+
   return (
     <div className="glass rounded-2xl overflow-hidden transition-all">
       {/* Card header — always visible */}
@@ -42,7 +62,7 @@ function GenerationCard({
         <div className="flex-1 min-w-0">
           <p className="text-sm font-medium truncate">{item.prompt || "Untitled"}</p>
           <p className="text-xs text-gray-500 mt-0.5">
-            {date} &middot; {item.duration ? `${item.duration}s` : ""} &middot; {item.vocal_language.toUpperCase()}
+            {date} &middot; {formatDuration(item)} &middot; {item.vocal_language.toUpperCase()}
           </p>
         </div>
         <StatusBadge status={item.status} />
@@ -62,15 +82,15 @@ function GenerationCard({
           </div>
 
           {/* Lyrics preview */}
-          {item.lyrics && (
+          {detail?.lyrics && (
             <pre className="text-xs text-gray-500 font-mono whitespace-pre-wrap max-h-32 overflow-y-auto bg-surface-50 rounded-lg p-3">
-              {item.lyrics}
+              {detail.lyrics}
             </pre>
           )}
 
-          {/* Audio player */}
+          {/* Audio player — low-bitrate preview while browsing; Download gets the original */}
           {item.audio_urls.length > 0 && (
-            <AudioPlayer urls={item.audio_urls.map(audioUrl)} />
+            <AudioPlayer urls={item.audio_urls.map(audioUrl)} quality="low" />
           )}
 
           {/* Delete */}
@@ -90,13 +110,21 @@ function GenerationCard({
 
 export default function HistoryPage() {
   const queryClient = useQueryClient();
-  const [page, setPage] = useState(1);
+  // Keyset pagination: cursors[i] fetches page i + 1 (null = newest)
+  const [cursors, setCursors] = useState<(string | null)[]>([null]);
   const [expandedId, setExpandedId] = useState<number | null>(null);
   const pageSize = 15;
+  const page = cursors.length;
+  const cursor = cursors[cursors.length - 1];
 
   const { data, isLoading } = useQuery({
-    queryKey: ["history", page],
-    queryFn: () => getHistory(page, pageSize),
+    queryKey: ["history", cursor],
+    queryFn: () => getHistory(cursor, pageSize),
+  });
+
+  const { data: totalData } = useQuery({
+    queryKey: ["history", "total"],
+    queryFn: () => getHistory(null, 1, true),
   });
 
   const deleteMut = useMutation({
@@ -105,8 +133,8 @@ export default function HistoryPage() {
   });
 
   const items = data?.items ?? [];
-  const total = data?.total ?? 0;
-  const totalPages = Math.ceil(total / pageSize);
+  const total = totalData?.total ?? 0;
+  const nextCursor = data?.next_cursor ?? null;
 
   return (
     <div className="space-y-8">
@@ -149,21 +177,21 @@ export default function HistoryPage() {
       )}
 
       {/* Pagination */}
-      {totalPages > 1 && (
+      {(page > 1 || nextCursor) && (
         <div className="flex items-center justify-center gap-4">
           <button
-            onClick={() => setPage((p) => Math.max(1, p - 1))}
+            onClick={() => setCursors((c) => (c.length > 1 ? c.slice(0, -1) : c))}
             disabled={page === 1}
             className="p-2 rounded-lg bg-surface-200 text-gray-400 hover:text-white disabled:opacity-30 transition"
           >
             <ChevronLeft size={16} />
           </button>
           <span className="text-sm text-gray-500">
-            Page {page} of {totalPages}
+            Page {page}
           </span>
           <button
-            onClick={() => setPage((p) => Math.min(totalPages, p + 1))}
-            disabled={page === totalPages}
+            onClick={() => nextCursor && setCursors((c) => [...c, nextCursor])}
+            disabled={!nextCursor}
             className="p-2 rounded-lg bg-surface-200 text-gray-400 hover:text-white disabled:opacity-30 transition"
           >
             <ChevronRight size={16} />
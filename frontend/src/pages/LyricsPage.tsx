@@ -1,7 +1,7 @@
-import { useState } from "react";
-import { PenLine, Sparkles, Loader2, ArrowRight, Copy, Check } from "lucide-react";
+import { useEffect, useRef, useState } from "react";
+import { PenLine, Sparkles, Loader2, ArrowRight, Copy, Check, Square } from "lucide-react";
 import { cn } from "@/lib/utils";
-import { generateLyrics } from "@/api/client";
+import { streamLyrics, watchReadiness, type LyricsStreamSummary } from "@/api/client";
 import { useNavigate } from "react-router-dom";
 
 const LANG_TABS = [
@@ -27,27 +27,50 @@ export default function LyricsPage() {
   const [theme, setTheme] = useState("");
   const [genre, setGenre] = useState("Pop");
   const [mood, setMood] = useState("Happy");
+  const [fresh, setFresh] = useState(false);
   const [loading, setLoading] = useState(false);
   const [result, setResult] = useState("");
   const [error, setError] = useState("");
   const [copied, setCopied] = useState(false);
+  const [stats, setStats] = useState<LyricsStreamSummary | null>(null);
+  const abortRef = useRef<AbortController | null>(null);
+
+  // null until the backend reports readiness; don't block on unknown
+  const [modelReady, setModelReady] = useState<boolean | null>(null);
+  useEffect(() => watchReadiness((r) => setModelReady(r.lyrics_model)), []);
+
+  // Leaving the page stops generation on the server
+  useEffect(() => () => abortRef.current?.abort(), []);
 
   const handleGenerate = async () => {
     if (!theme.trim()) return;
     setError("");
     setResult("");
+    setStats(null);
     setLoading(true);
 
+    const controller = new AbortController();
+    abortRef.current = controller;
     try {
-      const res = await generateLyrics({ theme, language, genre, mood });
+      const res = await streamLyrics(
+        { theme, language, genre, mood, fresh },
+        (text) => setResult((prev) => prev + text),
+        controller.signal
+      );
       setResult(res.lyrics);
+      setStats(res);
     } catch (e: unknown) {
-      setError(e instanceof Error ? e.message : "Failed to generate lyrics");
+      if (!controller.signal.aborted) {
+        setError(e instanceof Error ? e.message : "Failed to generate lyrics");
+      }
     } finally {
+      abortRef.current = null;
       setLoading(false);
     }
   };
 
+  const handleStop = () => abortRef.current?.abort();
+
   const handleCopy = () => {
     navigator.clipboard.writeText(result);
     setCopied(true);
@@ -152,25 +175,49 @@ export default function LyricsPage() {
             </div>
           </div>
 
-          {/* Generate button */}
+          {/* Cache bypass toggle */}
+          <div className="flex items-center justify-between">
+            <label className="text-xs text-gray-400">Always write new lyrics</label>
+            <button
+              onClick={() => setFresh(!fresh)}
+              className={cn(
+                "w-10 h-5 rounded-full transition-all relative",
+                fresh ? "bg-accent" : "bg-surface-300"
+              )}
+            >
+              <div
+                className="w-4 h-4 bg-white rounded-full absolute top-0.5 transition-all"
+                style={{ left: fresh ? "22px" : "2px" }}
+              />
+            </button>
+          </div>
+
+          {/* Generate / stop button */}
           <button
-            onClick={handleGenerate}
-            disabled={loading || !theme.trim()}
+            onClick={loading ? handleStop : handleGenerate}
+            disabled={!loading && (!theme.trim() || modelReady === false)}
             className={cn(
               "w-full py-3.5 rounded-xl font-semibold text-sm transition-all flex items-center justify-center gap-2",
               loading
-                ? "bg-surface-200 text-gray-500 cursor-wait"
+                ? "bg-surface-200 text-gray-400 hover:text-white"
                 : "bg-gradient-to-r from-neon-pink to-accent text-white shadow-[0_0_20px_rgba(236,72,153,0.25)] hover:shadow-[0_0_30px_rgba(236,72,153,0.4)]",
-              !theme.trim() && "opacity-50 cursor-not-allowed"
+              !loading && (!theme.trim() || modelReady === false) && "opacity-50 cursor-not-allowed"
             )}
           >
             {loading ? (
-              <><Loader2 size={16} className="animate-spin" /> Generating...</>
+              <>
+                <Loader2 size={16} className="animate-spin" /> Writing...
+                <Square size={12} className="ml-2" /> Stop
+              </>
             ) : (
               <><Sparkles size={16} /> Generate Lyrics</>
             )}
           </button>
 
+          {modelReady === false && !loading && (
+            <p className="text-xs text-gray-500">Lyrics model is still loading...</p>
+          )}
+
           {error && (
             <div className="rounded-xl bg-red-500/10 border border-red-500/30 px-4 py-3 text-sm text-red-400">
               {error}
@@ -180,11 +227,11 @@ export default function LyricsPage() {
 
         {/* Right: result */}
         <div>
-          {result ? (
+          {result || loading ? (
             <div className="glass rounded-2xl p-6 relative">
               <div className="flex items-center justify-between mb-4">
                 <h3 className="text-sm font-semibold text-gray-300">Generated Lyrics</h3>
-                <div className="flex gap-2">
+                <div className={cn("flex gap-2", loading && "invisible")}>
                   <button
                     onClick={handleCopy}
                     className="flex items-center gap-1.5 px-3 py-1.5 rounded-lg bg-surface-200 text-xs text-gray-400 hover:text-white transition"
@@ -202,7 +249,16 @@ export default function LyricsPage() {
               </div>
               <pre className="whitespace-pre-wrap text-sm text-gray-200 font-mono leading-relaxed max-h-[500px] overflow-y-auto">
                 {result}
+                {loading && <span className="inline-block w-2 h-4 bg-accent/70 animate-pulse align-middle" />}
               </pre>
+              {stats && (
+                <p className="mt-3 text-[10px] text-gray-600">
+                  {stats.cached && "from cache · "}
+                  {stats.ttft_ms != null && `first token ${(stats.ttft_ms / 1000).toFixed(1)}s · `}
+                  {stats.tokens} tokens
+                  {stats.tokens_per_s != null && ` · ${stats.tokens_per_s.toFixed(1)} tok/s`}
+                </p>
+              )}
             </div>
           ) : (
             <div className="glass rounded-2xl p-12 flex flex-col items-center justify-center text-center min-h-[400px]">